@@ -0,0 +1,122 @@
+"""Admission control for prediction requests: upload limits and a cap on concurrent inferences"""
+import base64
+import binascii
+import io
+import threading
+import warnings
+
+from PIL import Image
+
+QUEUE_FULL = 'queue_full'
+TIMEOUT = 'timeout'
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload exceeds the byte or pixel limit; `reason` is 'bytes' or 'pixels'"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class InvalidUpload(ValueError):
+    """Raised when an upload is not in a form we accept (e.g. a malformed camera data URL)"""
+
+
+class Overloaded(Exception):
+    """Raised when no inference slot is free; `reason` is QUEUE_FULL (turned away) or TIMEOUT (shed)"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def check_upload_size(size, max_bytes):
+    """Raise ImageTooLarge if an upload of `size` bytes (None if unknown) is over the limit"""
+    if max_bytes and size is not None and size > max_bytes:
+        raise ImageTooLarge(f"Upload is {size} bytes, the limit is {max_bytes}", 'bytes')
+
+
+def check_data_url(data_url):
+    """Raise InvalidUpload unless `data_url` looks like a base64 'data:image/...;base64,' capture (header only)"""
+    header, separator, _ = data_url[:256].partition(',')
+    if not separator or not header.startswith('data:image/') or not header.endswith(';base64'):
+        raise InvalidUpload('image_data must be a base64 image data URL (data:image/...;base64,...)')
+
+
+def decode_data_url(data_url):
+    """Photo bytes of a base64 image data URL; raises InvalidUpload if it is malformed"""
+    check_data_url(data_url)
+    try:
+        return base64.b64decode(data_url.partition(',')[2], validate=True)
+    except binascii.Error as e:
+        raise InvalidUpload(f"image_data is not valid base64: {e}") from e
+
+
+def open_image(image_bytes, max_pixels):
+    """Open an upload with PIL and check its pixel count from the header, before anything is decoded"""
+    with warnings.catch_warnings():
+        if max_pixels:
+            # Our own limit replaces PIL's warning; its hard DecompressionBombError still applies
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        image = Image.open(io.BytesIO(image_bytes))
+    if max_pixels and image.width * image.height > max_pixels:
+        image.close()
+        raise ImageTooLarge(f"Image is {image.width}x{image.height} pixels, the limit is {max_pixels}", 'pixels')
+    return image
+
+
+class AdmissionGate:
+    """At most `max_concurrent` callers inside at once; up to `max_waiting` more may wait `max_wait` seconds.
+
+    A caller that finds the wait queue full is turned away immediately (QUEUE_FULL);
+    one that waits without getting a slot is shed (TIMEOUT). Either way it costs the
+    server almost nothing, instead of piling up decoded images in memory.
+    """
+
+    def __init__(self, max_concurrent=16, max_waiting=8, max_wait=0.25):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_waiting = max(0, int(max_waiting))
+        self.max_wait = max(0.0, float(max_wait))
+        self._changed = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._shed = 0
+
+    def acquire(self):
+        """Take a slot or raise Overloaded"""
+        with self._changed:
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_waiting:
+                    self._rejected += 1
+                    raise Overloaded(QUEUE_FULL)
+                self._waiting += 1
+                try:
+                    admitted = self._changed.wait_for(lambda: self._active < self.max_concurrent, self.max_wait)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self._shed += 1
+                    raise Overloaded(TIMEOUT)
+            self._active += 1
+            self._admitted += 1
+
+    def release(self):
+        with self._changed:
+            self._active -= 1
+            self._changed.notify()
+
+    def stats(self):
+        with self._changed:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_waiting': self.max_waiting,
+                'max_wait_ms': round(self.max_wait * 1000.0),
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'shed': self._shed,
+            }
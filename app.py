@@ -1,13 +1,38 @@
-from flask import Flask, request, render_template, jsonify, redirect, url_for, session
-import tensorflow as tf
+from flask import (Flask, request, render_template, jsonify, redirect, url_for, session, Response,
+                   stream_with_context, make_response, g, send_from_directory)
+from markupsafe import Markup, escape
 import numpy as np
-from PIL import Image
 import io
-import base64
-from datetime import datetime
+from datetime import datetime, timezone
+from types import MappingProxyType
 import os
-from tensorflow.keras.utils import register_keras_serializable
+import json
+import csv
+import re
+import mimetypes
+import zlib
+import hashlib
+from collections import OrderedDict
+import time
+import uuid
+import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
+from inference import (CLASS_NAMES, MODEL_INPUT_SHAPE, PredictionCache, aggregate_tile_scores, calibrate_scores,
+                       load_inference_fn, load_temperature, preprocess_image, split_embedding, tile_image,
+                       top_k_predictions, warm_up)
+from embedding_store import EmbeddingStore
+from explain import GradCamExplainer, render_overlay
+from admission import (QUEUE_FULL, AdmissionGate, ImageTooLarge, InvalidUpload, Overloaded, check_data_url,
+                       check_upload_size, decode_data_url, open_image)
+from model_registry import ROUTING_MODES, ModelRegistry, load_registry_file, make_load_fn
+from model_server import ModelServerClient
+from history_store import HistoryStore
+from job_store import FINISHED_STATES, JobStore, JobStoreFull
+from live_scan import LiveScanStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, Histogram, Registry
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -16,30 +41,351 @@ app.secret_key = 'your-secret-key-change-this'  # Change this in production
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600 
 
-# Define your custom focal loss function
-@register_keras_serializable()
-def focal_loss_fn(y_true, y_pred, gamma=2.0, alpha=0.25):
-    epsilon = tf.keras.backend.epsilon()
-    y_pred = tf.clip_by_value(y_pred, epsilon, 1.0 - epsilon)
-    cross_entropy = -y_true * tf.math.log(y_pred)
-    weight = alpha * y_true * tf.math.pow(1 - y_pred, gamma)
-    loss = weight * cross_entropy
-    loss = tf.reduce_sum(loss, axis=-1)
-    return tf.reduce_mean(loss)
-
-# Load your model
-model = tf.keras.models.load_model('model.keras', compile=False)
-
-# Define your class names (matching your cottage inspection theme)
-CLASS_NAMES = ["Algae", "Major Crack", "Minor Crack", "Normal", "Peeling", "Spalling", "Stain"]
-
-def preprocess_image(image):
-    """Adjust this function based on your model's input requirements"""
-    image = image.resize((224, 224))  # Adjust size to match your model
-    image = np.array(image)
-    image = image / 255.0  # Normalize if needed
-    image = np.expand_dims(image, axis=0)  # Add batch dimension
-    return image
+# Log level for the 'homecheck' logger; per-request detail is logged at DEBUG
+app.config['LOG_LEVEL'] = os.environ.get('HOMECHECK_LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger('homecheck')
+logger.setLevel(app.config['LOG_LEVEL'])
+
+# Micro-batching: concurrent /predict calls are grouped into one model call
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('HOMECHECK_BATCH_MAX_SIZE', 8))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('HOMECHECK_BATCH_MAX_WAIT_MS', 5))
+
+# Inference backend: 'keras' (model.keras) or 'tflite' (see convert_tflite.py)
+app.config['INFERENCE_BACKEND'] = os.environ.get('HOMECHECK_BACKEND', 'keras').lower()
+app.config['MODEL_PATH'] = os.environ.get('HOMECHECK_MODEL', 'model.keras')
+app.config['TFLITE_MODEL_PATH'] = os.environ.get('HOMECHECK_TFLITE_MODEL', 'model_fp16.tflite')
+app.config['TFLITE_THREADS'] = int(os.environ.get('HOMECHECK_TFLITE_THREADS', os.cpu_count() or 1))
+
+# Optional shared model server (see model_server.py); empty means load the model in this process
+app.config['MODEL_SERVER_ADDRESS'] = os.environ.get('HOMECHECK_MODEL_SERVER', '')
+app.config['MODEL_SERVER_AUTHKEY'] = os.environ.get('HOMECHECK_MODEL_SERVER_AUTHKEY', 'homecheck')
+
+# Prediction cache keyed by a hash of the uploaded image bytes
+app.config['PREDICTION_CACHE_MAX_ENTRIES'] = int(os.environ.get('HOMECHECK_CACHE_MAX_ENTRIES', 1024))
+app.config['PREDICTION_CACHE_MAX_BYTES'] = int(os.environ.get('HOMECHECK_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+app.config['PREDICTION_CACHE_TTL'] = float(os.environ.get('HOMECHECK_CACHE_TTL', 3600))
+
+# Multi-photo uploads to /predict/batch
+app.config['BATCH_UPLOAD_MAX_IMAGES'] = int(os.environ.get('HOMECHECK_BATCH_UPLOAD_MAX_IMAGES', 100))
+app.config['DECODE_WORKERS'] = int(os.environ.get('HOMECHECK_DECODE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Probability calibration (see calibrate_temperature.py) and the top-2 margin below which a result is 'uncertain'
+app.config['CALIBRATION_FILE'] = os.environ.get('HOMECHECK_CALIBRATION_FILE', 'calibration.json')
+app.config['UNCERTAIN_MARGIN'] = float(os.environ.get('HOMECHECK_UNCERTAIN_MARGIN', 0.15))
+
+# Admission control: photos over MAX_UPLOAD_BYTES or MAX_IMAGE_PIXELS are refused before decoding (413), Flask
+# refuses any request body over MAX_CONTENT_LENGTH, a batch may expand to at most BATCH_UPLOAD_MAX_BYTES, and at most MAX_CONCURRENT_PREDICTIONS predictions
+# run at once with up to ADMISSION_QUEUE more waiting ADMISSION_WAIT_MS for a slot (then 429/503 with Retry-After)
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('HOMECHECK_MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('HOMECHECK_MAX_IMAGE_PIXELS', 64_000_000))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('HOMECHECK_MAX_REQUEST_BYTES', 256 * 1024 * 1024))
+app.config['BATCH_UPLOAD_MAX_BYTES'] = int(os.environ.get('HOMECHECK_BATCH_UPLOAD_MAX_BYTES',
+                                                          app.config['MAX_CONTENT_LENGTH']))
+app.config['MAX_CONCURRENT_PREDICTIONS'] = int(os.environ.get('HOMECHECK_MAX_CONCURRENT_PREDICTIONS',
+                                                              2 * app.config['BATCH_MAX_SIZE']))
+app.config['ADMISSION_QUEUE'] = int(os.environ.get('HOMECHECK_ADMISSION_QUEUE', app.config['BATCH_MAX_SIZE']))
+app.config['ADMISSION_WAIT_MS'] = float(os.environ.get('HOMECHECK_ADMISSION_WAIT_MS', 250))
+
+# Tiled inference (tiles=1): tile size and stride in photo pixels, and a cap on tiles per photo
+app.config['TILE_SIZE'] = int(os.environ.get('HOMECHECK_TILE_SIZE', 224))
+app.config['TILE_STRIDE'] = int(os.environ.get('HOMECHECK_TILE_STRIDE', 168))
+app.config['TILE_MAX_TILES'] = int(os.environ.get('HOMECHECK_TILE_MAX_TILES', 16))
+
+# Asynchronous prediction jobs (POST /jobs): bounded store, finished jobs expire after JOB_TTL seconds
+app.config['JOB_MAX_JOBS'] = int(os.environ.get('HOMECHECK_JOB_MAX_JOBS', 256))
+app.config['JOB_TTL'] = float(os.environ.get('HOMECHECK_JOB_TTL', 300))
+app.config['JOB_WORKERS'] = int(os.environ.get('HOMECHECK_JOB_WORKERS', 4))
+
+# Live video scanning: frames kept per second per stream, moving-average weight, model queue limit
+app.config['LIVE_SAMPLE_FPS'] = float(os.environ.get('HOMECHECK_LIVE_SAMPLE_FPS', 4))
+app.config['LIVE_SMOOTHING'] = float(os.environ.get('HOMECHECK_LIVE_SMOOTHING', 0.6))
+app.config['LIVE_MAX_STREAMS'] = int(os.environ.get('HOMECHECK_LIVE_MAX_STREAMS', 64))
+app.config['LIVE_MAX_QUEUE'] = int(os.environ.get('HOMECHECK_LIVE_MAX_QUEUE', 2 * app.config['BATCH_MAX_SIZE']))
+
+# Inspection history lives server-side; the session cookie only carries a history id
+app.config['HISTORY_DB_PATH'] = os.environ.get('HOMECHECK_HISTORY_DB', 'history.db')
+app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('HOMECHECK_HISTORY_PAGE_SIZE', 20))
+
+# Recommendation catalog (optional JSON override) and rendered report/email caching
+app.config['RECOMMENDATIONS_FILE'] = os.environ.get('HOMECHECK_RECOMMENDATIONS_FILE', '')
+app.config['RENDER_CACHE_SIZE'] = int(os.environ.get('HOMECHECK_RENDER_CACHE_SIZE', 256))
+app.config['SUPPORTED_LOCALES'] = ['en']
+
+# Fingerprinted, compressed assets written by build_assets.py; without it pages use the plain /static/ files
+app.config['ASSET_MANIFEST'] = os.environ.get('HOMECHECK_ASSET_MANIFEST', os.path.join('static', 'dist', 'manifest.json'))
+
+# Model loading: 'background' starts loading at import, 'lazy' on the first prediction
+app.config['MODEL_LOADING'] = os.environ.get('HOMECHECK_MODEL_LOADING', 'background').lower()
+app.config['MODEL_WAIT_SECONDS'] = float(os.environ.get('HOMECHECK_MODEL_WAIT_SECONDS', 30))
+
+# Embeddings for /api/similar: penultimate-layer features of each inspection (Keras backend only), stored as
+# float16 memory-mapped files per model version; above SIMILAR_EXACT_MAX candidate rows search goes approximate
+app.config['EMBEDDINGS_ENABLED'] = os.environ.get('HOMECHECK_EMBEDDINGS', '1') == '1'
+app.config['EMBEDDING_LAYER'] = os.environ.get('HOMECHECK_EMBEDDING_LAYER', '')
+app.config['EMBEDDINGS_DIR'] = os.environ.get('HOMECHECK_EMBEDDINGS_DIR', 'embeddings')
+app.config['SIMILAR_EXACT_MAX'] = int(os.environ.get('HOMECHECK_SIMILAR_EXACT_MAX', 10000))
+app.config['SIMILAR_NPROBE'] = int(os.environ.get('HOMECHECK_SIMILAR_NPROBE', 8))
+
+# Grad-CAM explanations (/api/explain/<id>): the preprocessed photos of the last EXPLAIN_MAX_INPUTS inspections are
+# kept in memory, and rendered overlays are cached per (photo, model version) for EXPLAIN_TTL seconds
+app.config['EXPLAIN_MAX_INPUTS'] = int(os.environ.get('HOMECHECK_EXPLAIN_MAX_INPUTS', 256))
+app.config['EXPLAIN_CACHE_MAX_BYTES'] = int(os.environ.get('HOMECHECK_EXPLAIN_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+app.config['EXPLAIN_TTL'] = float(os.environ.get('HOMECHECK_EXPLAIN_TTL', 24 * 3600))
+app.config['EXPLAIN_BATCH_MAX_SIZE'] = int(os.environ.get('HOMECHECK_EXPLAIN_BATCH_MAX_SIZE', 4))
+app.config['EXPLAIN_LAYER'] = os.environ.get('HOMECHECK_EXPLAIN_LAYER', '')
+
+# Model registry: optional JSON file of model versions plus A/B or shadow routing (see model_registry.py)
+app.config['MODEL_REGISTRY_FILE'] = os.environ.get('HOMECHECK_MODEL_REGISTRY', '')
+# Bearer token for the model management endpoints (POST/DELETE /api/models...); empty disables them
+app.config['ADMIN_TOKEN'] = os.environ.get('HOMECHECK_ADMIN_TOKEN', '')
+
+if app.config['INFERENCE_BACKEND'] == 'tflite':
+    model_path = app.config['TFLITE_MODEL_PATH']
+else:
+    model_path = app.config['MODEL_PATH']
+
+model_server = None
+temperature = load_temperature(app.config['CALIBRATION_FILE'])
+
+def load_model():
+    """Load your model (or connect to the model server) and warm it up; runs off the request path"""
+    global model_server
+    if app.config['MODEL_SERVER_ADDRESS']:
+        # Inference runs in the model server's worker processes; this process stays light
+        model_server = ModelServerClient(app.config['MODEL_SERVER_ADDRESS'], app.config['MODEL_SERVER_AUTHKEY'])
+        return None, model_server.infer
+    
+    model, infer = load_inference_fn(app.config['INFERENCE_BACKEND'], model_path,
+                                     tflite_threads=app.config['TFLITE_THREADS'],
+                                     with_embedding=app.config['EMBEDDINGS_ENABLED'],
+                                     embedding_layer=app.config['EMBEDDING_LAYER'] or None)
+    # Warm up before serving requests
+    warm_up(infer, batch_sizes=(1, app.config['BATCH_MAX_SIZE']))
+    return model, infer
+
+def observe_model_batch(name, batch_size, seconds):
+    """Called by the registry after every model call"""
+    model_inference_seconds.labels(name).observe(seconds)
+    model_images_total.labels(name).inc(batch_size)
+
+def forget_model_version(version):
+    """Called by the registry when a version is removed: its Grad-CAM batcher is dropped with it"""
+    if version.loader.model is not None:
+        explainer.forget(version.loader.model)
+
+model_registry = ModelRegistry(max_batch_size=app.config['BATCH_MAX_SIZE'],
+                               max_wait_ms=app.config['BATCH_MAX_WAIT_MS'],
+                               on_batch=observe_model_batch, on_remove=forget_model_version)
+
+def setup_model_registry():
+    """Register the model versions; without a registry file that is just the configured model as 'default'"""
+    if not app.config['MODEL_REGISTRY_FILE']:
+        model_registry.register('default', load_model, path=model_path,
+                                backend=app.config['INFERENCE_BACKEND'], start=False)
+        return
+    
+    config = load_registry_file(app.config['MODEL_REGISTRY_FILE'])
+    versions = config['versions']
+    active = config.get('active') or next(iter(versions))
+    # The first version registered becomes the active one
+    for name in [active] + [name for name in versions if name != active]:
+        backend = versions[name].get('backend', 'keras')
+        model_registry.register(name,
+                                make_load_fn(backend, versions[name]['path'],
+                                             tflite_threads=app.config['TFLITE_THREADS'],
+                                             warm_up_sizes=(1, app.config['BATCH_MAX_SIZE']),
+                                             with_embedding=app.config['EMBEDDINGS_ENABLED'],
+                                             embedding_layer=app.config['EMBEDDING_LAYER'] or None),
+                                path=versions[name]['path'], backend=backend, start=False)
+    candidate = config.get('candidate')
+    if candidate:
+        model_registry.set_candidate(candidate['name'], candidate.get('percent', 0), candidate.get('mode', 'ab'))
+
+setup_model_registry()
+if app.config['MODEL_LOADING'] == 'background':
+    model_registry.active().loader.start()
+
+def model_unavailable():
+    """503 response for prediction requests that arrive before the model is usable"""
+    prediction_errors_total.labels(request.endpoint, 'ModelUnavailable').inc()
+    status = model_registry.active().loader.status()
+    message = 'Model failed to load' if status['state'] == 'failed' else 'Model is still loading, please retry shortly'
+    response = jsonify({'error': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+prediction_cache = PredictionCache(max_entries=app.config['PREDICTION_CACHE_MAX_ENTRIES'],
+                                   max_bytes=app.config['PREDICTION_CACHE_MAX_BYTES'],
+                                   ttl_seconds=app.config['PREDICTION_CACHE_TTL'])
+prediction_cache.set_model_version(model_registry.fingerprint())
+
+# Preprocessed photos (uint8, keyed by content hash) reused by Grad-CAM, and the overlay PNGs it rendered
+explain_inputs = PredictionCache(max_entries=app.config['EXPLAIN_MAX_INPUTS'],
+                                 max_bytes=app.config['EXPLAIN_MAX_INPUTS'] * (int(np.prod(MODEL_INPUT_SHAPE)) + 64),
+                                 ttl_seconds=app.config['EXPLAIN_TTL'])
+explanation_cache = PredictionCache(max_entries=4 * app.config['EXPLAIN_MAX_INPUTS'],
+                                    max_bytes=app.config['EXPLAIN_CACHE_MAX_BYTES'],
+                                    ttl_seconds=app.config['EXPLAIN_TTL'])
+explainer = GradCamExplainer(max_batch_size=app.config['EXPLAIN_BATCH_MAX_SIZE'],
+                             max_wait_ms=2 * app.config['BATCH_MAX_WAIT_MS'],
+                             layer_name=app.config['EXPLAIN_LAYER'] or None)
+
+# Caps concurrent predictions so a burst is turned away quickly instead of piling decoded photos up in memory
+admission_gate = AdmissionGate(max_concurrent=app.config['MAX_CONCURRENT_PREDICTIONS'],
+                               max_waiting=app.config['ADMISSION_QUEUE'],
+                               max_wait=app.config['ADMISSION_WAIT_MS'] / 1000.0)
+
+# Decodes the photos of a batch upload in parallel (PIL releases the GIL while decoding)
+decode_executor = ThreadPoolExecutor(max_workers=app.config['DECODE_WORKERS'], thread_name_prefix='homecheck-decode')
+
+job_store = JobStore(max_jobs=app.config['JOB_MAX_JOBS'], ttl=app.config['JOB_TTL'])
+job_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='homecheck-job')
+
+live_scans = LiveScanStore(sample_fps=app.config['LIVE_SAMPLE_FPS'],
+                           smoothing=app.config['LIVE_SMOOTHING'],
+                           max_streams=app.config['LIVE_MAX_STREAMS'])
+
+# ===== METRICS =====
+
+metrics_registry = Registry()
+request_seconds = Histogram('homecheck_http_request_seconds', 'Time to produce a response (headers), by endpoint',
+                            ['endpoint'], registry=metrics_registry)
+requests_total = Counter('homecheck_http_requests_total', 'Responses by endpoint and status code',
+                         ['endpoint', 'status'], registry=metrics_registry)
+requests_in_flight = Gauge('homecheck_http_requests_in_flight', 'Requests currently being handled',
+                           registry=metrics_registry)
+predict_stage_seconds = Histogram('homecheck_predict_stage_seconds',
+                                  'Time spent in each stage of a prediction (read, decode, preprocess, inference, history, session)',
+                                  ['stage'], registry=metrics_registry)
+predictions_total = Counter('homecheck_predictions_total', 'Predictions by predicted class',
+                            ['predicted_class'], registry=metrics_registry)
+prediction_errors_total = Counter('homecheck_prediction_errors_total', 'Failed predictions by endpoint and error type',
+                                  ['endpoint', 'error'], registry=metrics_registry)
+model_inference_seconds = Histogram('homecheck_model_inference_seconds', 'Time of one model call, by model version',
+                                    ['model'], registry=metrics_registry)
+model_images_total = Counter('homecheck_model_images_total', 'Images run through the model, by model version',
+                             ['model'], registry=metrics_registry)
+model_predictions_total = Counter('homecheck_model_predictions_total',
+                                  'Predictions by model version, role (serve or shadow) and predicted class',
+                                  ['model', 'role', 'predicted_class'], registry=metrics_registry)
+shadow_agreement_total = Counter('homecheck_shadow_agreement_total',
+                                 'Shadow predictions by whether they matched the served class',
+                                 ['model', 'agree'], registry=metrics_registry)
+explain_seconds = Histogram('homecheck_explain_seconds', 'Time to compute and render one Grad-CAM overlay',
+                            registry=metrics_registry)
+explanations_total = Counter('homecheck_explanations_total', 'Explanation requests by outcome (cached, computed)',
+                             ['outcome'], registry=metrics_registry)
+admission_rejected_total = Counter('homecheck_admission_rejected_total',
+                                   'Prediction requests turned away on arrival, by endpoint and reason (bytes, pixels, queue_full)',
+                                   ['endpoint', 'reason'], registry=metrics_registry)
+admission_shed_total = Counter('homecheck_admission_shed_total',
+                               'Prediction requests shed after waiting too long for an inference slot, by endpoint',
+                               ['endpoint'], registry=metrics_registry)
+
+def collect_runtime_metrics():
+    """Values read from the model loader, batcher, caches and stores at scrape time"""
+    active = model_registry.active()
+    model_status = active.loader.status()
+    registry = model_registry.status()
+    cache = prediction_cache.stats()
+    jobs = job_store.stats()
+    yield ('homecheck_model_ready', 'gauge', '1 once the model is loaded and warmed up',
+           [({}, int(model_status['state'] == 'ready'))])
+    if model_status['load_seconds'] is not None:
+        yield ('homecheck_model_load_seconds', 'gauge', 'Time taken to load and warm up the model',
+               [({}, model_status['load_seconds'])])
+    yield ('homecheck_batcher_queue_depth', 'gauge', 'Images waiting for the micro-batcher',
+           [({}, active.batcher.pending())])
+    admission = admission_gate.stats()
+    yield ('homecheck_admission_active', 'gauge', 'Predictions holding an inference slot',
+           [({}, admission['active'])])
+    yield ('homecheck_admission_waiting', 'gauge', 'Predictions waiting for an inference slot',
+           [({}, admission['waiting'])])
+    yield ('homecheck_model_version_ready', 'gauge', '1 for each registered model version that is loaded',
+           [({'model': version['name']}, int(version['state'] == 'ready')) for version in registry['versions']])
+    yield ('homecheck_model_version_active', 'gauge', '1 for the model version serving traffic',
+           [({'model': version['name']}, int(version['name'] == registry['active'])) for version in registry['versions']])
+    yield ('homecheck_prediction_cache_requests_total', 'counter', 'Prediction cache lookups by outcome',
+           [({'outcome': 'hit'}, cache['hits']), ({'outcome': 'miss'}, cache['misses'])])
+    yield ('homecheck_jobs_in_flight', 'gauge', 'Async jobs pending or running',
+           [({}, jobs['pending'] + jobs['running'])])
+    yield ('homecheck_live_streams', 'gauge', 'Open live scanning streams',
+           [({}, live_scans.stats()['streams'])])
+
+metrics_registry.add_collector(collect_runtime_metrics)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    requests_in_flight.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    request_seconds.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    requests_total.labels(endpoint, response.status_code).inc()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'request_started' in g:
+        requests_in_flight.dec()
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+# Request bodies that are the photo itself (camera captures posted as a Blob)
+RAW_IMAGE_MIMETYPES = ('application/octet-stream', 'image/jpeg', 'image/webp', 'image/png')
+
+history_store = HistoryStore(app.config['HISTORY_DB_PATH'])
+
+def get_history_id():
+    """History id of the current browser, created on first use"""
+    if 'history_id' not in session:
+        session['history_id'] = uuid.uuid4().hex
+        session.permanent = True
+    return session['history_id']
+
+embedding_stores = {}
+embedding_stores_lock = threading.Lock()
+
+def get_embedding_store(version_name):
+    """Embedding store of one model version (embeddings of different models are not comparable)"""
+    with embedding_stores_lock:
+        store = embedding_stores.get(version_name)
+        if store is None:
+            filename = re.sub(r'[^A-Za-z0-9_.-]+', '-', version_name)
+            store = EmbeddingStore(os.path.join(app.config['EMBEDDINGS_DIR'], filename),
+                                   exact_max=app.config['SIMILAR_EXACT_MAX'],
+                                   nprobe=app.config['SIMILAR_NPROBE'])
+            embedding_stores[version_name] = store
+        return store
+
+def all_embedding_stores():
+    """Stores of every model version that has written embeddings, including ones from earlier runs"""
+    if os.path.isdir(app.config['EMBEDDINGS_DIR']):
+        for name in sorted(os.listdir(app.config['EMBEDDINGS_DIR'])):
+            if name.endswith('.json'):
+                get_embedding_store(name[:-len('.json')])
+    with embedding_stores_lock:
+        return list(embedding_stores.values())
+
+def explanation_input(processed_image):
+    """A preprocessed photo (H x W x 3 in [0, 1]) as the uint8 array kept for /api/explain"""
+    return np.rint(processed_image * 255.0).astype(np.uint8)
+
+def keep_for_explanation(image_hash, processed_image):
+    """Keep one preprocessed photo so /api/explain can reuse it without decoding"""
+    explain_inputs.put(image_hash, explanation_input(processed_image))
+
+def store_embeddings(version, history_id, inspection_ids, embeddings):
+    """Keep the embeddings of freshly stored inspections for /api/similar; models without embeddings are skipped"""
+    if not inspection_ids or embeddings is None or np.size(embeddings) == 0:
+        return
+    try:
+        get_embedding_store(version.name).append(inspection_ids, history_id, embeddings)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not store embeddings for model %s: %s", version.name, e)
 
 # ===== HELPER FUNCTIONS =====
 
@@ -67,281 +413,408 @@ def get_issue_emoji(class_name):
     }
     return emojis.get(class_name, '🔵')
 
+# One-line recommendation returned with each prediction. HOMECHECK_RECOMMENDATIONS_FILE does not
+# change these; it only overrides entries of the detailed catalog below
+BASIC_RECOMMENDATIONS = {
+    'Normal': 'Your cottage structure appears to be in good condition. Continue regular maintenance.',
+    'Major Crack': 'Immediate attention required! Consult a structural engineer for major crack repair.',
+    'Minor Crack': 'Monitor and seal minor cracks to prevent water damage and further deterioration.',
+    'Peeling': 'Schedule repainting and surface preparation to protect your cottage exterior.',
+    'Algae': 'Clean affected areas and improve drainage to prevent moisture buildup.',
+    'Spalling': 'Repair concrete/masonry spalling to prevent further structural damage.',
+    'Stain': 'Investigate stain source and clean to maintain cottage appearance and prevent damage.'
+}
+
+DEFAULT_DETAILED_RECOMMENDATIONS = {
+    'Normal': {
+        'status': 'good',
+        'urgency': 'low',
+        'summary': 'Your cottage appears to be in excellent condition with no structural issues detected.',
+        'action': 'Continue regular maintenance and seasonal inspections to preserve your cottage\'s condition.',
+        'estimated_cost': 'RM 0 - RM 300 (routine maintenance)',
+        'timeframe': 'Ongoing maintenance',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': None,
+        'materials': [
+            'Nippon Paint Weatherbond (5L) - RM 85',
+            'Dulux Ambience Wood Stain (1L) - RM 45', 
+            'Ronseal Thompson\'s WaterSeal (1L) - RM 35',
+            'General cleaning supplies - RM 20'
+        ],
+        'tools': [
+            'Cleaning cloths and brushes',
+            'Garden hose',
+            'Basic hand tools (screwdriver, hammer)',
+            'Extension ladder (if needed)'
+        ],
+        'steps': [
+            'Perform visual inspection quarterly for any new issues',
+            'Clean exterior surfaces annually with mild detergent',
+            'Check for new issues after heavy rain or storms',
+            'Maintain proper drainage around cottage foundation',
+            'Apply protective treatments (paint/stain) every 2-3 years as needed'
+        ]
+    },
+    'Major Crack': {
+        'status': 'critical',
+        'urgency': 'high',
+        'summary': 'Significant structural damage detected that poses potential safety risks and requires immediate professional assessment.',
+        'action': 'Contact a structural engineer immediately for professional evaluation. Do not attempt DIY repairs on major cracks.',
+        'estimated_cost': 'RM 1,500 - RM 15,000+ (professional assessment and repair)',
+        'timeframe': 'Immediate action required (within 1-2 days)',
+        'diy_possible': False,
+        'referral_needed': True,
+        'referral_type': 'Structural Engineer',
+        'materials': [
+            'Professional assessment required',
+            'Structural repair materials (determined by engineer)',
+            'Potential foundation work materials',
+            'Waterproofing systems if needed'
+        ],
+        'tools': [
+            'Professional equipment only',
+            'Structural assessment tools',
+            'Specialized repair equipment',
+            'Safety equipment for workers'
+        ],
+        'steps': [
+            'DO NOT attempt DIY repair - contact professional immediately',
+            'Document the crack with photos and measurements',
+            'Restrict access to affected area if safety concern',
+            'Get quotes from certified structural engineers',
+            'Obtain necessary permits for structural work',
+            'Schedule professional repair work',
+            'Arrange for post-repair inspection and certification'
+        ]
+    },
+    'Minor Crack': {
+        'status': 'attention_needed',
+        'urgency': 'medium',
+        'summary': 'Small cracks detected that should be monitored and sealed to prevent water infiltration and expansion.',
+        'action': 'Clean and seal cracks with appropriate filler, then monitor for growth over time.',
+        'estimated_cost': 'RM 150 - RM 600 (DIY) or RM 600 - RM 1,500 (professional)',
+        'timeframe': '1-2 weeks (monitor ongoing)',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': None,
+        'materials': [
+            'Sika Crack Repair Kit (500ml) - RM 45',
+            'Dulux 1Step Primer (1L) - RM 35',
+            'Nippon Paint Weatherbond (1L) - RM 25',
+            'Sandpaper (120 & 220 grit) - RM 15',
+            'Masking tape - RM 8',
+            'Cleaning supplies - RM 20'
+        ],
+        'tools': [
+            'Caulk gun (RM 15)',
+            'Putty knife (RM 12)',
+            'Wire brush (RM 8)',
+            'Paintbrush 2-inch (RM 15)',
+            'Measuring tape (RM 20)',
+            'Safety glasses and gloves (RM 25)'
+        ],
+        'steps': [
+            'Clean crack thoroughly using wire brush to remove all loose debris and old filler',
+            'Use vacuum or compressed air to remove dust from crack interior',
+            'Apply Sika Crack Repair filler using caulk gun, filling crack completely',
+            'Smooth surface with putty knife, removing excess material',
+            'Allow to cure for 24-48 hours as per manufacturer instructions',
+            'Sand smooth with 120 grit sandpaper, then 220 grit for finishing',
+            'Apply Dulux 1Step Primer to prepared surface and let dry',
+            'Paint with Nippon Weatherbond using 2 coats for best protection',
+            'Monitor crack monthly for 6 months for any signs of expansion'
+        ]
+    },
+    'Peeling': {
+        'status': 'maintenance_required',
+        'urgency': 'medium',
+        'summary': 'Paint deterioration detected that affects both protection and aesthetics. Surface preparation and repainting needed.',
+        'action': 'Remove loose paint, prepare surface properly, and repaint affected areas with high-quality exterior paint.',
+        'estimated_cost': 'RM 300 - RM 2,400 (depending on area size and paint quality)',
+        'timeframe': '2-4 days (weather dependent)',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': None,
+        'materials': [
+            'Paint scraper (RM 25)',
+            'Sandpaper variety pack (RM 35)',
+            'Dulux 1Step Primer (5L) - RM 120',
+            'Nippon Paint Weatherbond (5L) - RM 85',
+            'Drop cloths (RM 30)',
+            'Masking tape (RM 15)',
+            'Cleaning supplies (RM 25)'
+        ],
+        'tools': [
+            'Paint scraper (RM 25)',
+            'Electric sander (RM 150) or sanding blocks (RM 20)',
+            'Paintbrush set (RM 45)',
+            'Paint roller with tray (RM 35)',
+            'Extension ladder (RM 200 rental/day)',
+            'Safety equipment (mask, goggles) - RM 40'
+        ],
+        'steps': [
+            'Remove all loose and peeling paint using paint scraper',
+            'Sand entire surface starting with 80 grit, then 120 grit for smoothness',
+            'Clean surface thoroughly with tack cloth to remove all dust',
+            'Apply Dulux 1Step Primer evenly and allow to dry per instructions',
+            'Lightly sand primed surface with 220 grit sandpaper',
+            'Clean again with tack cloth to remove sanding dust',
+            'Apply first coat of Nippon Weatherbond paint using roller and brush',
+            'Allow first coat to dry completely (typically 4-6 hours)',
+            'Apply second coat for optimal protection and coverage',
+            'Remove masking tape while paint is still slightly wet for clean lines'
+        ]
+    },
+    'Algae': {
+        'status': 'maintenance_required',
+        'urgency': 'medium',
+        'summary': 'Algae growth detected indicating moisture issues. Cleaning and moisture control needed to prevent recurrence.',
+        'action': 'Clean affected areas with appropriate algaecide and address underlying moisture sources.',
+        'estimated_cost': 'RM 150 - RM 900 (depending on area and cleaning method)',
+        'timeframe': '1-2 days (plus ongoing moisture management)',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': None,
+        'materials': [
+            'Clorox Algae Remover (1L) - RM 25',
+            'Domestos Bleach (1L) - RM 12',
+            'Soft-bristled brush (RM 20)',
+            'Spray bottle (RM 15)',
+            'Protective equipment (gloves, goggles) - RM 30',
+            'Anti-algae treatment (500ml) - RM 45'
+        ],
+        'tools': [
+            'Pressure washer (RM 80/day rental) or garden hose',
+            'Soft-bristled brush or broom (RM 25)',
+            'Bucket for mixing solution (RM 15)',
+            'Sprayer or watering can (RM 20)',
+            'Rubber gloves and safety glasses (RM 30)'
+        ],
+        'steps': [
+            'Mix cleaning solution (1 part Domestos bleach to 10 parts water)',
+            'Wet the affected area with clean water first',
+            'Apply cleaning solution from bottom to top using spray bottle',
+            'Allow solution to sit for 10-15 minutes (don\'t let it dry)',
+            'Scrub gently with soft brush to remove algae buildup',
+            'Rinse thoroughly with clean water from top to bottom',
+            'Improve drainage around affected areas by clearing gutters',
+            'Trim vegetation to increase sunlight and air circulation',
+            'Apply anti-algae treatment as per manufacturer instructions',
+            'Monitor area monthly and reapply treatment every 6 months'
+        ]
+    },
+    'Spalling': {
+        'status': 'repair_needed',
+        'urgency': 'medium',
+        'summary': 'Concrete or masonry deterioration detected. Professional repair recommended to prevent further structural damage.',
+        'action': 'Repair damaged masonry to restore structural integrity and prevent water penetration.',
+        'estimated_cost': 'RM 600 - RM 3,000+ (depending on extent and accessibility)',
+        'timeframe': '2-5 days (depending on scope)',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': 'Mason or Concrete Contractor (for major spalling)',
+        'materials': [
+            'Sika Concrete Repair Mortar (5kg) - RM 65',
+            'Bondcrete Concrete Bonding Agent (1L) - RM 35',
+            'Concrete primer (500ml) - RM 25',
+            'Waterproof sealant (1L) - RM 45',
+            'Wire brush (RM 15)',
+            'Mixing bucket (RM 20)'
+        ],
+        'tools': [
+            'Hammer and chisel (RM 35)',
+            'Wire brush (RM 15)',
+            'Mixing paddle (RM 25)',
+            'Trowel (RM 20)',
+            'Float (RM 25)',
+            'Safety equipment (RM 40)'
+        ],
+        'steps': [
+            'Remove all loose concrete using hammer and chisel',
+            'Clean area thoroughly with wire brush to remove debris',
+            'Apply Bondcrete bonding agent to cleaned surface',
+            'Allow bonding agent to become tacky (about 30 minutes)',
+            'Mix Sika Concrete Repair Mortar according to package instructions',
+            'Apply mortar using trowel, building up in thin layers',
+            'Smooth surface with float to match surrounding area',
+            'Allow to cure for 24-48 hours, keeping slightly moist',
+            'Apply concrete primer followed by waterproof sealant',
+            'Monitor repair area for 3 months for any signs of failure'
+        ]
+    },
+    'Stain': {
+        'status': 'cosmetic_attention',
+        'urgency': 'low',
+        'summary': 'Surface staining detected that may indicate underlying issues. Investigation and appropriate treatment needed.',
+        'action': 'Identify stain source and apply appropriate cleaning method. Monitor for recurrence.',
+        'estimated_cost': 'RM 75 - RM 450 (depending on stain type and cleaning method)',
+        'timeframe': '1 day (investigation and cleaning)',
+        'diy_possible': True,
+        'referral_needed': False,
+        'referral_type': None,
+        'materials': [
+            'Mr. Muscle Bathroom Cleaner (500ml) - RM 15',
+            'Clorox Stain Remover (1L) - RM 25',
+            'Scrub brush (RM 18)',
+            'Clean cloths/rags (RM 20)',
+            'Protective gloves (RM 12)',
+            'Stain-blocking primer (500ml) - RM 35'
+        ],
+        'tools': [
+            'Scrub brush or power brush (RM 25)',
+            'Pressure washer (RM 80/day rental) - if appropriate',
+            'Bucket for mixing solutions (RM 15)',
+            'Protective gloves and eyewear (RM 30)',
+            'pH testing strips (RM 20) - for some stains'
+        ],
+        'steps': [
+            'Identify stain type (rust, mold, mineral deposits, etc.)',
+            'Test cleaning method on small, inconspicuous area first',
+            'Apply appropriate cleaner (Mr. Muscle for mold, Clorox for general stains)',
+            'Allow cleaner to work for recommended contact time',
+            'Scrub gently with brush and rinse thoroughly',
+            'For stubborn stains, repeat process or try stronger concentration',
+            'If stain persists, apply stain-blocking primer before painting',
+            'Investigate and address underlying cause (leaks, moisture, etc.)',
+            'Apply protective coating if recommended for stain type'
+        ]
+    }
+}
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def load_recommendation_catalog(path=None):
+    """Build the immutable recommendation catalog once, merging entries from a JSON file if given"""
+    catalog = dict(DEFAULT_DETAILED_RECOMMENDATIONS)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for class_name, entry in json.load(f).items():
+                catalog[class_name] = dict(catalog.get(class_name, {}), **entry)
+    return freeze(catalog)
+
+RECOMMENDATION_CATALOG = load_recommendation_catalog(app.config['RECOMMENDATIONS_FILE'])
+
 def get_recommendation(class_name):
     """Get basic maintenance recommendations based on prediction"""
-    recommendations = {
-        'Normal': 'Your cottage structure appears to be in good condition. Continue regular maintenance.',
-        'Major Crack': 'Immediate attention required! Consult a structural engineer for major crack repair.',
-        'Minor Crack': 'Monitor and seal minor cracks to prevent water damage and further deterioration.',
-        'Peeling': 'Schedule repainting and surface preparation to protect your cottage exterior.',
-        'Algae': 'Clean affected areas and improve drainage to prevent moisture buildup.',
-        'Spalling': 'Repair concrete/masonry spalling to prevent further structural damage.',
-        'Stain': 'Investigate stain source and clean to maintain cottage appearance and prevent damage.'
-    }
-    
-    return recommendations.get(class_name, 'Consult a professional for proper assessment and repair.')
+    return BASIC_RECOMMENDATIONS.get(class_name, 'Consult a professional for proper assessment and repair.')
 
 def get_detailed_recommendation(class_name):
     """Get detailed recommendations with DIY instructions and professional referrals"""
+    return RECOMMENDATION_CATALOG.get(class_name, RECOMMENDATION_CATALOG['Normal'])
+
+# ===== RENDERED PAGE CACHE =====
+
+rendered_pages = OrderedDict()  # key -> (html, etag, last_modified)
+rendered_pages_lock = threading.Lock()
+
+def get_locale():
+    """Best supported locale for this request"""
+    return request.accept_languages.best_match(app.config['SUPPORTED_LOCALES']) or app.config['SUPPORTED_LOCALES'][0]
+
+def source_last_modified(template_name):
+    """Newest modification time of everything a cached page is rendered from"""
+    paths = [__file__,
+             os.path.join(app.root_path, 'templates', 'base.html'),
+             os.path.join(app.root_path, 'templates', template_name)]
+    if app.config['RECOMMENDATIONS_FILE']:
+        paths.append(app.config['RECOMMENDATIONS_FILE'])
+    return datetime.fromtimestamp(int(max(os.path.getmtime(path) for path in paths)), timezone.utc)
+
+def cached_page(template_name, cache_key, **context):
+    """Render a page once per (template, endpoint, locale, cache_key) and answer repeat views with 304.
+
+    Pages are session-specific, so they are marked private and must be revalidated.
+    The cache is bypassed in debug mode so template edits show up immediately.
+    """
+    key = (template_name, request.endpoint, get_locale()) + tuple(cache_key)
+    with rendered_pages_lock:
+        entry = rendered_pages.get(key)
+        if entry is not None:
+            rendered_pages.move_to_end(key)
     
-    recommendations = {
-        'Normal': {
-            'status': 'good',
-            'urgency': 'low',
-            'summary': 'Your cottage appears to be in excellent condition with no structural issues detected.',
-            'action': 'Continue regular maintenance and seasonal inspections to preserve your cottage\'s condition.',
-            'estimated_cost': 'RM 0 - RM 300 (routine maintenance)',
-            'timeframe': 'Ongoing maintenance',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': None,
-            'materials': [
-                'Nippon Paint Weatherbond (5L) - RM 85',
-                'Dulux Ambience Wood Stain (1L) - RM 45', 
-                'Ronseal Thompson\'s WaterSeal (1L) - RM 35',
-                'General cleaning supplies - RM 20'
-            ],
-            'tools': [
-                'Cleaning cloths and brushes',
-                'Garden hose',
-                'Basic hand tools (screwdriver, hammer)',
-                'Extension ladder (if needed)'
-            ],
-            'steps': [
-                'Perform visual inspection quarterly for any new issues',
-                'Clean exterior surfaces annually with mild detergent',
-                'Check for new issues after heavy rain or storms',
-                'Maintain proper drainage around cottage foundation',
-                'Apply protective treatments (paint/stain) every 2-3 years as needed'
-            ]
-        },
-        'Major Crack': {
-            'status': 'critical',
-            'urgency': 'high',
-            'summary': 'Significant structural damage detected that poses potential safety risks and requires immediate professional assessment.',
-            'action': 'Contact a structural engineer immediately for professional evaluation. Do not attempt DIY repairs on major cracks.',
-            'estimated_cost': 'RM 1,500 - RM 15,000+ (professional assessment and repair)',
-            'timeframe': 'Immediate action required (within 1-2 days)',
-            'diy_possible': False,
-            'referral_needed': True,
-            'referral_type': 'Structural Engineer',
-            'materials': [
-                'Professional assessment required',
-                'Structural repair materials (determined by engineer)',
-                'Potential foundation work materials',
-                'Waterproofing systems if needed'
-            ],
-            'tools': [
-                'Professional equipment only',
-                'Structural assessment tools',
-                'Specialized repair equipment',
-                'Safety equipment for workers'
-            ],
-            'steps': [
-                'DO NOT attempt DIY repair - contact professional immediately',
-                'Document the crack with photos and measurements',
-                'Restrict access to affected area if safety concern',
-                'Get quotes from certified structural engineers',
-                'Obtain necessary permits for structural work',
-                'Schedule professional repair work',
-                'Arrange for post-repair inspection and certification'
-            ]
-        },
-        'Minor Crack': {
-            'status': 'attention_needed',
-            'urgency': 'medium',
-            'summary': 'Small cracks detected that should be monitored and sealed to prevent water infiltration and expansion.',
-            'action': 'Clean and seal cracks with appropriate filler, then monitor for growth over time.',
-            'estimated_cost': 'RM 150 - RM 600 (DIY) or RM 600 - RM 1,500 (professional)',
-            'timeframe': '1-2 weeks (monitor ongoing)',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': None,
-            'materials': [
-                'Sika Crack Repair Kit (500ml) - RM 45',
-                'Dulux 1Step Primer (1L) - RM 35',
-                'Nippon Paint Weatherbond (1L) - RM 25',
-                'Sandpaper (120 & 220 grit) - RM 15',
-                'Masking tape - RM 8',
-                'Cleaning supplies - RM 20'
-            ],
-            'tools': [
-                'Caulk gun (RM 15)',
-                'Putty knife (RM 12)',
-                'Wire brush (RM 8)',
-                'Paintbrush 2-inch (RM 15)',
-                'Measuring tape (RM 20)',
-                'Safety glasses and gloves (RM 25)'
-            ],
-            'steps': [
-                'Clean crack thoroughly using wire brush to remove all loose debris and old filler',
-                'Use vacuum or compressed air to remove dust from crack interior',
-                'Apply Sika Crack Repair filler using caulk gun, filling crack completely',
-                'Smooth surface with putty knife, removing excess material',
-                'Allow to cure for 24-48 hours as per manufacturer instructions',
-                'Sand smooth with 120 grit sandpaper, then 220 grit for finishing',
-                'Apply Dulux 1Step Primer to prepared surface and let dry',
-                'Paint with Nippon Weatherbond using 2 coats for best protection',
-                'Monitor crack monthly for 6 months for any signs of expansion'
-            ]
-        },
-        'Peeling': {
-            'status': 'maintenance_required',
-            'urgency': 'medium',
-            'summary': 'Paint deterioration detected that affects both protection and aesthetics. Surface preparation and repainting needed.',
-            'action': 'Remove loose paint, prepare surface properly, and repaint affected areas with high-quality exterior paint.',
-            'estimated_cost': 'RM 300 - RM 2,400 (depending on area size and paint quality)',
-            'timeframe': '2-4 days (weather dependent)',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': None,
-            'materials': [
-                'Paint scraper (RM 25)',
-                'Sandpaper variety pack (RM 35)',
-                'Dulux 1Step Primer (5L) - RM 120',
-                'Nippon Paint Weatherbond (5L) - RM 85',
-                'Drop cloths (RM 30)',
-                'Masking tape (RM 15)',
-                'Cleaning supplies (RM 25)'
-            ],
-            'tools': [
-                'Paint scraper (RM 25)',
-                'Electric sander (RM 150) or sanding blocks (RM 20)',
-                'Paintbrush set (RM 45)',
-                'Paint roller with tray (RM 35)',
-                'Extension ladder (RM 200 rental/day)',
-                'Safety equipment (mask, goggles) - RM 40'
-            ],
-            'steps': [
-                'Remove all loose and peeling paint using paint scraper',
-                'Sand entire surface starting with 80 grit, then 120 grit for smoothness',
-                'Clean surface thoroughly with tack cloth to remove all dust',
-                'Apply Dulux 1Step Primer evenly and allow to dry per instructions',
-                'Lightly sand primed surface with 220 grit sandpaper',
-                'Clean again with tack cloth to remove sanding dust',
-                'Apply first coat of Nippon Weatherbond paint using roller and brush',
-                'Allow first coat to dry completely (typically 4-6 hours)',
-                'Apply second coat for optimal protection and coverage',
-                'Remove masking tape while paint is still slightly wet for clean lines'
-            ]
-        },
-        'Algae': {
-            'status': 'maintenance_required',
-            'urgency': 'medium',
-            'summary': 'Algae growth detected indicating moisture issues. Cleaning and moisture control needed to prevent recurrence.',
-            'action': 'Clean affected areas with appropriate algaecide and address underlying moisture sources.',
-            'estimated_cost': 'RM 150 - RM 900 (depending on area and cleaning method)',
-            'timeframe': '1-2 days (plus ongoing moisture management)',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': None,
-            'materials': [
-                'Clorox Algae Remover (1L) - RM 25',
-                'Domestos Bleach (1L) - RM 12',
-                'Soft-bristled brush (RM 20)',
-                'Spray bottle (RM 15)',
-                'Protective equipment (gloves, goggles) - RM 30',
-                'Anti-algae treatment (500ml) - RM 45'
-            ],
-            'tools': [
-                'Pressure washer (RM 80/day rental) or garden hose',
-                'Soft-bristled brush or broom (RM 25)',
-                'Bucket for mixing solution (RM 15)',
-                'Sprayer or watering can (RM 20)',
-                'Rubber gloves and safety glasses (RM 30)'
-            ],
-            'steps': [
-                'Mix cleaning solution (1 part Domestos bleach to 10 parts water)',
-                'Wet the affected area with clean water first',
-                'Apply cleaning solution from bottom to top using spray bottle',
-                'Allow solution to sit for 10-15 minutes (don\'t let it dry)',
-                'Scrub gently with soft brush to remove algae buildup',
-                'Rinse thoroughly with clean water from top to bottom',
-                'Improve drainage around affected areas by clearing gutters',
-                'Trim vegetation to increase sunlight and air circulation',
-                'Apply anti-algae treatment as per manufacturer instructions',
-                'Monitor area monthly and reapply treatment every 6 months'
-            ]
-        },
-        'Spalling': {
-            'status': 'repair_needed',
-            'urgency': 'medium',
-            'summary': 'Concrete or masonry deterioration detected. Professional repair recommended to prevent further structural damage.',
-            'action': 'Repair damaged masonry to restore structural integrity and prevent water penetration.',
-            'estimated_cost': 'RM 600 - RM 3,000+ (depending on extent and accessibility)',
-            'timeframe': '2-5 days (depending on scope)',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': 'Mason or Concrete Contractor (for major spalling)',
-            'materials': [
-                'Sika Concrete Repair Mortar (5kg) - RM 65',
-                'Bondcrete Concrete Bonding Agent (1L) - RM 35',
-                'Concrete primer (500ml) - RM 25',
-                'Waterproof sealant (1L) - RM 45',
-                'Wire brush (RM 15)',
-                'Mixing bucket (RM 20)'
-            ],
-            'tools': [
-                'Hammer and chisel (RM 35)',
-                'Wire brush (RM 15)',
-                'Mixing paddle (RM 25)',
-                'Trowel (RM 20)',
-                'Float (RM 25)',
-                'Safety equipment (RM 40)'
-            ],
-            'steps': [
-                'Remove all loose concrete using hammer and chisel',
-                'Clean area thoroughly with wire brush to remove debris',
-                'Apply Bondcrete bonding agent to cleaned surface',
-                'Allow bonding agent to become tacky (about 30 minutes)',
-                'Mix Sika Concrete Repair Mortar according to package instructions',
-                'Apply mortar using trowel, building up in thin layers',
-                'Smooth surface with float to match surrounding area',
-                'Allow to cure for 24-48 hours, keeping slightly moist',
-                'Apply concrete primer followed by waterproof sealant',
-                'Monitor repair area for 3 months for any signs of failure'
-            ]
-        },
-        'Stain': {
-            'status': 'cosmetic_attention',
-            'urgency': 'low',
-            'summary': 'Surface staining detected that may indicate underlying issues. Investigation and appropriate treatment needed.',
-            'action': 'Identify stain source and apply appropriate cleaning method. Monitor for recurrence.',
-            'estimated_cost': 'RM 75 - RM 450 (depending on stain type and cleaning method)',
-            'timeframe': '1 day (investigation and cleaning)',
-            'diy_possible': True,
-            'referral_needed': False,
-            'referral_type': None,
-            'materials': [
-                'Mr. Muscle Bathroom Cleaner (500ml) - RM 15',
-                'Clorox Stain Remover (1L) - RM 25',
-                'Scrub brush (RM 18)',
-                'Clean cloths/rags (RM 20)',
-                'Protective gloves (RM 12)',
-                'Stain-blocking primer (500ml) - RM 35'
-            ],
-            'tools': [
-                'Scrub brush or power brush (RM 25)',
-                'Pressure washer (RM 80/day rental) - if appropriate',
-                'Bucket for mixing solutions (RM 15)',
-                'Protective gloves and eyewear (RM 30)',
-                'pH testing strips (RM 20) - for some stains'
-            ],
-            'steps': [
-                'Identify stain type (rust, mold, mineral deposits, etc.)',
-                'Test cleaning method on small, inconspicuous area first',
-                'Apply appropriate cleaner (Mr. Muscle for mold, Clorox for general stains)',
-                'Allow cleaner to work for recommended contact time',
-                'Scrub gently with brush and rinse thoroughly',
-                'For stubborn stains, repeat process or try stronger concentration',
-                'If stain persists, apply stain-blocking primer before painting',
-                'Investigate and address underlying cause (leaks, moisture, etc.)',
-                'Apply protective coating if recommended for stain type'
-            ]
-        }
-    }
+    if entry is None or app.debug:
+        html = render_template(template_name, **context)
+        etag = hashlib.blake2b(html.encode('utf-8'), digest_size=16).hexdigest()
+        entry = (html, etag, source_last_modified(template_name))
+        if not app.debug:
+            with rendered_pages_lock:
+                rendered_pages[key] = entry
+                while len(rendered_pages) > app.config['RENDER_CACHE_SIZE']:
+                    rendered_pages.popitem(last=False)
     
-    return recommendations.get(class_name, recommendations['Normal'])
+    html, etag, last_modified = entry
+    response = make_response(html)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    response.vary.add('Accept-Language')
+    return response.make_conditional(request)
+
+# ===== STATIC ASSETS =====
+
+ASSET_DIR = os.path.join(app.root_path, 'static', 'dist')
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+def load_asset_manifest(path):
+    """Static path -> fingerprinted build entry from build_assets.py; empty if it has not been run"""
+    path = os.path.join(app.root_path, path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['assets']
+
+asset_manifest = load_asset_manifest(app.config['ASSET_MANIFEST'])
+# Precompressed encodings available for each fingerprinted file
+asset_encodings = {entry['file']: entry.get('encodings', []) for entry in asset_manifest.values()}
+
+def asset_url(filename):
+    """URL of a static file: its fingerprinted build if there is one, else the plain /static/ file"""
+    entry = asset_manifest.get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=entry['file'])
+
+def responsive_image(filename, alt, sizes='100vw', **attributes):
+    """<picture> with AVIF/WebP srcsets for a built image, or a plain <img> before build_assets.py has run"""
+    extra = ''.join(f' {escape(name.replace("_", "-"))}="{escape(value)}"' for name, value in attributes.items())
+    entry = asset_manifest.get(filename)
+    if entry is None:
+        return Markup(f'<img src="{escape(url_for("static", filename=filename))}" alt="{escape(alt)}"{extra}>')
+    
+    sources = []
+    for image_format in ('avif', 'webp'):
+        variants = entry['variants'].get(image_format)
+        if variants:
+            srcset = ', '.join(f"{url_for('asset', filename=name)} {width}w" for width, name in variants)
+            sources.append(f'<source type="image/{image_format}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">')
+    return Markup(f'<picture>{"".join(sources)}<img src="{escape(url_for("asset", filename=entry["file"]))}" '
+                  f'alt="{escape(alt)}" width="{entry["width"]}" height="{entry["height"]}" '
+                  f'loading="lazy" decoding="async"{extra}></picture>')
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted build output: cached for a year, sent precompressed when the browser accepts it"""
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in asset_encodings.get(filename, ()) and request.accept_encodings[encoding]:
+            response = send_from_directory(ASSET_DIR, filename + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                                           max_age=ASSET_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(ASSET_DIR, filename, max_age=ASSET_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 # ===== MAIN ROUTES =====
 
@@ -370,28 +843,42 @@ def detailed_report():
     # Check for current_result first (latest inspection)
     if 'current_result' in session:
         result = session['current_result']
-        print(f"DEBUG: Using current_result: {result['predicted_class']}")
+        logger.debug("Detailed report from current_result class=%s", result['predicted_class'])
     # Fallback to last_result
     elif 'last_result' in session and session['last_result']:
         result = session['last_result']
-        print(f"DEBUG: Using last_result: {result['predicted_class']}")
+        logger.debug("Detailed report from last_result class=%s", result['predicted_class'])
     else:
-        print("DEBUG: No results found, redirecting to inspection")
+        logger.debug("Detailed report without a result, redirecting to inspection")
         return redirect(url_for('inspection'))
     
     # Get recommendation
     recommendation = get_detailed_recommendation(result['predicted_class'])
     
-    return render_template('detailed_report.html', 
-                         result=result, 
-                         recommendation=recommendation)
+    return cached_page('detailed_report.html',
+                       (result['predicted_class'], result.get('timestamp'), result.get('id')),
+                       result=result,
+                       recommendation=recommendation)
 
 @app.route('/history.html')
 @app.route('/report')
 def history():
-    """History/Report page"""
-    inspection_history = session.get('inspection_history', [])
-    return render_template('history.html', history=inspection_history)
+    """History/Report page, newest first, one page at a time"""
+    history_id = get_history_id()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = app.config['HISTORY_PAGE_SIZE']
+    
+    total_reports = history_store.count(history_id)
+    class_counts = history_store.class_counts(history_id)
+    normal_count = class_counts.get('Normal', 0)
+    
+    return render_template('history.html',
+                           history=history_store.page(history_id, page, per_page),
+                           total_reports=total_reports,
+                           normal_count=normal_count,
+                           issues_count=total_reports - normal_count,
+                           page=page,
+                           total_pages=max(1, -(-total_reports // per_page)))
 
 @app.route('/guide.html')
 def guide():
@@ -405,91 +892,625 @@ def about():
 
 # ===== ML PREDICTION ROUTES - SIMPLIFIED =====
 
+def upload_rejected(error):
+    """413 response for an upload over the byte or pixel limit"""
+    admission_rejected_total.labels(request.endpoint, error.reason).inc()
+    return jsonify({'error': str(error)}), 413
+
+def invalid_upload(error):
+    """400 response for an upload that is not a photo in a form we accept"""
+    prediction_errors_total.labels(request.endpoint, 'InvalidUpload').inc()
+    return jsonify({'error': str(error)}), 400
+
+def oversized_upload():
+    """413 response if the request declares a body over MAX_UPLOAD_BYTES (checked before reading it), else None"""
+    try:
+        check_upload_size(request.content_length, app.config['MAX_UPLOAD_BYTES'])
+    except ImageTooLarge as e:
+        return upload_rejected(e)
+    return None
+
+def overloaded(error):
+    """Fast 429 (wait queue full) or 503 (no slot freed up in time) response with Retry-After"""
+    if error.reason == QUEUE_FULL:
+        admission_rejected_total.labels(request.endpoint, error.reason).inc()
+        response = jsonify({'error': 'Too many predictions in progress, please retry shortly'})
+        response.status_code = 429
+    else:
+        admission_shed_total.labels(request.endpoint).inc()
+        response = jsonify({'error': 'Server is busy, please retry shortly'})
+        response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """Handle ML predictions - SIMPLIFIED (NO CONFIDENCE %)"""
+    rejected = oversized_upload()
+    if rejected:
+        return rejected
+    # Take a slot first: while the model loads, only admitted requests wait for it and the rest are turned away
     try:
-        # Handle file upload or camera capture
-        if 'file' in request.files and request.files['file'].filename != '':
-            # File upload
-            file = request.files['file']
-            image = Image.open(file.stream)
-        elif 'image_data' in request.form:
-            # Camera capture
-            image_data_url = request.form['image_data']
-            image_data_base64 = image_data_url.split(',')[1]
-            image_bytes = base64.b64decode(image_data_base64)
-            image = Image.open(io.BytesIO(image_bytes))
-        else:
+        admission_gate.acquire()
+    except Overloaded as e:
+        return overloaded(e)
+    
+    try:
+        if not model_registry.wait(app.config['MODEL_WAIT_SECONDS']):
+            return model_unavailable()
+        with predict_stage_seconds.labels('read').time():
+            upload = read_upload()
+        if upload is None:
+            prediction_errors_total.labels('predict', 'NoImage').inc()
             return jsonify({'error': 'No image provided'})
         
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        result = classify_upload(upload, get_history_id(), top_k=requested_top_k(), tiled=requested_tiled())
+        with predict_stage_seconds.labels('session').time():
+            remember_result(result)
         
-        # Process the image
-        processed_image = preprocess_image(image)
-        
-        # Make prediction
-        prediction = model.predict(processed_image)
-        prediction_scores = prediction[0]
-        predicted_class_index = np.argmax(prediction_scores)
-        predicted_class_name = CLASS_NAMES[predicted_class_index]
-        
-        # SIMPLIFIED RESULT - ONLY CLASS AND TIMESTAMP
-        result = {
-            'predicted_class': predicted_class_name,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        # Clear any existing current_result first
-        session.pop('current_result', None)
-        
-        # Store results in session
-        session['current_result'] = result.copy()
-        session['last_result'] = result.copy()  # Keep for compatibility
-        
-        # Store in report history
-        if 'inspection_history' not in session:
-            session['inspection_history'] = []
-        
-        session['inspection_history'].append(result.copy())
-        
-        # Keep only last 50 reports
-        if len(session['inspection_history']) > 50:
-            session['inspection_history'] = session['inspection_history'][-50:]
-            
-        # Force session to be saved
-        session.modified = True
-        session.permanent = True  # Make session permanent
-        
-        print(f"DEBUG: Prediction saved - {result['predicted_class']}")
-        print(f"DEBUG: History length: {len(session.get('inspection_history', []))}")
+        logger.debug("Prediction saved class=%s", result['predicted_class'])
         
         return jsonify(result)
     
+    except ImageTooLarge as e:
+        return upload_rejected(e)
+    except InvalidUpload as e:
+        return invalid_upload(e)
     except Exception as e:
-        print(f"Prediction error: {str(e)}")
+        prediction_errors_total.labels('predict', type(e).__name__).inc()
+        logger.warning("Prediction failed: %s", e)
         return jsonify({'error': str(e)})
+    finally:
+        admission_gate.release()
+
+def requested_tiled():
+    """True when the request asks for tiled inference (`tiles=1`)"""
+    return request.values.get('tiles', '0').lower() in ('1', 'true', 'yes')
+
+def requested_top_k():
+    """`top_k` query/form parameter, clamped to the number of classes (0 = class only)"""
+    return min(max(request.values.get('top_k', 0, type=int), 0), len(CLASS_NAMES))
+
+def score_result(prediction_scores, top_k=0):
+    """Result for one score row plus its calibrated probabilities.
+
+    The result is flagged 'uncertain' when the two most likely classes are within
+    UNCERTAIN_MARGIN of each other; `top_k` adds the ranked classes the inspection page displays.
+    """
+    probabilities = calibrate_scores(prediction_scores, temperature)
+    first, second = np.sort(probabilities)[::-1][:2]
+    predicted_class = CLASS_NAMES[int(np.argmax(probabilities))]
+    predictions_total.labels(predicted_class).inc()
+    
+    # SIMPLIFIED RESULT - CLASS, TIMESTAMP AND UNCERTAIN FLAG
+    result = {
+        'predicted_class': predicted_class,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'uncertain': bool(first - second < app.config['UNCERTAIN_MARGIN'])
+    }
+    if top_k:
+        result['max_confidence_percentage'] = round(float(first) * 100.0, 1)
+        result['all_predictions'] = top_k_predictions(probabilities, top_k)
+    return result, probabilities
+
+def read_upload():
+    """The photo of a single-image request: ('bytes', data) for a raw body or file, ('data_url', str) for a camera capture"""
+    check_upload_size(request.content_length, app.config['MAX_UPLOAD_BYTES'])
+    if request.mimetype in RAW_IMAGE_MIMETYPES:
+        # Raw JPEG/WebP/PNG body: read once from the stream, no multipart parsing or base64
+        image_bytes = request.get_data(cache=False)
+        check_upload_size(len(image_bytes), app.config['MAX_UPLOAD_BYTES'])
+        return ('bytes', image_bytes) if image_bytes else None
+    if 'file' in request.files and request.files['file'].filename != '':
+        # File upload
+        return 'bytes', request.files['file'].read()
+    if 'image_data' in request.form:
+        # Legacy camera capture (data URL); base64 decoding is left to classify_upload so jobs do it off the request thread
+        check_data_url(request.form['image_data'])
+        return 'data_url', request.form['image_data']
+    return None
+
+def classify_tiles(image_bytes, cache_key, version):
+    """Per-tile scores as a rows x cols x classes array, run through `version` as one batch.
+
+    Also returns the photo's embedding (the mean over its tiles), or None.
+    """
+    cache_key += f":tiles:{app.config['TILE_SIZE']}:{app.config['TILE_STRIDE']}:{app.config['TILE_MAX_TILES']}"
+    grid_scores = prediction_cache.get(cache_key)
+    embedding = prediction_cache.get(cache_key + ':embedding')
+    if grid_scores is None:
+        with predict_stage_seconds.labels('decode').time():
+            image = open_image(image_bytes, app.config['MAX_IMAGE_PIXELS'])
+        with predict_stage_seconds.labels('preprocess').time():
+            batch, rows, cols, _ = tile_image(image,
+                                              tile_size=app.config['TILE_SIZE'],
+                                              stride=app.config['TILE_STRIDE'],
+                                              max_tiles=app.config['TILE_MAX_TILES'])
+        with predict_stage_seconds.labels('inference').time():
+            tile_scores, tile_embeddings = split_embedding(np.asarray(version.run(batch)))
+        grid_scores = tile_scores.reshape(rows, cols, len(CLASS_NAMES))
+        prediction_cache.put(cache_key, grid_scores)
+        if tile_embeddings.size:
+            embedding = tile_embeddings.mean(axis=0)
+            prediction_cache.put(cache_key + ':embedding', embedding)
+    return grid_scores, embedding
+
+def tile_heatmap(grid_scores):
+    """Coarse defect map: per tile, the probability of anything but Normal and the most likely class"""
+    probabilities = calibrate_scores(grid_scores, temperature)
+    defect = 1.0 - probabilities[..., CLASS_NAMES.index('Normal')]
+    return {
+        'rows': int(grid_scores.shape[0]),
+        'cols': int(grid_scores.shape[1]),
+        'defect_probability': np.round(defect.astype(np.float64), 3).tolist(),
+        'classes': [[CLASS_NAMES[int(i)] for i in row] for row in probabilities.argmax(axis=-1)],
+    }
+
+def classify_upload(upload, history_id, top_k=0, tiled=False):
+    """Decode, classify and store one photo; returns the result saved to the history.
+
+    With `tiled`, the photo is scored as overlapping tiles instead of one squashed image
+    and the result also carries a per-tile heatmap. The registry picks the model version
+    per history id; a shadow candidate scores the photo too, but only metrics see its answer.
+    """
+    kind, payload = upload
+    if kind == 'data_url':
+        with predict_stage_seconds.labels('decode').time():
+            image_bytes = decode_data_url(payload)
+    else:
+        image_bytes = payload
+    check_upload_size(len(image_bytes), app.config['MAX_UPLOAD_BYTES'])
+    
+    version, shadow = model_registry.route(history_id)
+    
+    # Re-submitted photos are answered from the cache (dropped on a model swap or if the model file was replaced)
+    prediction_cache.set_model_version(model_registry.fingerprint())
+    image_hash = prediction_cache.key_for(image_bytes)
+    cache_key = f"{version.name}:{image_hash}"
+    grid_scores = None
+    processed_image = None
+    embedding = None
+    
+    if tiled:
+        grid_scores, embedding = classify_tiles(image_bytes, cache_key, version)
+        prediction_scores = aggregate_tile_scores(grid_scores.reshape(-1, len(CLASS_NAMES)))
+    else:
+        # Cached rows are the model output as is: class scores followed by the embedding
+        prediction_row = prediction_cache.get(cache_key)
+        if prediction_row is not None:
+            prediction_scores, embedding = split_embedding(prediction_row)
+        else:
+            prediction_scores = None
+    
+    # A cache hit skips the model, but the photo is still decoded if a shadow version should
+    # score it too or its explanation input is no longer kept
+    if prediction_scores is None or (not tiled and (shadow is not None or explain_inputs.get(image_hash) is None)):
+        # Process the image (handles RGB conversion and EXIF orientation)
+        with predict_stage_seconds.labels('decode').time():
+            image = open_image(image_bytes, app.config['MAX_IMAGE_PIXELS'])
+        with predict_stage_seconds.labels('preprocess').time():
+            processed_image = preprocess_image(image)
+        keep_for_explanation(image_hash, processed_image[0])
+    
+    if prediction_scores is None:
+        # Make prediction (batched together with any concurrent requests)
+        with predict_stage_seconds.labels('inference').time():
+            prediction_row = version.batcher.submit(processed_image[0])
+        prediction_cache.put(cache_key, prediction_row)
+        prediction_scores, embedding = split_embedding(prediction_row)
+    
+    result, probabilities = score_result(prediction_scores, top_k)
+    result['model_version'] = version.name
+    model_predictions_total.labels(version.name, 'serve', result['predicted_class']).inc()
+    if grid_scores is not None:
+        result['heatmap'] = tile_heatmap(grid_scores)
+    if shadow is not None and processed_image is not None:
+        shadow_score(shadow, processed_image[0], result['predicted_class'])
+    
+    # Store in report history (server-side), with the probabilities quantized to one byte per class
+    with predict_stage_seconds.labels('history').time():
+        result['id'] = history_store.append(history_id, {'predicted_class': result['predicted_class'],
+                                                         'timestamp': result['timestamp'],
+                                                         'scores': probabilities,
+                                                         'image_hash': None if tiled else image_hash,
+                                                         'model_version': version.name})
+        store_embeddings(version, history_id, [result['id']], embedding)
+    return result
+
+def shadow_score(shadow, image, served_class):
+    """Queue `image` on the shadow version without waiting; the outcome is only recorded in metrics"""
+    def record(future):
+        error = future.exception()
+        if error is not None:
+            prediction_errors_total.labels('shadow', type(error).__name__).inc()
+            return
+        shadow_class = CLASS_NAMES[int(np.argmax(split_embedding(future.result())[0]))]
+        model_predictions_total.labels(shadow.name, 'shadow', shadow_class).inc()
+        shadow_agreement_total.labels(shadow.name, str(shadow_class == served_class).lower()).inc()
+    
+    shadow.batcher.submit_async(image).add_done_callback(record)
+
+def remember_result(result):
+    """Make `result` the current inspection for /detailed_report and /email_template"""
+    # Clear any existing current_result first
+    session.pop('current_result', None)
+    
+    # Store results in session (class, time and inspection id only, the cookie stays small)
+    summary = {'predicted_class': result['predicted_class'], 'timestamp': result['timestamp'], 'id': result.get('id')}
+    session['current_result'] = summary
+    session['last_result'] = summary.copy()  # Keep for compatibility
+    
+    # Force session to be saved
+    session.modified = True
+    session.permanent = True  # Make session permanent
+
+# ===== ASYNC PREDICTION JOBS =====
+
+def run_job(job_id, upload, history_id, top_k=0, tiled=False):
+    """Background half of POST /jobs: wait for the model, then decode and classify"""
+    job_store.start(job_id)
+    try:
+        if not model_registry.wait(app.config['MODEL_WAIT_SECONDS']):
+            job_store.fail(job_id, 'Model is not available, please retry shortly')
+            return
+        result = classify_upload(upload, history_id, top_k, tiled)
+        job_store.finish(job_id, result)
+        logger.debug("Job finished job_id=%s class=%s", job_id, result['predicted_class'])
+    except Exception as e:
+        prediction_errors_total.labels('submit_job', type(e).__name__).inc()
+        logger.warning("Job failed job_id=%s: %s", job_id, e)
+        job_store.fail(job_id, str(e))
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a prediction and return its job id immediately (202); fetch the result from the job URLs"""
+    rejected = oversized_upload()
+    if rejected:
+        return rejected
+    try:
+        with predict_stage_seconds.labels('read').time():
+            upload = read_upload()
+    except ImageTooLarge as e:
+        return upload_rejected(e)
+    except InvalidUpload as e:
+        return invalid_upload(e)
+    if upload is None:
+        return jsonify({'error': 'No image provided'}), 400
+    
+    history_id = get_history_id()
+    try:
+        job_id = job_store.create(history_id)
+    except JobStoreFull:
+        response = jsonify({'error': 'Too many jobs in progress, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    
+    job_executor.submit(run_job, job_id, upload, history_id, requested_top_k(), requested_tiled())
+    
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id),
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job_id)
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a job; `?wait=N` holds the request up to N seconds (max 30) for it to finish"""
+    wait = min(request.args.get('wait', 0, type=float), 30.0)
+    if wait > 0:
+        job = job_store.wait(job_id, get_history_id(), wait)
+    else:
+        job = job_store.get(job_id, get_history_id())
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    if job['status'] == 'done':
+        remember_result(job['result'])
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of one job's status; ends with a 'done' or 'failed' event"""
+    history_id = get_history_id()
+    if job_store.get(job_id, history_id) is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    def generate():
+        last_status = None
+        deadline = time.monotonic() + app.config['JOB_TTL']
+        job = job_store.get(job_id, history_id)
+        while time.monotonic() < deadline:
+            if job is None:
+                yield f"event: failed\ndata: {json.dumps({'error': 'Job not found or expired'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                event = job['status'] if job['status'] in FINISHED_STATES else 'status'
+                yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+                if job['status'] in FINISHED_STATES:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+            job = job_store.wait(job_id, history_id, timeout=15)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ===== LIVE VIDEO SCANNING =====
+
+@app.route('/live/start', methods=['POST'])
+def live_start():
+    """Open a live scanning stream; the client should send frames no faster than sample_interval_ms"""
+    if not model_registry.wait(app.config['MODEL_WAIT_SECONDS']):
+        return model_unavailable()
+    stream_id = live_scans.open(get_history_id())
+    return jsonify({
+        'stream_id': stream_id,
+        'sample_interval_ms': round(live_scans.sample_interval * 1000.0),
+        'frame_url': url_for('live_frame', stream_id=stream_id),
+        'stop_url': url_for('live_stop', stream_id=stream_id),
+    })
+
+@app.route('/live/<stream_id>/frame', methods=['POST'])
+def live_frame(stream_id):
+    """Classify one video frame (raw image body) if sampling and backpressure allow; returns the smoothed label"""
+    history_id = get_history_id()
+    # Same version choice (A/B or shadow) as /predict; shed frames before reading them when its queue is backed up
+    version, shadow = model_registry.route(history_id)
+    decision = live_scans.admit(stream_id, history_id,
+                                busy=version.batcher.pending() >= app.config['LIVE_MAX_QUEUE'])
+    if decision is None:
+        return jsonify({'error': 'Stream not found or expired'}), 404
+    
+    if decision == 'keep':
+        scores = None
+        frame = None
+        # Kept frames take an inference slot like /predict; an overloaded server turns the frame away
+        try:
+            admission_gate.acquire()
+        except Overloaded as e:
+            live_scans.update(stream_id, None)
+            return overloaded(e)
+        try:
+            upload = read_upload()
+            if upload is None:
+                return jsonify({'error': 'No image provided'}), 400
+            kind, payload = upload
+            image_bytes = decode_data_url(payload) if kind == 'data_url' else payload
+            processed_image = preprocess_image(open_image(image_bytes, app.config['MAX_IMAGE_PIXELS']))
+            scores, _ = split_embedding(version.batcher.submit(processed_image[0]))
+            frame = (prediction_cache.key_for(image_bytes), explanation_input(processed_image[0]))
+            if shadow is not None:
+                shadow_score(shadow, processed_image[0], CLASS_NAMES[int(np.argmax(scores))])
+        except Exception as e:
+            prediction_errors_total.labels('live_frame', type(e).__name__).inc()
+            logger.warning("Live frame failed stream_id=%s: %s", stream_id, e)
+            return jsonify({'error': str(e)}), 400
+        finally:
+            admission_gate.release()
+            live_scans.update(stream_id, scores, version.name, frame)
+    
+    view = live_scans.view(stream_id, history_id)
+    view['frame'] = decision
+    return jsonify(view)
+
+@app.route('/live/<stream_id>/stop', methods=['POST'])
+def live_stop(stream_id):
+    """Close a stream and save its final smoothed label as an inspection; its last kept frame can be explained"""
+    view, frame = live_scans.close(stream_id, get_history_id())
+    if view is None:
+        return jsonify({'error': 'Stream not found or expired'}), 404
+    if view['label'] is None:
+        return jsonify(view)
+    
+    image_hash = None
+    if frame is not None:
+        image_hash, image = frame
+        explain_inputs.put(image_hash, image)
+    result, probabilities = score_result(list(view['scores'].values()), requested_top_k())
+    result['model_version'] = view['model_version']
+    model_predictions_total.labels(view['model_version'], 'serve', result['predicted_class']).inc()
+    result['id'] = history_store.append(get_history_id(), dict(result, scores=probabilities, image_hash=image_hash))
+    remember_result(result)
+    logger.debug("Live scan saved class=%s frames=%d", result['predicted_class'], view['frames_kept'])
+    return jsonify(dict(view, result=result))
+
+@app.route('/api/job_stats')
+def job_stats():
+    """Job store occupancy and expiry counters"""
+    return jsonify(job_store.stats())
+
+@app.route('/api/live_stats')
+def live_stats():
+    """Open live streams and sampling settings"""
+    return jsonify(live_scans.stats())
+
+def read_batch_uploads(streams):
+    """List a batch's photos without reading them: (filename, read) pairs from a 'files' list and/or a zip 'archive'.
+
+    `read()` returns one photo's bytes, so the batch is only ever in memory a chunk at a
+    time. The spooled upload streams are taken over from the request, whose teardown
+    would close them before a streamed response is read, and added to `streams`.
+    Raises ImageTooLarge if any photo is over MAX_UPLOAD_BYTES or all of them together
+    over BATCH_UPLOAD_MAX_BYTES, judged from the sizes alone before anything is read.
+    """
+    uploads = []
+    total_bytes = 0
+    for file in request.files.getlist('files'):
+        if file.filename:
+            stream, file.stream = file.stream, io.BytesIO()
+            streams.append(stream)
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            check_upload_size(size, app.config['MAX_UPLOAD_BYTES'])
+            total_bytes += size
+            uploads.append((file.filename, stream.read))
+    
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        stream, archive.stream = archive.stream, io.BytesIO()
+        streams.append(stream)
+        zf = zipfile.ZipFile(stream)
+        for info in zf.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                # Sizes from the zip directory; reading a member never yields more than its declared file_size
+                check_upload_size(info.file_size, app.config['MAX_UPLOAD_BYTES'])
+                total_bytes += info.file_size
+                uploads.append((os.path.basename(info.filename), lambda info=info: zf.read(info)))
+    
+    if app.config['BATCH_UPLOAD_MAX_BYTES'] and total_bytes > app.config['BATCH_UPLOAD_MAX_BYTES']:
+        raise ImageTooLarge(f"Batch expands to {total_bytes} bytes, the limit is "
+                            f"{app.config['BATCH_UPLOAD_MAX_BYTES']}", 'bytes')
+    return uploads
+
+def decode_into(image_bytes, out):
+    """Decode and preprocess one photo into a row of a preallocated batch"""
+    preprocess_image(open_image(image_bytes, app.config['MAX_IMAGE_PIXELS']), out=out)
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Classify many photos in one request, streaming one JSON line per photo as results are ready"""
+    streams = []
+    try:
+        response = batch_response(read_batch_uploads(streams))
+    except zipfile.BadZipFile:
+        response = jsonify({'error': 'Archive is not a valid zip file'})
+    except ImageTooLarge as e:
+        response = make_response(upload_rejected(e))
+    # The uploads stay open until the streamed response is done with them
+    for stream in streams:
+        response.call_on_close(stream.close)
+    return response
+
+def batch_response(uploads):
+    """Streamed NDJSON response for the listed (filename, read) photos of /predict/batch, or an error response"""
+    # Entries are counted from the form and the zip directory, before any photo is read
+    if not uploads:
+        return jsonify({'error': 'No images provided'})
+    if len(uploads) > app.config['BATCH_UPLOAD_MAX_IMAGES']:
+        return jsonify({'error': f"At most {app.config['BATCH_UPLOAD_MAX_IMAGES']} images per batch"})
+    # The whole batch holds one inference slot until its response is closed
+    try:
+        admission_gate.acquire()
+    except Overloaded as e:
+        return overloaded(e)
+    if not model_registry.wait(app.config['MODEL_WAIT_SECONDS']):
+        admission_gate.release()
+        return model_unavailable()
+    
+    history_id = get_history_id()
+    version, _ = model_registry.route(history_id)
+    prediction_cache.set_model_version(model_registry.fingerprint())
+    chunk_size = app.config['BATCH_MAX_SIZE']
+    top_k = requested_top_k()
+    
+    def generate():
+        succeeded = 0
+        for start in range(0, len(uploads), chunk_size):
+            # Only this chunk's photos are read into memory
+            chunk = []
+            errors = {}
+            for index, (filename, read) in enumerate(uploads[start:start + chunk_size], start=start):
+                try:
+                    chunk.append((index, (filename, read())))
+                except Exception as e:
+                    chunk.append((index, (filename, None)))
+                    errors[index] = str(e)
+                    prediction_errors_total.labels('predict_batch', type(e).__name__).inc()
+            readable = [(index, image_bytes) for index, (_, image_bytes) in chunk if index not in errors]
+            image_hashes = {index: prediction_cache.key_for(image_bytes) for index, image_bytes in readable}
+            cache_keys = {index: f"{version.name}:{image_hashes[index]}" for index, _ in readable}
+            scores = {index: prediction_cache.get(cache_keys[index]) for index, _ in readable}
+            
+            # Decode the cache misses in parallel straight into one batch tensor
+            misses = [(index, image_bytes) for index, image_bytes in readable if scores[index] is None]
+            if misses:
+                batch = np.empty((len(misses), *MODEL_INPUT_SHAPE), dtype=np.float32)
+                futures = [decode_executor.submit(decode_into, image_bytes, batch[row:row + 1])
+                           for row, (_, image_bytes) in enumerate(misses)]
+                decoded_rows = []
+                for row, future in enumerate(futures):
+                    try:
+                        future.result()
+                        decoded_rows.append(row)
+                    except Exception as e:
+                        errors[misses[row][0]] = str(e)
+                        prediction_errors_total.labels('predict_batch', type(e).__name__).inc()
+                
+                if decoded_rows:
+                    try:
+                        batch_rows = version.run(batch[decoded_rows])
+                    except Exception as e:
+                        # A failed model call costs this chunk's photos, not the rest of the batch
+                        prediction_errors_total.labels('predict_batch', type(e).__name__).inc()
+                        logger.warning("Batch chunk failed: %s", e)
+                        errors.update((misses[row][0], str(e)) for row in decoded_rows)
+                        batch_rows = []
+                    for row, prediction_row in zip(decoded_rows, batch_rows):
+                        index = misses[row][0]
+                        scores[index] = prediction_row
+                        prediction_cache.put(cache_keys[index], prediction_row)
+                        keep_for_explanation(image_hashes[index], batch[row])
+            
+            lines = []
+            results = []
+            embeddings = []
+            saved_lines = []
+            for index, (filename, _) in chunk:
+                if index in errors:
+                    lines.append({'index': index, 'filename': filename, 'error': errors[index]})
+                else:
+                    row_scores, embedding = split_embedding(scores[index])
+                    result, probabilities = score_result(row_scores, top_k)
+                    result['model_version'] = version.name
+                    model_predictions_total.labels(version.name, 'serve', result['predicted_class']).inc()
+                    results.append(dict(result, scores=probabilities, image_hash=image_hashes[index]))
+                    embeddings.append(embedding)
+                    saved_lines.append(dict(result, index=index, filename=filename))
+                    lines.append(saved_lines[-1])
+            
+            # One history write per chunk, before its lines go out, so a client that disconnects keeps what it saw
+            if results:
+                inspection_ids = history_store.append_many(history_id, results)
+                if all(embedding.size for embedding in embeddings):
+                    store_embeddings(version, history_id, inspection_ids, np.stack(embeddings))
+                for line, inspection_id in zip(saved_lines, inspection_ids):
+                    line['id'] = inspection_id
+                succeeded += len(results)
+            for line in lines:
+                yield json.dumps(line) + '\n'
+        
+        yield json.dumps({'done': True, 'total': len(uploads), 'succeeded': succeeded}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(admission_gate.release)
+    return response
 
 @app.route('/result')
 @app.route('/result/<int:report_index>')
 def result(report_index=None):
-    """Show detailed results - FIXED INDEX HANDLING"""
+    """Show detailed results; report_index is the inspection id from the history page"""
     if report_index is not None:
         # View specific report from history
-        history = session.get('inspection_history', [])
-        print(f"DEBUG: Viewing report {report_index} from {len(history)} reports")
+        selected_result = history_store.get(get_history_id(), report_index)
+        logger.debug("Viewing report id=%s", report_index)
         
-        if 0 <= report_index < len(history):
+        if selected_result is not None:
             # Set the selected result as current_result for viewing
-            selected_result = history[report_index].copy()
             session['current_result'] = selected_result
             session.modified = True
-            print(f"DEBUG: Selected report: {selected_result['predicted_class']}")
+            logger.debug("Selected report class=%s", selected_result['predicted_class'])
             return redirect(url_for('detailed_report'))
         else:
-            print(f"DEBUG: Invalid report index: {report_index}")
+            logger.debug("Invalid report id=%s", report_index)
             return redirect(url_for('history'))
     
     # For current/latest result, redirect to detailed report
@@ -524,16 +1545,18 @@ def email_template(issue_type=None):
         'confidence': None  # Removed confidence as per your simplified version
     }
     
-    print(f"DEBUG: Email template for {issue_type}")
+    logger.debug("Email template for class=%s", issue_type)
     
-    return render_template('email_template.html', **template_context)
+    return cached_page('email_template.html',
+                       (issue_type, template_context['inspection_date']),
+                       **template_context)
 
 # ===== HISTORY MANAGEMENT ROUTES =====
 
 @app.route('/clear_history')
 def clear_history():
     """Clear all inspection history"""
-    session.pop('inspection_history', None)
+    history_store.clear(get_history_id())
     session.pop('last_result', None)
     session.pop('current_result', None)
     session.modified = True
@@ -541,42 +1564,361 @@ def clear_history():
 
 @app.route('/delete_report/<int:report_index>')
 def delete_report(report_index):
-    """Delete a specific report"""
-    history = session.get('inspection_history', [])
-    # Convert from display index to actual index
-    actual_index = len(history) - 1 - report_index
-    if 0 <= actual_index < len(history):
-        history.pop(actual_index)
-        session['inspection_history'] = history
-        session.modified = True
+    """Delete a specific report; report_index is the inspection id from the history page"""
+    history_store.delete(get_history_id(), report_index)
     return redirect(url_for('history'))
 
 # ===== API ROUTES FOR AJAX =====
 
 @app.route('/api/stats')
 def get_stats():
-    """Get inspection statistics for dashboard"""
-    history = session.get('inspection_history', [])
+    """Get inspection statistics for dashboard (read from running aggregates, O(1) in history length)"""
+    history_id = get_history_id()
+    class_counts = history_store.class_counts(history_id)
+    total = sum(class_counts.values())
+    normal_count = class_counts.get('Normal', 0)
+    first_inspection, last_inspection = history_store.time_range(history_id)
+    
+    severity_counts = {'normal': 0, 'minor': 0, 'moderate': 0, 'severe': 0}
+    for class_name, count in class_counts.items():
+        severity = get_issue_severity(class_name)
+        severity_counts[severity] = severity_counts.get(severity, 0) + count
+    
+    rolling = {}
+    for days in (7, 30):
+        window_counts = history_store.class_counts_since(history_id, days)
+        rolling[f'last_{days}_days'] = {
+            'total': sum(window_counts.values()),
+            'class_counts': {name: window_counts.get(name, 0) for name in CLASS_NAMES}
+        }
     
     stats = {
-        'total_inspections': len(history),
-        'normal_count': len([r for r in history if r['predicted_class'] == 'Normal']),
-        'issues_count': len([r for r in history if r['predicted_class'] != 'Normal']),
-        'recent_inspections': history[-5:] if history else []  # Last 5
+        'total_inspections': total,
+        'normal_count': normal_count,
+        'issues_count': total - normal_count,
+        'recent_inspections': history_store.recent(history_id, 5),  # Last 5
+        'class_counts': {name: class_counts.get(name, 0) for name in CLASS_NAMES},
+        'severity_counts': severity_counts,
+        'first_inspection': first_inspection,
+        'last_inspection': last_inspection,
+        **rolling
     }
     
     return jsonify(stats)
 
-@app.route('/api/export_history')
-def export_history():
-    """Export inspection history as JSON"""
-    history = session.get('inspection_history', [])
+@app.route('/api/similar')
+def similar_inspections():
+    """Past inspections of this browser that look most like inspection `id` (cosine similarity of model embeddings)"""
+    history_id = get_history_id()
+    inspection_id = request.args.get('id', type=int)
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+    if inspection_id is None or history_store.get(history_id, inspection_id) is None:
+        return jsonify({'error': 'Inspection not found'}), 404
+    
+    started = time.perf_counter()
+    for store in all_embedding_stores():
+        query = store.get(inspection_id)
+        if query is not None:
+            break
+    else:
+        return jsonify({'error': 'No embedding stored for this inspection'}), 404
+    
+    # Ask for a few extra in case some of the neighbours were deleted from the history since
+    similar = []
+    for similar_id, similarity in store.search(query, history_id, k=2 * k, exclude=inspection_id):
+        inspection = history_store.get(history_id, similar_id)
+        if inspection is not None:
+            similar.append(dict(inspection, similarity=round(similarity, 4)))
+        if len(similar) == k:
+            break
     return jsonify({
-        'export_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'total_reports': len(history),
-        'reports': history
+        'id': inspection_id,
+        'similar': similar,
+        'search_ms': round((time.perf_counter() - started) * 1000.0, 2),
     })
 
+@app.route('/api/explain/<int:inspection_id>')
+def explain_inspection(inspection_id):
+    """Grad-CAM overlay (PNG) of where the model found the inspection's class; computed on first request, then cached"""
+    source = history_store.explain_source(get_history_id(), inspection_id)
+    if source is None:
+        return jsonify({'error': 'Inspection not found'}), 404
+    image_hash, version_name = source
+    if image_hash is None:
+        return jsonify({'error': 'No photo was kept for this inspection'}), 404
+    # Explain with the version that scored the inspection while it is still registered
+    try:
+        version = model_registry.get(version_name) if version_name else model_registry.active()
+    except KeyError:
+        version = model_registry.active()
+    
+    explanation_key = f"{version.fingerprint()}:{image_hash}"
+    etag = hashlib.blake2b(explanation_key.encode('utf-8'), digest_size=16).hexdigest()
+    if etag in request.if_none_match:
+        explanations_total.labels('cached').inc()
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
+    png = explanation_cache.get(explanation_key)
+    if png is not None:
+        explanations_total.labels('cached').inc()
+    else:
+        image = explain_inputs.get(image_hash)
+        if image is None:
+            return jsonify({'error': 'The photo is no longer kept; explanations are only available for recent inspections'}), 404
+        try:
+            admission_gate.acquire()
+        except Overloaded as e:
+            return overloaded(e)
+        try:
+            if not version.loader.wait(app.config['MODEL_WAIT_SECONDS']):
+                return model_unavailable()
+            if version.loader.model is None:
+                return jsonify({'error': 'Explanations need the Keras backend'}), 501
+            with explain_seconds.time():
+                png = render_overlay(image, explainer.explain(version.loader.model, image))
+        finally:
+            admission_gate.release()
+        explanation_cache.put(explanation_key, png)
+        explanations_total.labels('computed').inc()
+    
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response.make_conditional(request)
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+RECOMMENDATION_EXPORT_FIELDS = ['status', 'urgency', 'summary', 'action', 'estimated_cost', 'timeframe',
+                                'diy_possible', 'referral_needed', 'referral_type', 'materials', 'tools', 'steps']
+
+def export_rows(reports, include_recommendations):
+    """Label stored probabilities by class and attach recommendation fields if requested"""
+    for report in reports:
+        if report['scores'] is not None:
+            report['scores'] = dict(zip(CLASS_NAMES, report['scores']))
+        if include_recommendations:
+            report = dict(report, **get_detailed_recommendation(report['predicted_class']))
+        yield report
+
+def export_json_chunks(reports):
+    """One JSON document, written piece by piece"""
+    yield '{"export_date": %s, "reports": [' % json.dumps(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    total = 0
+    for report in reports:
+        yield (',' if total else '') + json.dumps(report)
+        total += 1
+    yield '], "total_reports": %d}' % total
+
+def export_ndjson_chunks(reports):
+    for report in reports:
+        yield json.dumps(report) + '\n'
+
+def export_csv_chunks(reports, include_recommendations):
+    fields = ['id', 'predicted_class', 'timestamp']
+    if include_recommendations:
+        fields += RECOMMENDATION_EXPORT_FIELDS
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for report in reports:
+        writer.writerow({key: '; '.join(value) if isinstance(value, (list, tuple)) else value
+                         for key, value in report.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks without buffering the whole body"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export_history')
+def export_history():
+    """Export inspection history as JSON, NDJSON or CSV, streamed in constant memory.
+
+    Query parameters: format=json|ndjson|csv, from=YYYY-MM-DD, to=YYYY-MM-DD,
+    class=<class name> (repeatable), recommendations=1, gzip=1
+    """
+    export_format = request.args.get('format', 'json').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{export_format}', use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    classes = [name for value in request.args.getlist('class') for name in value.split(',') if name]
+    unknown_classes = [name for name in classes if name not in CLASS_NAMES]
+    if unknown_classes:
+        return jsonify({'error': f"Unknown class: {', '.join(unknown_classes)}"}), 400
+    
+    start_date = request.args.get('from')
+    end_date = request.args.get('to')
+    try:
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    include_recommendations = request.args.get('recommendations', '0').lower() in ('1', 'true', 'yes')
+    use_gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    
+    reports = export_rows(history_store.iter_all(get_history_id(), start_date, end_date, classes),
+                          include_recommendations)
+    if export_format == 'csv':
+        chunks = export_csv_chunks(reports, include_recommendations)
+    elif export_format == 'ndjson':
+        chunks = export_ndjson_chunks(reports)
+    else:
+        chunks = export_json_chunks(reports)
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"inspection_history.{extension}"
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    if export_format != 'json' or use_gzip:
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/inference_stats')
+def inference_stats():
+    """Micro-batching queue depth and achieved batch sizes, plus admission control counters"""
+    stats = model_registry.active().batcher.stats()
+    stats['admission'] = admission_gate.stats()
+    if model_server is not None:
+        stats['model_server'] = model_server.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """Prediction cache hit/miss counters, plus the caches behind /api/explain"""
+    stats = prediction_cache.stats()
+    stats['explain_inputs'] = explain_inputs.stats()
+    stats['explanations'] = explanation_cache.stats()
+    return jsonify(stats)
+
+# ===== MODEL REGISTRY =====
+
+def admin_forbidden():
+    """403 response unless the request carries the configured admin token, else None"""
+    token = app.config['ADMIN_TOKEN']
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return None
+    return jsonify({'error': 'Model management requires HOMECHECK_ADMIN_TOKEN'}), 403
+
+def request_params():
+    """JSON body or form fields of a management request"""
+    return request.get_json(silent=True) or request.form
+
+@app.route('/api/models')
+def list_models():
+    """Registered model versions with their load state and batcher stats, plus active and candidate"""
+    return jsonify(model_registry.status())
+
+@app.route('/api/models', methods=['POST'])
+def register_model():
+    """Register a model version (name, path, backend=keras|tflite) and start loading it in the background"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    params = request_params()
+    name, path = params.get('name'), params.get('path')
+    backend = params.get('backend', 'keras')
+    if not name or not path:
+        return jsonify({'error': 'name and path are required'}), 400
+    if backend not in ('keras', 'tflite'):
+        return jsonify({'error': f"Unknown backend '{backend}', use keras or tflite"}), 400
+    if not os.path.exists(path):
+        return jsonify({'error': f"Model file not found: {path}"}), 400
+    try:
+        version = model_registry.register(name,
+                                          make_load_fn(backend, path, tflite_threads=app.config['TFLITE_THREADS'],
+                                                       warm_up_sizes=(1, app.config['BATCH_MAX_SIZE']),
+                                                       with_embedding=app.config['EMBEDDINGS_ENABLED'],
+                                                       embedding_layer=app.config['EMBEDDING_LAYER'] or None),
+                                          path=path, backend=backend)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    logger.info("Registered model version name=%s path=%s", name, path)
+    return jsonify(version.status()), 202
+
+@app.route('/api/models/<name>/activate', methods=['POST'])
+def activate_model(name):
+    """Swap the active model; in-flight requests finish on the version they started with"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        previous = model_registry.activate(name, timeout=app.config['MODEL_WAIT_SECONDS'])
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    logger.info("Activated model version name=%s previous=%s", name, previous.name if previous else None)
+    return jsonify(model_registry.status())
+
+@app.route('/api/models/candidate', methods=['POST'])
+def set_candidate_model():
+    """Route a percentage of traffic to a candidate version (mode=ab serves it, mode=shadow only scores it)"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    params = request_params()
+    mode = params.get('mode', 'ab')
+    if mode not in ROUTING_MODES:
+        return jsonify({'error': f"Unknown mode '{mode}', use one of: {', '.join(ROUTING_MODES)}"}), 400
+    try:
+        model_registry.set_candidate(params.get('name') or None, float(params.get('percent', 0)), mode)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(model_registry.status())
+
+@app.route('/api/models/<name>', methods=['DELETE'])
+def remove_model(name):
+    """Forget a version that is neither active nor the candidate"""
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    try:
+        model_registry.remove(name)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(model_registry.status())
+
+# ===== HEALTH CHECKS =====
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the web process is up (does not depend on the model)"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that or if loading failed"""
+    active = model_registry.active()
+    status = dict(active.loader.status(), model_version=active.name)
+    return jsonify(status), (200 if status['state'] == 'ready' else 503)
+
 # ===== DEBUG ROUTE =====
 
 @app.route('/debug/session')
@@ -586,7 +1928,7 @@ def debug_session():
         return jsonify({
             'has_current_result': 'current_result' in session,
             'has_last_result': 'last_result' in session,
-            'history_length': len(session.get('inspection_history', [])),
+            'history_length': history_store.count(get_history_id()),
             'current_class': session.get('current_result', {}).get('predicted_class', 'None'),
             'last_class': session.get('last_result', {}).get('predicted_class', 'None')
         })
@@ -604,16 +1946,20 @@ def internal_error(error):
 
 # ===== TEMPLATE CONTEXT PROCESSOR =====
 
+TEMPLATE_UTILITIES = {
+    'get_issue_severity': get_issue_severity,
+    'get_recommendation': get_recommendation,
+    'get_detailed_recommendation': get_detailed_recommendation,
+    'get_issue_emoji': get_issue_emoji,
+    'asset_url': asset_url,
+    'responsive_image': responsive_image,
+    'datetime': datetime
+}
+
 @app.context_processor
 def utility_processor():
-    """Add utility functions to all templates"""
-    return {
-        'get_issue_severity': get_issue_severity,
-        'get_recommendation': get_recommendation,
-        'get_detailed_recommendation': get_detailed_recommendation,
-        'get_issue_emoji': get_issue_emoji,
-        'datetime': datetime
-    }
+    """Add utility functions to all templates (built once, not per render)"""
+    return TEMPLATE_UTILITIES
 
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
@@ -0,0 +1,58 @@
+"""Per-request latency of model.predict() versus the compiled inference function.
+
+Usage:
+    python benchmarks/bench_inference.py [--model model.keras] [--runs 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference import MODEL_INPUT_SHAPE, make_inference_fn, warm_up  # noqa: E402
+
+
+def time_calls(fn, batch, runs):
+    """Return per-call latencies in milliseconds"""
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(batch)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies
+
+
+def summarize(name, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(ordered):8.2f} ms   "
+          f"p50 {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms")
+    return statistics.median(ordered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='model.keras')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    batch = np.random.rand(1, *MODEL_INPUT_SHAPE).astype(np.float32)
+
+    # Old path: model.predict() per request (warm it too so we compare steady state)
+    model.predict(batch, verbose=0)
+    old = summarize('model.predict()', time_calls(lambda x: model.predict(x, verbose=0), batch, args.runs))
+
+    infer = make_inference_fn(model)
+    print(f"warm-up took {warm_up(infer) * 1000.0:.1f} ms")
+    new = summarize('compiled tf.function', time_calls(infer, batch, args.runs))
+
+    print(f"speed-up (p50): {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""Load test for /predict: throughput, tail latency, peak RSS and per-stage timings, saved as JSON.
+
+Usage:
+    python benchmarks/bench_load.py                                  # test client, default grid
+    python benchmarks/bench_load.py --target server --concurrency 1,4,16 --sizes original,1280
+    python benchmarks/bench_load.py --output after.json --compare before.json
+
+Requests cycle through the photos in static/images, re-encoded per --sizes (longest side in
+pixels, or 'original'). `--target testclient` drives the app in-process through Flask's test
+client; `--target server` starts it under a threaded Werkzeug WSGI server in a child process
+and sends real HTTP requests. The prediction cache is disabled and the history goes to a
+temporary database unless --keep-cache is given, so every request does the full work.
+Per-stage timings come from the app's own /metrics histograms.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+STAGE_LINE = re.compile(r'^homecheck_predict_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+# Runs in the child process for --target server
+SERVER = r'''
+import sys
+from werkzeug.serving import make_server
+import app
+app.model_registry.wait()
+server = make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True)
+print('ready', flush=True)
+server.serve_forever()
+'''
+
+
+def load_images(image_dir, size):
+    """JPEG bytes of every sample photo, with the longest side scaled to `size` unless 'original'"""
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(image_dir, name)
+        if size == 'original':
+            with open(path, 'rb') as f:
+                images.append((name, f.read()))
+            continue
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+            image.thumbnail((int(size), int(size)), Image.BILINEAR)
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=90)
+            images.append((name, buffer.getvalue()))
+    return images
+
+
+def multipart_body(filename, image_bytes):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    return head + image_bytes + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+
+def parse_stage_metrics(text):
+    """{stage: [sum_seconds, count]} from the /metrics text"""
+    stages = {}
+    for line in text.splitlines():
+        match = STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            stages.setdefault(stage, [0.0, 0])[0 if kind == 'sum' else 1] = float(value)
+    return stages
+
+
+def stage_means(before, after):
+    """Mean milliseconds per stage for the requests between two /metrics scrapes"""
+    means = {}
+    for stage, (total, count) in after.items():
+        previous_total, previous_count = before.get(stage, (0.0, 0))
+        if count > previous_count:
+            means[stage] = round((total - previous_total) / (count - previous_count) * 1000.0, 3)
+    return means
+
+
+class TestClientTarget:
+    """The app imported into this process, driven through Flask's test client"""
+
+    name = 'testclient'
+
+    def __init__(self):
+        sys.path.insert(0, ROOT)
+        import app
+        self.app = app.app
+        app.model_registry.wait()
+
+    def post(self, body, content_type):
+        response = self.app.test_client().post('/predict', data=body, content_type=content_type)
+        return response.status_code == 200 and 'error' not in response.get_json()
+
+    def metrics(self):
+        return self.app.test_client().get('/metrics').get_data(as_text=True)
+
+    def peak_rss_mb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    def close(self):
+        pass
+
+
+class ServerTarget:
+    """The app under a threaded Werkzeug server in a child process, driven over HTTP"""
+
+    name = 'server'
+
+    def __init__(self, env):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.process = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], env=env,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        if self.process.stdout.readline().strip() != 'ready':
+            raise SystemExit('Server failed to start')
+
+    def post(self, body, content_type):
+        request = urllib.request.Request(self.base_url + '/predict', data=body, method='POST',
+                                         headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status == 200 and 'error' not in json.load(response)
+        except OSError:
+            return False
+
+    def metrics(self):
+        with urllib.request.urlopen(self.base_url + '/metrics', timeout=30) as response:
+            return response.read().decode()
+
+    def peak_rss_mb(self):
+        with open(f'/proc/{self.process.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+        return None
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def run_level(target, images, concurrency, requests, upload):
+    """Send `requests` predictions with `concurrency` workers and summarise them"""
+    if upload == 'raw':
+        bodies = [(image_bytes, 'image/jpeg') for _, image_bytes in images]
+    else:
+        bodies = [multipart_body(name, image_bytes) for name, image_bytes in images]
+
+    def one(index):
+        body, content_type = bodies[index % len(bodies)]
+        started = time.perf_counter()
+        ok = target.post(body, content_type)
+        return (time.perf_counter() - started) * 1000.0, ok
+
+    before = parse_stage_metrics(target.metrics())
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    after = parse_stage_metrics(target.metrics())
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(not ok for _, ok in outcomes),
+        'throughput_rps': round(requests / elapsed, 2),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2),
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p95': round(percentile(latencies, 0.95), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2),
+        },
+        'peak_rss_mb': round(target.peak_rss_mb(), 1),
+        'stages_ms': stage_means(before, after),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(runs, baseline_path):
+    """Print throughput and p95 changes against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = {(run['size'], run['concurrency']): run for run in json.load(f)['runs']}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'size':>10}{'conc':>6}{'rps':>10}{'change':>9}{'p95 ms':>10}{'change':>9}")
+    for run in runs:
+        old = baseline.get((run['size'], run['concurrency']))
+        if old is None:
+            continue
+        rps_change = (run['throughput_rps'] / old['throughput_rps'] - 1.0) * 100.0
+        p95_change = (run['latency_ms']['p95'] / old['latency_ms']['p95'] - 1.0) * 100.0
+        print(f"{run['size']:>10}{run['concurrency']:>6}{run['throughput_rps']:>10.1f}{rps_change:>+8.1f}%"
+              f"{run['latency_ms']['p95']:>10.1f}{p95_change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=('testclient', 'server'), default='testclient')
+    parser.add_argument('--concurrency', default='1,4,8', help='Comma-separated worker counts')
+    parser.add_argument('--sizes', default='original,1280,640',
+                        help="Comma-separated longest-side sizes in pixels, or 'original'")
+    parser.add_argument('--requests', type=int, default=50, help='Requests per concurrency level and size')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--upload', choices=('multipart', 'raw'), default='multipart')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'static', 'images'))
+    parser.add_argument('--keep-cache', action='store_true', help='Leave the prediction cache enabled')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results',
+                                                         f"bench_load_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    parser.add_argument('--compare', metavar='JSON', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    history_db = os.path.join(tempfile.mkdtemp(prefix='homecheck-bench-'), 'history.db')
+    overrides = {'HOMECHECK_HISTORY_DB': history_db, 'HOMECHECK_LOG_LEVEL': 'WARNING', 'TF_CPP_MIN_LOG_LEVEL': '3'}
+    if not args.keep_cache:
+        overrides['HOMECHECK_CACHE_MAX_ENTRIES'] = '0'
+    os.environ.update(overrides)
+
+    if args.target == 'server':
+        target = ServerTarget(dict(os.environ, PYTHONPATH=ROOT))
+    else:
+        target = TestClientTarget()
+
+    runs = []
+    try:
+        print(f"{'size':>10}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'RSS MB':>9}")
+        for size in args.sizes.split(','):
+            images = load_images(args.images, size)
+            run_level(target, images, 1, args.warmup, args.upload)
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                run = dict(size=size, **run_level(target, images, concurrency, args.requests, args.upload))
+                runs.append(run)
+                latency = run['latency_ms']
+                print(f"{size:>10}{concurrency:>6}{run['throughput_rps']:>10.1f}{latency['p50']:>10.1f}"
+                      f"{latency['p95']:>10.1f}{latency['p99']:>10.1f}{run['errors']:>8}{run['peak_rss_mb']:>9.0f}")
+                print(' ' * 16 + '  '.join(f"{stage} {ms:.1f}" for stage, ms in sorted(run['stages_ms'].items())))
+    finally:
+        target.close()
+
+    results = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'target': target.name,
+            'upload': args.upload,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {key: value for key, value in sorted(os.environ.items()) if key.startswith('HOMECHECK_')},
+        },
+        'runs': runs,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == '__main__':
+    main()
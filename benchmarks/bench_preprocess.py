@@ -0,0 +1,87 @@
+"""Cost of the old vs. new preprocess_image() on typical phone-photo sizes.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--runs 20]
+
+Time covers Image.open + preprocessing of an in-memory JPEG. Memory is the peak of
+Python/numpy allocations (tracemalloc) plus the size of the decoded pixel buffer,
+which PIL allocates outside tracemalloc's view.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference import preprocess_image  # noqa: E402
+
+PHOTO_SIZES = {
+    'VGA 640x480': (640, 480),
+    'HD 1280x720': (1280, 720),
+    'FHD 1920x1080': (1920, 1080),
+    '12MP 4032x3024': (4032, 3024),
+}
+
+
+def legacy_preprocess_image(image):
+    """preprocess_image() as it was before draft decoding and float32 output"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((224, 224))
+    image = np.array(image)
+    image = image / 255.0
+    image = np.expand_dims(image, axis=0)
+    return image
+
+
+def make_jpeg(size):
+    """A noisy synthetic photo so the JPEG decoder does real work"""
+    rng = np.random.default_rng(0)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    pixels = np.clip(gradient + rng.normal(0, 40, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def measure(fn, jpeg_bytes, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(Image.open(io.BytesIO(jpeg_bytes)))
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+    tracemalloc.start()
+    image = Image.open(io.BytesIO(jpeg_bytes))
+    fn(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Pixels PIL decoded before resizing
+    decoded_bytes = image.size[0] * image.size[1] * len(image.getbands())
+    return statistics.median(latencies), peak + decoded_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'Photo':<16}{'old ms':>10}{'new ms':>10}{'speed-up':>10}{'old MB':>10}{'new MB':>10}")
+    for label, size in PHOTO_SIZES.items():
+        jpeg_bytes = make_jpeg(size)
+        old_ms, old_bytes = measure(legacy_preprocess_image, jpeg_bytes, args.runs)
+        new_ms, new_bytes = measure(preprocess_image, jpeg_bytes, args.runs)
+        print(f"{label:<16}{old_ms:>10.2f}{new_ms:>10.2f}{old_ms / new_ms:>9.1f}x"
+              f"{old_bytes / 1024 / 1024:>10.1f}{new_bytes / 1024 / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
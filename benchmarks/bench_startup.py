@@ -0,0 +1,70 @@
+"""Startup cost of the Flask app: import time, first page, model readiness and first prediction.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3] [--image static/images/wall1.jpg]
+
+Each run starts a fresh interpreter so nothing is cached between runs.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the fresh interpreter and prints one JSON line of timings (seconds)
+PROBE = r'''
+import io, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+first_page = time.perf_counter()
+app.model_registry.wait()
+ready = time.perf_counter()
+with open(sys.argv[1], 'rb') as f:
+    response = client.post('/predict', data={'file': (io.BytesIO(f.read()), 'probe.jpg')},
+                           content_type='multipart/form-data')
+first_prediction = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_page': first_page - started,
+    'ready': ready - started,
+    'first_prediction': first_prediction - ready,
+    'status': response.status_code,
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--image', default=os.path.join(ROOT, 'static', 'images', 'wall1.jpg'))
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE, os.path.abspath(args.image)],
+                                capture_output=True, text=True, check=True,
+                                env=dict(os.environ, PYTHONPATH=ROOT, TF_CPP_MIN_LOG_LEVEL='3'))
+        run = json.loads(output.stdout.strip().splitlines()[-1])
+        if run['status'] != 200:
+            sys.exit(f"/predict returned HTTP {run['status']}")
+        runs.append(run)
+
+    labels = {
+        'import': 'import app',
+        'first_page': 'first page served (from start)',
+        'ready': 'model ready (from start)',
+        'first_prediction': 'first /predict after ready',
+    }
+    for key, label in labels.items():
+        values = [run[key] * 1000.0 for run in runs]
+        print(f"{label:<34} median {statistics.median(values):9.1f} ms   max {max(values):9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Payload size and server CPU per camera capture: data-URL form field vs. binary uploads.
+
+Usage:
+    python benchmarks/bench_upload.py [--runs 50] [--width 1280 --height 720]
+
+Server CPU is process time for everything /predict does before the model call
+(form parsing, base64 decoding, preprocessing), measured through the Flask test
+client with the model call stubbed out, so the numbers isolate the upload path.
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('HOMECHECK_MODEL_LOADING', 'lazy')
+os.environ.setdefault('HOMECHECK_CACHE_MAX_ENTRIES', '0')
+os.environ.setdefault('HOMECHECK_HISTORY_DB', ':memory:')
+import app  # noqa: E402
+from inference import CLASS_NAMES, MODEL_INPUT_SHAPE  # noqa: E402
+
+
+def make_frame(width, height):
+    """A noisy synthetic camera frame so the JPEG codec does real work"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    pixels = np.clip(gradient + rng.normal(0, 30, (height, width, 3)), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def jpeg_bytes(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def measure(client, runs, **request_kwargs):
+    """Median server process-time (ms) per /predict request"""
+    timings = []
+    for _ in range(runs):
+        started = time.process_time()
+        response = client.post('/predict', **request_kwargs)
+        timings.append((time.process_time() - started) * 1000.0)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    args = parser.parse_args()
+
+    # Skip the model: the upload path is what differs between the variants
+    app.model_registry.wait = lambda timeout=None: True
+    app.model_registry.active().batcher.submit = lambda image: np.eye(len(CLASS_NAMES), dtype=np.float32)[0]
+    client = app.app.test_client()
+
+    frame = make_frame(args.width, args.height)
+    full_jpeg = jpeg_bytes(frame, 80)  # canvas.toDataURL('image/jpeg', 0.8)
+    small_jpeg = jpeg_bytes(frame.resize(MODEL_INPUT_SHAPE[:2], Image.BILINEAR), 90)
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(full_jpeg).decode('ascii')
+
+    variants = [
+        ('data URL form field', len(data_url),
+         dict(data={'image_data': data_url})),
+        ('binary, full frame', len(full_jpeg),
+         dict(data=full_jpeg, content_type='image/jpeg')),
+        ('binary, 224x224 client-side', len(small_jpeg),
+         dict(data=small_jpeg, content_type='image/jpeg')),
+    ]
+
+    print(f"Camera frame {args.width}x{args.height}, {args.runs} requests per variant")
+    print(f"{'Upload':<30}{'payload KB':>12}{'server CPU ms':>15}")
+    for label, payload_size, request_kwargs in variants:
+        cpu_ms = measure(client, args.runs, **request_kwargs)
+        print(f"{label:<30}{payload_size / 1024:>12.1f}{cpu_ms:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
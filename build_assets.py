@@ -0,0 +1,279 @@
+"""Build optimized, fingerprinted copies of the static assets and report page weight.
+
+Usage:
+    python build_assets.py              # writes static/dist/ and static/dist/manifest.json
+    python build_assets.py --report     # also compares the weight of / and /inspection before and after
+
+For every photo in static/images this writes resized WebP (and AVIF, if Pillow supports it)
+variants plus a fingerprinted copy of the original. CSS and JS files get content-hash names,
+their url(...) references are pointed at the WebP variants, and gzip (and brotli, if the
+`brotli` package is installed) copies are written next to them. The app serves everything
+listed in the manifest from /assets/ with far-future immutable cache headers; without a
+manifest it keeps serving the plain files from /static/.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+
+from PIL import Image, ImageOps, features
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+TEXT_EXTENSIONS = ('.css', '.js')
+# Widths of the srcset variants; the original width (capped at MAX_WIDTH) is always added
+VARIANT_WIDTHS = (480, 960, 1600)
+MAX_WIDTH = 1920
+# Width of the variant CSS backgrounds point at
+CSS_IMAGE_WIDTH = 1600
+QUALITY = {'webp': 80, 'avif': 55}
+REPORT_PAGES = ('/', '/inspection')
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=4).hexdigest()
+
+
+def fingerprinted_name(relative_path, data, suffix=''):
+    """'images/wall 9.jpg' -> 'images/wall-9.1a2b3c4d.jpg' (suffix goes before the hash, e.g. '.960w')"""
+    directory, name = os.path.split(relative_path)
+    stem, extension = os.path.splitext(name)
+    stem = re.sub(r'[^A-Za-z0-9_-]+', '-', stem).strip('-')
+    return os.path.join(directory, f"{stem}{suffix}.{content_hash(data)}{extension}").replace(os.sep, '/')
+
+
+def write_once(relative_path, data):
+    """Write a fingerprinted file unless it already exists (same name means same content)"""
+    path = os.path.join(DIST_DIR, relative_path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    return relative_path
+
+
+def image_formats():
+    formats = ['webp']
+    if features.check('avif'):
+        formats.append('avif')
+    return formats
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format.upper(), quality=QUALITY[image_format], method=4)
+    return buffer.getvalue()
+
+
+def build_image(relative_path, formats, previous=None):
+    """Fingerprinted original plus resized variants of one photo; `previous` (last build's entry) is reused if unchanged"""
+    with open(os.path.join(STATIC_DIR, relative_path), 'rb') as f:
+        data = f.read()
+    name = fingerprinted_name(relative_path, data)
+    if (previous and previous['file'] == name and sorted(previous['variants']) == sorted(formats)
+            and all(os.path.exists(os.path.join(DIST_DIR, variant)) for variants in previous['variants'].values()
+                    for _, variant in variants)):
+        return previous
+    entry = {'file': write_once(name, data), 'bytes': len(data), 'variants': {}}
+
+    with Image.open(os.path.join(STATIC_DIR, relative_path)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        entry['width'], entry['height'] = image.size
+        widths = sorted({width for width in VARIANT_WIDTHS if width < image.width} | {min(image.width, MAX_WIDTH)})
+        for width in widths:
+            resized = image if width == image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.LANCZOS, reducing_gap=3.0)
+            for image_format in formats:
+                stem = os.path.splitext(relative_path)[0]
+                encoded = encode(resized, image_format)
+                name = fingerprinted_name(f"{stem}.{image_format}", encoded, suffix=f".{width}w")
+                entry['variants'].setdefault(image_format, []).append([width, write_once(name, encoded)])
+    return entry
+
+
+def css_image_url(images, relative_path):
+    """Fingerprinted WebP used for a CSS background, or None if the image is not in the manifest"""
+    entry = images.get(relative_path)
+    if entry is None:
+        return None
+    candidates = entry['variants'].get('webp') or [[entry['width'], entry['file']]]
+    fitting = [candidate for candidate in candidates if candidate[0] <= CSS_IMAGE_WIDTH] or candidates[:1]
+    return fitting[-1][1]
+
+
+def rewrite_css_urls(css, css_path, images, url_prefix):
+    """Point url(...) references to images in the manifest at their fingerprinted WebP variant"""
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//')):
+            return match.group(0)
+        if url.startswith('/static/'):
+            target = url[len('/static/'):]
+        else:
+            target = os.path.normpath(os.path.join(os.path.dirname(css_path), url)).replace(os.sep, '/')
+        fingerprinted = css_image_url(images, target)
+        if fingerprinted is None:
+            return match.group(0)
+        return f"url({quote}{url_prefix}{fingerprinted}{quote})"
+    return CSS_URL.sub(replace, css)
+
+
+def compress(relative_path, data):
+    """Write .gz (and .br) copies next to a fingerprinted text asset; returns the encodings written"""
+    encodings = []
+    path = os.path.join(DIST_DIR, relative_path)
+    if not os.path.exists(path + '.gz'):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        return encodings
+    if not os.path.exists(path + '.br'):
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+    return ['br'] + encodings
+
+
+def build_text(relative_path, images, url_prefix):
+    with open(os.path.join(STATIC_DIR, relative_path), 'rb') as f:
+        data = f.read()
+    original_size = len(data)
+    if relative_path.endswith('.css'):
+        data = rewrite_css_urls(data.decode('utf-8'), relative_path, images, url_prefix).encode('utf-8')
+    name = write_once(fingerprinted_name(relative_path, data), data)
+    return {'file': name, 'bytes': original_size, 'encodings': compress(name, data)}
+
+
+def static_files(extensions):
+    for directory, dirnames, filenames in os.walk(STATIC_DIR):
+        if os.path.abspath(directory).startswith(DIST_DIR):
+            dirnames[:] = []
+            continue
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(extensions):
+                yield os.path.relpath(os.path.join(directory, name), STATIC_DIR).replace(os.sep, '/')
+
+
+def build(url_prefix='/assets/'):
+    """Build every asset and write the manifest; `url_prefix` is where the app serves static/dist"""
+    formats = image_formats()
+    previous = {}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            previous = json.load(f)['assets']
+    images = {}
+    for relative_path in static_files(IMAGE_EXTENSIONS):
+        images[relative_path] = build_image(relative_path, formats, previous.get(relative_path))
+        print(f"  {relative_path}: {len(images[relative_path]['variants'].get('webp', []))} sizes x {', '.join(formats)}")
+    # Text assets last, so CSS can point at the image variants
+    assets = dict(images)
+    for relative_path in static_files(TEXT_EXTENSIONS):
+        assets[relative_path] = build_text(relative_path, images, url_prefix)
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH + '.tmp', 'w') as f:
+        json.dump({'url_prefix': url_prefix, 'assets': assets}, f, indent=1, sort_keys=True)
+    os.replace(MANIFEST_PATH + '.tmp', MANIFEST_PATH)
+    print(f"Wrote {len(assets)} assets to {os.path.relpath(DIST_DIR, ROOT)}")
+
+
+# ===== PAGE WEIGHT REPORT =====
+
+HTML_URL = re.compile(r"""(?:src|href)=["']([^"']+)["']""")
+SRCSET = re.compile(r"""srcset=["']([^"']+)["']""")
+
+
+def pick_srcset(srcset, viewport_width):
+    """The candidate a browser would fetch for a full-width image on a 1x screen `viewport_width` wide"""
+    candidates = []
+    for candidate in srcset.split(','):
+        url, _, width = candidate.strip().partition(' ')
+        candidates.append((int(width.rstrip('w') or 0), url))
+    candidates.sort()
+    return next((url for width, url in candidates if width >= viewport_width), candidates[-1][1])
+
+
+def page_weight(client, page, viewport_width):
+    """Bytes transferred for a page and the same-origin CSS, JS and images it references"""
+    headers = {'Accept-Encoding': 'br, gzip', 'Accept': 'image/avif,image/webp,*/*'}
+    response = client.get(page, headers=headers)
+    html = response.get_data(as_text=True)
+    total = len(response.data)
+
+    urls = []
+    # Only the first <source> of each <picture> is fetched: drop sources and <img> fallbacks it shadows
+    for picture in re.findall(r'<picture>(.*?)</picture>', html, re.S):
+        urls.append(pick_srcset(SRCSET.search(picture).group(1), viewport_width))
+    html = re.sub(r'<picture>.*?</picture>', '', html, flags=re.S)
+    html = re.sub(r'<!--.*?-->', '', html, flags=re.S)
+    urls += [url for url in HTML_URL.findall(html) if url.endswith(('.css', '.js')) or '/images/' in url]
+
+    seen = set()
+    while urls:
+        url = urls.pop()
+        if url.startswith(('http:', 'https:', '//')) or url in seen:
+            continue
+        seen.add(url)
+        path = url if url.startswith('/') else '/' + url
+        if path.startswith('/static/') and not os.path.exists(os.path.join(STATIC_DIR, path[len('/static/'):])):
+            continue  # broken reference, nothing is transferred
+        asset = client.get(path, headers=headers)
+        if asset.status_code != 200:
+            continue
+        total += len(asset.data)
+        if path.endswith('.css'):
+            css = asset.data
+            if asset.headers.get('Content-Encoding') == 'gzip':
+                css = gzip.decompress(css)
+            elif asset.headers.get('Content-Encoding') == 'br':
+                import brotli
+                css = brotli.decompress(css)
+            urls += [target if target.startswith('/') else os.path.normpath(os.path.join(os.path.dirname(path), target))
+                     for _, target in CSS_URL.findall(css.decode('utf-8')) if not target.startswith('data:')]
+    return total, len(seen)
+
+
+def report(viewport_width):
+    sys.path.insert(0, ROOT)
+    import app as homecheck
+
+    client = homecheck.app.test_client()
+    print(f"\n{'page':<14}{'before':>12}{'after':>12}{'saved':>8}   (same-origin bytes, {viewport_width}px viewport)")
+    for page in REPORT_PAGES:
+        manifest = homecheck.asset_manifest
+        homecheck.asset_manifest = {}
+        before, _ = page_weight(client, page, viewport_width)
+        homecheck.asset_manifest = manifest
+        after, _ = page_weight(client, page, viewport_width)
+        print(f"{page:<14}{before / 1e6:>10.2f}MB{after / 1e6:>10.2f}MB{1 - after / before:>8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted, compressed static assets')
+    parser.add_argument('--report', action='store_true', help='Compare page weight with and without the manifest')
+    parser.add_argument('--viewport-width', type=int, default=1280, help='Screen width assumed by --report')
+    args = parser.parse_args()
+
+    build()
+    if args.report:
+        report(args.viewport_width)
+
+
+if __name__ == '__main__':
+    main()
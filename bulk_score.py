@@ -0,0 +1,340 @@
+"""Re-score a whole archive of inspection photos offline, e.g. after the model changes.
+
+Usage:
+    python bulk_score.py --input path/to/archive --output scores.csv
+    python bulk_score.py --manifest photos.txt --output scores.ndjson --workers 8 --batch-size 128
+    python bulk_score.py --input path/to/archive --output scores.parquet    # a folder of part files, needs pyarrow
+
+Photos are decoded and preprocessed by a pool of processes (the same preprocess_image
+as app.py), gathered into large batches for the model and written out as they finish.
+Re-running the same command after an interruption skips every photo already in the
+output, as long as the model has not changed in between.
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from inference import (CLASS_NAMES, MODEL_INPUT_SHAPE, calibrate_scores, load_inference_fn, load_temperature,
+                       model_fingerprint, preprocess_image, warm_up)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+FIELDS = ['path', 'predicted_class', 'confidence', 'model', 'error'] + CLASS_NAMES
+
+
+# ===== INPUT =====
+
+def iter_directory(root):
+    """Image paths under `root`, walked lazily in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def iter_manifest(path):
+    """Image paths listed one per line (blank lines and # comments ignored), relative to the manifest"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ===== DECODE STAGE (worker processes) =====
+
+def decode_chunk(paths):
+    """Decode and preprocess a few photos in a worker process; returns (paths, batch, {path: error})"""
+    batch = np.empty((len(paths), *MODEL_INPUT_SHAPE), dtype=np.float32)
+    decoded, errors = [], {}
+    for path in paths:
+        try:
+            with Image.open(path) as image:
+                preprocess_image(image, out=batch[len(decoded):len(decoded) + 1])
+            decoded.append(path)
+        except Exception as e:
+            errors[path] = repr(e)
+    return decoded, batch[:len(decoded)], errors
+
+
+def prefetch(pool, chunks, depth):
+    """Results of `decode_chunk` in input order, keeping up to `depth` chunks in flight"""
+    in_flight = deque()
+    for chunk in chunks:
+        in_flight.append(pool.submit(decode_chunk, chunk))
+        if len(in_flight) >= depth:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+# ===== OUTPUT =====
+
+def _truncate_partial_line(path):
+    """Drop a line left half-written by an interrupted run so appends start on a fresh line"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class _LineWriter:
+    """Appends rows to a CSV or NDJSON file, flushing every `flush_every` rows"""
+
+    def __init__(self, path, flush_every):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = 0
+        self._file = None
+
+    def _has_rows(self):
+        """True if the output already exists; a half-written last line is dropped first"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return False
+        _truncate_partial_line(self.path)
+        return True
+
+    def open(self):
+        exists = self._has_rows()
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+        self._start(write_header=not exists)
+
+    def _start(self, write_header):
+        pass
+
+    def write(self, row):
+        self._write(row)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+
+
+class CsvWriter(_LineWriter):
+    def _start(self, write_header):
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if write_header:
+            self._writer.writeheader()
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+    def existing(self):
+        if not self._has_rows():
+            return
+        with open(self.path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield row['path'], row['model']
+
+
+class NdjsonWriter(_LineWriter):
+    def _write(self, row):
+        self._file.write(json.dumps(row) + '\n')
+
+    def existing(self):
+        if not self._has_rows():
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                yield row['path'], row['model']
+
+
+class ParquetWriter:
+    """Writes a new part file into the output folder every `flush_every` rows (Parquet files cannot be appended to)"""
+
+    def __init__(self, path, flush_every):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.flush_every = flush_every
+        self._rows = []
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(self._rows)
+        part = os.path.join(self.path, f"part-{time.time_ns()}.parquet")
+        # Write under a temporary name so an interrupted run never leaves a truncated part behind
+        pq.write_table(table, part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def existing(self):
+        import pyarrow.parquet as pq
+        for part in sorted(glob.glob(os.path.join(self.path, 'part-*.parquet'))):
+            table = pq.read_table(part, columns=['path', 'model'])
+            yield from zip(table.column('path').to_pylist(), table.column('model').to_pylist())
+
+
+WRITERS = {'csv': CsvWriter, 'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+def output_format(path, requested=None):
+    if requested:
+        return requested
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension not in WRITERS:
+        raise SystemExit(f"Cannot tell the output format from '{path}', pass --format {'|'.join(WRITERS)}")
+    return extension
+
+
+def finished_paths(writer, model):
+    """Paths already in the output; refuses to resume an output written by a different model"""
+    done = set()
+    for path, row_model in writer.existing():
+        if row_model != model:
+            raise SystemExit(f"{writer.path} was scored with model '{row_model}', not '{model}'; "
+                             f"write to a new output or pass --overwrite")
+        done.add(path)
+    return done
+
+
+# ===== SCORING =====
+
+def result_rows(paths, scores, model, temperature):
+    probabilities = calibrate_scores(scores, temperature)
+    for path, row in zip(paths, probabilities):
+        best = int(np.argmax(row))
+        yield dict({'path': path, 'predicted_class': CLASS_NAMES[best], 'confidence': round(float(row[best]), 4),
+                    'model': model, 'error': None},
+                   **{name: round(float(value), 4) for name, value in zip(CLASS_NAMES, row)})
+
+
+def score_batch(infer, paths, batches, writer, model, temperature):
+    """Run decoded chunks through the model as one batch and write their rows; returns the number scored"""
+    scores = infer(np.concatenate(batches))
+    for row in result_rows(paths, scores, model, temperature):
+        writer.write(row)
+    return len(paths)
+
+
+def error_row(path, model, error):
+    return dict({'path': path, 'predicted_class': None, 'confidence': None, 'model': model, 'error': error},
+                **{name: None for name in CLASS_NAMES})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a directory or manifest of photos in bulk')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Folder of photos (searched recursively)')
+    source.add_argument('--manifest', help='Text file with one photo path per line')
+    parser.add_argument('--output', required=True, help='.csv, .ndjson or .parquet (a folder of part files)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='Output format if not given by the extension')
+    parser.add_argument('--backend', choices=['keras', 'tflite'], default=os.environ.get('HOMECHECK_BACKEND', 'keras'))
+    parser.add_argument('--model', help='Model file (default: HOMECHECK_MODEL or HOMECHECK_TFLITE_MODEL, as in app.py)')
+    parser.add_argument('--calibration', default=os.environ.get('HOMECHECK_CALIBRATION_FILE', 'calibration.json'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Decode processes')
+    parser.add_argument('--batch-size', type=int, default=128, help='Images per model call')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Images per decode task')
+    parser.add_argument('--prefetch', type=int, default=0, help='Decode tasks in flight (default: 4 per worker)')
+    parser.add_argument('--flush-every', type=int, default=1000, help='Rows between output flushes')
+    parser.add_argument('--overwrite', action='store_true', help='Start over instead of resuming')
+    args = parser.parse_args()
+
+    model_path = args.model
+    if model_path is None:
+        if args.backend == 'tflite':
+            model_path = os.environ.get('HOMECHECK_TFLITE_MODEL', 'model_fp16.tflite')
+        else:
+            model_path = os.environ.get('HOMECHECK_MODEL', 'model.keras')
+    model = model_fingerprint(model_path)
+
+    fmt = output_format(args.output, args.format)
+    if args.overwrite and os.path.exists(args.output):
+        if os.path.isdir(args.output):
+            for part in glob.glob(os.path.join(args.output, 'part-*.parquet')):
+                os.remove(part)
+        else:
+            os.remove(args.output)
+    writer = WRITERS[fmt](args.output, args.flush_every)
+    done = finished_paths(writer, model)
+    if done:
+        print(f"Resuming: {len(done)} photos already scored", file=sys.stderr)
+
+    paths = iter_manifest(args.manifest) if args.manifest else iter_directory(args.input)
+    todo = (path for path in paths if path not in done)
+
+    _, infer = load_inference_fn(args.backend, model_path, tflite_threads=os.cpu_count())
+    warm_up(infer, batch_sizes=(args.batch_size,))
+    temperature = load_temperature(args.calibration)
+
+    writer.open()
+    scored = failed = 0
+    started = time.perf_counter()
+    # Spawn so decode workers never inherit the TensorFlow runtime loaded above
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=context) as pool:
+            pending_paths, pending_batches, pending_count = [], [], 0
+            depth = args.prefetch or 4 * max(1, args.workers)
+            for decoded, batch, errors in prefetch(pool, chunked(todo, args.chunk_size), depth):
+                for path, error in errors.items():
+                    writer.write(error_row(path, model, error))
+                failed += len(errors)
+                if decoded:
+                    pending_paths += decoded
+                    pending_batches.append(batch)
+                    pending_count += len(decoded)
+                if pending_count >= args.batch_size:
+                    scored += score_batch(infer, pending_paths, pending_batches, writer, model, temperature)
+                    pending_paths, pending_batches, pending_count = [], [], 0
+                    elapsed = time.perf_counter() - started
+                    print(f"\r{scored} scored, {failed} failed, {scored / elapsed:.1f} images/s",
+                          end='', file=sys.stderr)
+            if pending_count:
+                scored += score_batch(infer, pending_paths, pending_batches, writer, model, temperature)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nScored {scored} photos ({failed} failed) in {elapsed:.1f} s -> {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Fit a softmax temperature on held-out labelled photos so served probabilities are calibrated.
+
+Usage:
+    python calibrate_temperature.py --images path/to/validation     # one sub-folder per class
+    python calibrate_temperature.py --images path/to/validation --output calibration.json
+
+The app reads the result from HOMECHECK_CALIBRATION_FILE (default calibration.json).
+Temperature scaling does not change the predicted class, only how confident it claims to be.
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+from inference import CLASS_NAMES, calibrate_scores, load_inference_fn, preprocess_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_labelled_images(image_dir):
+    """(preprocessed image, class index) pairs from <image_dir>/<class name>/*"""
+    samples = []
+    for label, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(image_dir, class_name)
+        if not os.path.isdir(class_dir):
+            print(f"  no folder for {class_name}, skipping")
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with Image.open(os.path.join(class_dir, name)) as image:
+                    samples.append((preprocess_image(image)[0], label))
+    return samples
+
+
+def predict_all(infer, samples, batch_size=32):
+    scores = []
+    for start in range(0, len(samples), batch_size):
+        batch = np.stack([image for image, _ in samples[start:start + batch_size]])
+        scores.append(np.asarray(infer(batch)))
+    return np.concatenate(scores), np.array([label for _, label in samples])
+
+
+def negative_log_likelihood(scores, labels, temperature):
+    probabilities = calibrate_scores(scores, temperature)
+    return float(-np.mean(np.log(np.clip(probabilities[np.arange(len(labels)), labels], 1e-7, 1.0))))
+
+
+def expected_calibration_error(probabilities, labels, bins=10):
+    """Gap between confidence and accuracy, averaged over confidence bins"""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    ece = 0.0
+    for low in np.linspace(0.0, 1.0, bins, endpoint=False):
+        in_bin = (confidence > low) & (confidence <= low + 1.0 / bins)
+        if in_bin.any():
+            ece += in_bin.mean() * abs(confidence[in_bin].mean() - correct[in_bin].mean())
+    return float(ece)
+
+
+def fit_temperature(scores, labels, low=0.05, high=20.0, steps=60):
+    """Golden-section search for the temperature minimising NLL (searched in log space)"""
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = math.log(low), math.log(high)
+    for _ in range(steps):
+        c = b - ratio * (b - a)
+        d = a + ratio * (b - a)
+        if negative_log_likelihood(scores, labels, math.exp(c)) < negative_log_likelihood(scores, labels, math.exp(d)):
+            b = d
+        else:
+            a = c
+    return math.exp((a + b) / 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit softmax temperature for calibrated probabilities')
+    parser.add_argument('--model', default='model.keras')
+    parser.add_argument('--images', required=True, help='Folder with one sub-folder of photos per class')
+    parser.add_argument('--output', default='calibration.json')
+    args = parser.parse_args()
+
+    samples = load_labelled_images(args.images)
+    if not samples:
+        raise SystemExit(f"No labelled images found under {args.images}")
+
+    _, infer = load_inference_fn('keras', args.model)
+    scores, labels = predict_all(infer, samples)
+    temperature = fit_temperature(scores, labels)
+
+    print(f"{'':<14}{'NLL':>8}{'ECE':>8}")
+    for name, t in (('uncalibrated', 1.0), (f"T = {temperature:.3f}", temperature)):
+        print(f"{name:<14}{negative_log_likelihood(scores, labels, t):>8.4f}"
+              f"{expected_calibration_error(calibrate_scores(scores, t), labels):>8.4f}")
+    print(f"Top-1 accuracy on {len(labels)} images: {np.mean(scores.argmax(axis=1) == labels):.1%}")
+
+    with open(args.output, 'w') as f:
+        json.dump({'temperature': round(temperature, 4), 'images': len(labels), 'model': args.model}, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
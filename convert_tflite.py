@@ -0,0 +1,129 @@
+"""Convert model.keras to TFLite and check it still agrees with the Keras model.
+
+Usage:
+    python convert_tflite.py --quantize float16            # writes model_fp16.tflite
+    python convert_tflite.py --quantize dynamic            # writes model_dynamic.tflite
+    python convert_tflite.py --quantize int8               # writes model_int8.tflite
+    python convert_tflite.py --check model_int8.tflite     # parity check only
+
+Serve the result with HOMECHECK_BACKEND=tflite HOMECHECK_TFLITE_MODEL=<file> python app.py
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from inference import CLASS_NAMES, load_inference_fn, make_tflite_inference_fn, preprocess_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+OUTPUT_NAMES = {
+    'float16': 'model_fp16.tflite',
+    'dynamic': 'model_dynamic.tflite',
+    'int8': 'model_int8.tflite',
+}
+
+
+def load_sample_images(image_dir, limit=None):
+    """Preprocessed images from a folder (static/images by default), one 224x224x3 array each"""
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if limit:
+        names = names[:limit]
+
+    images = []
+    for name in names:
+        with Image.open(os.path.join(image_dir, name)) as image:
+            images.append((name, preprocess_image(image)[0]))
+    return images
+
+
+def convert(model, mode, calibration_images):
+    """Convert a Keras model to TFLite flatbuffer bytes"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if mode == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'dynamic':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif mode == 'int8':
+        def representative_dataset():
+            for _, image in calibration_images:
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    return converter.convert()
+
+
+def check_parity(keras_infer, tflite_infer, images):
+    """Compare top-1 predictions of both backends per class in CLASS_NAMES"""
+    per_class = {name: {'images': 0, 'agree': 0} for name in CLASS_NAMES}
+    max_abs_diff = 0.0
+
+    for name, image in images:
+        batch = image[np.newaxis]
+        keras_scores = keras_infer(batch)[0]
+        tflite_scores = tflite_infer(batch)[0]
+        keras_class = CLASS_NAMES[int(np.argmax(keras_scores))]
+        tflite_class = CLASS_NAMES[int(np.argmax(tflite_scores))]
+
+        per_class[keras_class]['images'] += 1
+        per_class[keras_class]['agree'] += int(keras_class == tflite_class)
+        max_abs_diff = max(max_abs_diff, float(np.max(np.abs(keras_scores - tflite_scores))))
+        if keras_class != tflite_class:
+            print(f"  mismatch: {name}: keras={keras_class} tflite={tflite_class}")
+
+    total = sum(c['images'] for c in per_class.values())
+    agree = sum(c['agree'] for c in per_class.values())
+
+    print(f"{'Class':<14}{'Images':>8}{'Agree':>8}")
+    for class_name, counts in per_class.items():
+        print(f"{class_name:<14}{counts['images']:>8}{counts['agree']:>8}")
+    print(f"Top-1 agreement: {agree}/{total} ({100.0 * agree / max(total, 1):.1f}%)")
+    print(f"Max absolute score difference: {max_abs_diff:.4f}")
+    return agree / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert model.keras to TFLite')
+    parser.add_argument('--model', default='model.keras')
+    parser.add_argument('--quantize', choices=sorted(OUTPUT_NAMES), default='float16')
+    parser.add_argument('--output', help='Output path (default depends on --quantize)')
+    parser.add_argument('--check', metavar='TFLITE', help='Only run the parity check against this file')
+    parser.add_argument('--images', default=os.path.join('static', 'images'),
+                        help='Folder used for int8 calibration and the parity check')
+    parser.add_argument('--calibration-size', type=int, default=100)
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='Exit with an error if top-1 agreement falls below this fraction')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    model, keras_infer = load_inference_fn('keras', args.model)
+    images = load_sample_images(args.images)
+
+    tflite_path = args.check
+    if tflite_path is None:
+        tflite_path = args.output or OUTPUT_NAMES[args.quantize]
+        calibration_images = images[:args.calibration_size]
+        with open(tflite_path, 'wb') as f:
+            f.write(convert(model, args.quantize, calibration_images))
+        print(f"Wrote {tflite_path} ({os.path.getsize(tflite_path) / 1024 / 1024:.1f} MB, "
+              f"Keras file {os.path.getsize(args.model) / 1024 / 1024:.1f} MB)")
+
+    agreement = check_parity(keras_infer,
+                             make_tflite_inference_fn(tflite_path, num_threads=args.threads),
+                             images)
+    if agreement < args.min_agreement:
+        print(f"Agreement below {args.min_agreement:.0%} - do not deploy this model")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
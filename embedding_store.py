@@ -0,0 +1,177 @@
+"""Model embeddings of past inspections for "similar past defects" search (memory-mapped NumPy files)"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def owner_key(owner):
+    """64-bit key stored per row instead of the history id itself"""
+    return int.from_bytes(hashlib.blake2b(str(owner).encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class IVFIndex:
+    """Coarse k-means partition of the stored embeddings (an inverted-file index).
+
+    A query only scores rows in the `nprobe` partitions whose centroids are closest to
+    it, which trades a little recall for not touching most of the collection.
+    """
+
+    def __init__(self, embeddings, nlist, iterations=10, sample_size=20000, seed=0):
+        rng = np.random.default_rng(seed)
+        count = len(embeddings)
+        sample = embeddings[np.sort(rng.choice(count, min(count, sample_size), replace=False))].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(len(centroids)):
+                members = sample[assignment == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        self.centroids = centroids
+        self.assignments = self.assign(embeddings)
+        self.size = count
+
+    def assign(self, embeddings, chunk_size=65536):
+        """Nearest centroid of each row"""
+        assignments = np.empty(len(embeddings), dtype=np.int32)
+        for start in range(0, len(embeddings), chunk_size):
+            chunk = embeddings[start:start + chunk_size].astype(np.float32)
+            assignments[start:start + chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assignments
+
+    def add(self, embeddings):
+        self.assignments = np.concatenate([self.assignments, self.assign(embeddings)])
+
+    def probe(self, query, nprobe):
+        """Mask of the rows in the `nprobe` partitions closest to `query`"""
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.isin(self.assignments, nearest)
+
+
+class EmbeddingStore:
+    """Append-only float16 embeddings for one model version, searched by cosine similarity.
+
+    Rows live in three flat files next to each other: `<path>.f16` (L2-normalised
+    float16 vectors), `<path>.ids` (inspection ids) and `<path>.owners` (owner keys),
+    all memory-mapped for search. Searches are exact (one matrix-vector product over
+    the owner's rows) up to `exact_max` candidate rows; above that an IVF index over
+    the whole collection is built and only its `nprobe` nearest partitions are scored.
+    """
+
+    def __init__(self, path, exact_max=10000, nprobe=8):
+        self.path = path
+        self.exact_max = exact_max
+        self.nprobe = nprobe
+        self.dim = None
+        self._count = 0
+        self._maps = None
+        self._index = None
+        self._lock = threading.Lock()
+        if os.path.exists(path + '.json'):
+            with open(path + '.json') as f:
+                self.dim = json.load(f)['dim']
+            self._recover()
+
+    def _files(self):
+        return {'.f16': (np.float16, self.dim), '.ids': (np.int64, 1), '.owners': (np.int64, 1)}
+
+    def _recover(self):
+        """Row count from the files, dropping a row that an interrupted append wrote only partly"""
+        rows = []
+        for suffix, (dtype, width) in self._files().items():
+            size = os.path.getsize(self.path + suffix) if os.path.exists(self.path + suffix) else 0
+            rows.append(size // (np.dtype(dtype).itemsize * width))
+        self._count = min(rows)
+        for suffix, (dtype, width) in self._files().items():
+            if os.path.exists(self.path + suffix):
+                os.truncate(self.path + suffix, self._count * np.dtype(dtype).itemsize * width)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, inspection_ids, owner, embeddings):
+        """Store the embeddings (one row per inspection id) of one owner's inspections"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(inspection_ids), -1)
+        embeddings = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path + '.json', 'w') as f:
+                    json.dump({'dim': self.dim}, f)
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {embeddings.shape[1]} does not match the store's {self.dim}")
+            columns = {'.f16': embeddings.astype(np.float16),
+                       '.ids': np.asarray(inspection_ids, dtype=np.int64),
+                       '.owners': np.full(len(inspection_ids), owner_key(owner), dtype=np.int64)}
+            for suffix, values in columns.items():
+                with open(self.path + suffix, 'ab') as f:
+                    f.write(values.tobytes())
+            self._count += len(inspection_ids)
+            if self._index is not None:
+                self._index.add(columns['.f16'])
+
+    def _mapped(self):
+        """(embeddings, ids, owners) memory maps covering every row appended so far"""
+        if self._maps is None or len(self._maps[1]) != self._count:
+            self._maps = tuple(np.memmap(self.path + suffix, dtype=dtype, mode='r',
+                                         shape=(self._count, width) if width > 1 else (self._count,))
+                               for suffix, (dtype, width) in self._files().items())
+        return self._maps
+
+    def get(self, inspection_id):
+        """Stored (normalised) embedding of one inspection, or None"""
+        with self._lock:
+            if not self._count:
+                return None
+            embeddings, ids, _ = self._mapped()
+        rows = np.flatnonzero(ids == inspection_id)
+        return np.asarray(embeddings[rows[-1]], dtype=np.float32) if len(rows) else None
+
+    def search(self, query, owner, k=5, exclude=None, chunk_size=4096):
+        """The owner's `k` most similar rows as [(inspection_id, cosine similarity)], best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        with self._lock:
+            if not self._count:
+                return []
+            embeddings, ids, owners = self._mapped()
+            index = self._approximate_index(embeddings)
+
+        mask = owners == owner_key(owner)
+        if exclude is not None:
+            mask &= ids != exclude
+        if index is not None and np.count_nonzero(mask) > self.exact_max:
+            mask &= index.probe(query, self.nprobe)
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return []
+
+        similarity = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            similarity[start:start + len(chunk)] = embeddings[chunk].astype(np.float32) @ query
+        k = min(k, len(rows))
+        best = np.argpartition(-similarity, k - 1)[:k]
+        best = best[np.argsort(-similarity[best], kind='stable')]
+        return [(int(ids[rows[i]]), float(similarity[i])) for i in best]
+
+    def _approximate_index(self, embeddings):
+        """IVF index once the collection outgrows exact search; rebuilt whenever it has doubled"""
+        if self._count <= self.exact_max:
+            return None
+        if self._index is None or self._count > 2 * self._index.size:
+            self._index = IVFIndex(embeddings, nlist=int(np.sqrt(self._count)))
+        return self._index
+
+    def stats(self):
+        return {
+            'rows': self._count,
+            'dim': self.dim,
+            'bytes': self._count * (self.dim or 0) * 2,
+            'approximate_index': self._index is not None,
+        }
@@ -0,0 +1,119 @@
+"""Grad-CAM explanations for the HomeCheck Flask app: where in the photo the model found its class"""
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+from inference import MODEL_INPUT_SHAPE, MicroBatcher
+
+# Colour ramp of the heatmap, from cold to hot (dark blue, cyan, yellow, red)
+HEAT_STOPS = np.array([0.0, 0.35, 0.7, 1.0])
+HEAT_COLORS = np.array([[20, 30, 140], [0, 200, 220], [255, 220, 0], [230, 20, 20]], dtype=np.float32)
+
+
+def last_feature_layer(model):
+    """Last top-level layer of `model` (a nested backbone model counts as one layer) with a spatial feature map output"""
+    for layer in reversed(model.layers):
+        try:
+            shape = layer.output.shape
+        except (AttributeError, ValueError):
+            continue  # not connected to the model's graph, or several outputs
+        if len(shape) == 4:
+            return layer
+    raise ValueError('Model has no layer with a spatial (N x H x W x C) output')
+
+
+def make_gradcam_fn(model, layer_name=None, input_shape=MODEL_INPUT_SHAPE):
+    """Traced Grad-CAM for a batch: N x H x W x C images -> N x (h * w) maps in [0, 1].
+
+    Each map explains the image's own top class: the feature maps of `layer_name`
+    (default: the last spatial layer) weighted by the pooled gradient of that class
+    score. The feature maps and scores come from one functional model over the model's
+    own graph, so backbones with branches (e.g. a flat MobileNetV2 with residual adds)
+    work as well as a nested backbone followed by a classification head.
+    """
+    import tensorflow as tf
+
+    feature_layer = model.get_layer(layer_name) if layer_name else last_feature_layer(model)
+    try:
+        grad_model = tf.keras.Model(model.inputs, [feature_layer.output, model.output])
+    except (AttributeError, ValueError) as e:
+        raise ValueError(f"Cannot explain with layer '{feature_layer.name}': its output is not part of the "
+                         f"model's graph; set HOMECHECK_EXPLAIN_LAYER to a top-level layer ({e})") from e
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, *input_shape), dtype=tf.float32)])
+    def serve(batch):
+        with tf.GradientTape() as tape:
+            features, scores = grad_model(batch, training=False)
+            # Images are independent, so the gradient of the sum is each image's own gradient
+            top_scores = tf.reduce_max(scores, axis=-1)
+        gradients = tape.gradient(top_scores, features)
+        weights = tf.reduce_mean(gradients, axis=(1, 2))
+        cams = tf.nn.relu(tf.einsum('bhwc,bc->bhw', features, weights))
+        cams /= tf.reduce_max(cams, axis=(1, 2), keepdims=True) + 1e-8
+        return tf.reshape(cams, (tf.shape(cams)[0], -1))
+
+    def gradcam(batch):
+        return serve(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+    return gradcam
+
+
+def render_overlay(image, cam, size=448, alpha=0.5):
+    """PNG of the preprocessed photo (H x W x 3 uint8) with the Grad-CAM map blended over it"""
+    side = int(round(np.sqrt(cam.size)))
+    heat = Image.fromarray(np.uint8(np.clip(cam.reshape(side, side), 0.0, 1.0) * 255.0))
+    heat = np.asarray(heat.resize((size, size), Image.BILINEAR), dtype=np.float32) / 255.0
+    colors = np.stack([np.interp(heat, HEAT_STOPS, HEAT_COLORS[:, channel]) for channel in range(3)], axis=-1)
+    base = np.asarray(Image.fromarray(image).resize((size, size), Image.BILINEAR), dtype=np.float32)
+    # Cold areas stay close to the photo, hot areas take the heat colour
+    weight = (alpha * heat)[..., None]
+    blended = np.uint8(np.rint(base * (1.0 - weight) + colors * weight))
+    buffer = io.BytesIO()
+    Image.fromarray(blended).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class GradCamExplainer:
+    """Grad-CAM for any Keras model version, with concurrent requests batched per version.
+
+    Call `forget` when a model version is dropped so its traced function and batcher go with it.
+    """
+
+    def __init__(self, max_batch_size=4, max_wait_ms=10.0, layer_name=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.layer_name = layer_name
+        # id(model) -> (model, MicroBatcher); holding the model keeps its id from being reused
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def _batcher(self, model):
+        with self._lock:
+            entry = self._batchers.get(id(model))
+            if entry is None or entry[0] is not model:
+                batcher = MicroBatcher(make_gradcam_fn(model, self.layer_name),
+                                       max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms)
+                entry = self._batchers[id(model)] = (model, batcher)
+            return entry[1]
+
+    def explain(self, model, image):
+        """Grad-CAM map (h x w, in [0, 1]) of one preprocessed photo stored as H x W x 3 uint8"""
+        row = self._batcher(model).submit(image.astype(np.float32) / 255.0)
+        side = int(round(np.sqrt(row.size)))
+        return row.reshape(side, side)
+
+    def forget(self, model):
+        """Drop `model`'s batcher (queued explanations still run); True if it had one"""
+        with self._lock:
+            entry = self._batchers.get(id(model))
+            if entry is None or entry[0] is not model:
+                return False
+            del self._batchers[id(model)]
+        entry[1].stop()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return [batcher.stats() for _, batcher in self._batchers.values()]
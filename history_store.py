@@ -0,0 +1,231 @@
+"""Server-side inspection history for the HomeCheck Flask app (SQLite)"""
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    predicted_class TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    scores BLOB,  -- one uint8 per class (probability * 255), NULL for older rows
+    image_hash TEXT,  -- content hash of the photo, for explanations (NULL if not kept)
+    model_version TEXT  -- model version that scored it
+);
+CREATE INDEX IF NOT EXISTS idx_inspections_user_id ON inspections (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_inspections_user_timestamp ON inspections (user_id, timestamp);
+
+-- Running aggregates, kept in step with `inspections` by every write
+CREATE TABLE IF NOT EXISTS inspection_class_counts (
+    user_id TEXT NOT NULL,
+    predicted_class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, predicted_class)
+);
+CREATE TABLE IF NOT EXISTS inspection_daily_counts (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    predicted_class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, predicted_class)
+);
+"""
+
+REBUILD_AGGREGATES = """
+DELETE FROM inspection_class_counts;
+DELETE FROM inspection_daily_counts;
+INSERT INTO inspection_class_counts (user_id, predicted_class, count)
+    SELECT user_id, predicted_class, COUNT(*) FROM inspections GROUP BY user_id, predicted_class;
+INSERT INTO inspection_daily_counts (user_id, day, predicted_class, count)
+    SELECT user_id, substr(timestamp, 1, 10), predicted_class, COUNT(*) FROM inspections
+    GROUP BY user_id, substr(timestamp, 1, 10), predicted_class;
+"""
+
+
+def quantize_scores(scores):
+    """Probabilities -> one byte per class (resolution 1/255)"""
+    if scores is None:
+        return None
+    return np.rint(np.clip(np.asarray(scores, dtype=np.float32), 0.0, 1.0) * 255.0).astype(np.uint8).tobytes()
+
+
+def dequantize_scores(blob):
+    """Inverse of quantize_scores, rounded to 3 decimals"""
+    if blob is None:
+        return None
+    return [round(value / 255.0, 3) for value in blob]
+
+
+class HistoryStore:
+    """Append-only inspection history keyed by the browser's history id.
+
+    Each thread gets its own SQLite connection; WAL mode lets readers and the
+    writer from /predict work at the same time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(inspections)')}
+            if 'scores' not in columns:
+                conn.execute('ALTER TABLE inspections ADD COLUMN scores BLOB')
+            for column in ('image_hash', 'model_version'):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE inspections ADD COLUMN {column} TEXT')
+            # Databases created before the aggregate tables existed need a one-off backfill
+            has_rows = conn.execute('SELECT 1 FROM inspections LIMIT 1').fetchone()
+            has_counts = conn.execute('SELECT 1 FROM inspection_class_counts LIMIT 1').fetchone()
+            if has_rows and not has_counts:
+                conn.executescript(REBUILD_AGGREGATES)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _adjust_counts(conn, user_id, predicted_class, timestamp, delta):
+        """Add `delta` to the running class and per-day counts"""
+        conn.execute(
+            'INSERT INTO inspection_class_counts (user_id, predicted_class, count) VALUES (?, ?, ?) '
+            'ON CONFLICT (user_id, predicted_class) DO UPDATE SET count = count + excluded.count',
+            (user_id, predicted_class, delta))
+        conn.execute(
+            'INSERT INTO inspection_daily_counts (user_id, day, predicted_class, count) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (user_id, day, predicted_class) DO UPDATE SET count = count + excluded.count',
+            (user_id, timestamp[:10], predicted_class, delta))
+
+    @staticmethod
+    def _to_dict(row):
+        return {'id': row['id'], 'predicted_class': row['predicted_class'], 'timestamp': row['timestamp'],
+                'scores': dequantize_scores(row['scores'])}
+
+    # ===== WRITES =====
+
+    def append(self, user_id, result):
+        """Store one result and return its id"""
+        return self.append_many(user_id, [result])[-1]
+
+    def append_many(self, user_id, results):
+        """Store several results in one transaction and return their ids.
+
+        A result's optional 'scores' (class probabilities) are kept quantized to uint8;
+        its optional 'image_hash' and 'model_version' are kept for explanations.
+        """
+        conn = self._connect()
+        with conn:
+            ids = []
+            for result in results:
+                cursor = conn.execute(
+                    'INSERT INTO inspections (user_id, predicted_class, timestamp, scores, image_hash, model_version) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (user_id, result['predicted_class'], result['timestamp'], quantize_scores(result.get('scores')),
+                     result.get('image_hash'), result.get('model_version')))
+                ids.append(cursor.lastrowid)
+                self._adjust_counts(conn, user_id, result['predicted_class'], result['timestamp'], 1)
+        return ids
+
+    def delete(self, user_id, inspection_id):
+        """Delete one inspection; returns True if it existed"""
+        conn = self._connect()
+        with conn:
+            row = conn.execute('SELECT predicted_class, timestamp FROM inspections WHERE user_id = ? AND id = ?',
+                               (user_id, inspection_id)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM inspections WHERE id = ?', (inspection_id,))
+            self._adjust_counts(conn, user_id, row['predicted_class'], row['timestamp'], -1)
+        return True
+
+    def clear(self, user_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM inspections WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM inspection_class_counts WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM inspection_daily_counts WHERE user_id = ?', (user_id,))
+
+    # ===== READS =====
+
+    def get(self, user_id, inspection_id):
+        row = self._connect().execute(
+            'SELECT id, predicted_class, timestamp, scores FROM inspections WHERE user_id = ? AND id = ?',
+            (user_id, inspection_id)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def explain_source(self, user_id, inspection_id):
+        """(image_hash, model_version) of one inspection, or None if it does not exist"""
+        row = self._connect().execute(
+            'SELECT image_hash, model_version FROM inspections WHERE user_id = ? AND id = ?',
+            (user_id, inspection_id)).fetchone()
+        return (row['image_hash'], row['model_version']) if row else None
+
+    def count(self, user_id):
+        return sum(self.class_counts(user_id).values())
+
+    def class_counts(self, user_id):
+        """{predicted_class: count} for one user, read from the running aggregates"""
+        rows = self._connect().execute(
+            'SELECT predicted_class, count FROM inspection_class_counts WHERE user_id = ? AND count > 0',
+            (user_id,))
+        return {row['predicted_class']: row['count'] for row in rows}
+
+    def class_counts_since(self, user_id, days):
+        """{predicted_class: count} over the last `days` calendar days (including today)"""
+        first_day = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        rows = self._connect().execute(
+            'SELECT predicted_class, SUM(count) AS n FROM inspection_daily_counts '
+            'WHERE user_id = ? AND day >= ? GROUP BY predicted_class HAVING n > 0',
+            (user_id, first_day))
+        return {row['predicted_class']: row['n'] for row in rows}
+
+    def time_range(self, user_id):
+        """(first, last) inspection timestamps, both None when there is no history"""
+        conn = self._connect()
+        first = conn.execute('SELECT MIN(timestamp) FROM inspections WHERE user_id = ?', (user_id,)).fetchone()[0]
+        last = conn.execute('SELECT MAX(timestamp) FROM inspections WHERE user_id = ?', (user_id,)).fetchone()[0]
+        return first, last
+
+    def page(self, user_id, page=1, per_page=20):
+        """One page of results, newest first"""
+        offset = (max(1, page) - 1) * per_page
+        rows = self._connect().execute(
+            'SELECT id, predicted_class, timestamp, scores FROM inspections WHERE user_id = ? '
+            'ORDER BY id DESC LIMIT ? OFFSET ?', (user_id, per_page, offset))
+        return [self._to_dict(row) for row in rows]
+
+    def recent(self, user_id, limit=5):
+        """The last `limit` results, oldest first"""
+        return list(reversed(self.page(user_id, 1, limit)))
+
+    def iter_all(self, user_id, start_date=None, end_date=None, classes=None):
+        """Every result for one user, oldest first, without loading them all at once.
+
+        `start_date` / `end_date` are inclusive 'YYYY-MM-DD' strings and `classes`
+        limits the results to those predicted classes.
+        """
+        query = 'SELECT id, predicted_class, timestamp, scores FROM inspections WHERE user_id = ?'
+        params = [user_id]
+        if start_date:
+            query += ' AND timestamp >= ?'
+            params.append(start_date)
+        if end_date:
+            next_day = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+            query += ' AND timestamp < ?'
+            params.append(next_day.strftime('%Y-%m-%d'))
+        if classes:
+            query += f" AND predicted_class IN ({', '.join('?' * len(classes))})"
+            params.extend(classes)
+
+        cursor = self._connect().execute(query + ' ORDER BY id', params)
+        for row in cursor:
+            yield self._to_dict(row)
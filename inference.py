@@ -0,0 +1,532 @@
+"""Model inference helpers used by the HomeCheck Flask app"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image, ImageOps
+
+MODEL_INPUT_SHAPE = (224, 224, 3)
+
+# Define your class names (matching your cottage inspection theme)
+CLASS_NAMES = ["Algae", "Major Crack", "Minor Crack", "Normal", "Peeling", "Spalling", "Stain"]
+
+def preprocess_image(image, out=None):
+    """Turn a freshly opened PIL image into a 1 x 224 x 224 x 3 float32 batch scaled to [0, 1].
+
+    JPEGs are decoded at a reduced scale (draft mode) when the photo is much larger
+    than the model input, EXIF orientation is applied, and the pixels are written
+    straight into `out` (a preallocated 1 x 224 x 224 x 3 float32 array) if given.
+    """
+    height, width = MODEL_INPUT_SHAPE[:2]
+
+    # Only has an effect before the image is loaded, and only for JPEGs
+    image.draft('RGB', (width, height))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((width, height), Image.BILINEAR, reducing_gap=3.0)
+
+    if out is None:
+        out = np.empty((1, height, width, 3), dtype=np.float32)
+    np.multiply(np.asarray(image), 1.0 / 255.0, out=out[0], casting='unsafe')
+    return out
+
+# ===== TILED INFERENCE =====
+
+def _tile_offsets(length, tile_size, stride):
+    """Start offsets of tiles along one axis; the last tile is aligned with the far edge"""
+    if length <= tile_size:
+        return [0]
+    return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+def tile_grid(width, height, tile_size=224, stride=168, max_tiles=16):
+    """Scale factor and (rows, cols) of the tile grid for a width x height photo.
+
+    The photo is shrunk (never below one tile on its short side) until the grid has
+    at most `max_tiles` tiles, so the model cost per photo is bounded.
+    """
+    min_scale = tile_size / min(width, height)
+    scale = max(1.0, min_scale)
+    while True:
+        rows = len(_tile_offsets(round(height * scale), tile_size, stride))
+        cols = len(_tile_offsets(round(width * scale), tile_size, stride))
+        if rows * cols <= max_tiles or scale <= min_scale:
+            return scale, rows, cols
+        scale = max(scale * 0.9, min_scale)
+
+def tile_image(image, tile_size=224, stride=168, max_tiles=16):
+    """Cut a freshly opened photo into overlapping square tiles as one N x 224 x 224 x 3 float32 batch.
+
+    Tiles are `tile_size` pixels of the (possibly shrunk) photo, `stride` pixels apart,
+    and are resized to the model input if `tile_size` differs from it. Returns
+    (batch, rows, cols, scale); batch rows are in row-major grid order.
+    """
+    height, width = MODEL_INPUT_SHAPE[:2]
+    # Size the grid before decoding so JPEGs can be decoded at a reduced scale (draft mode)
+    scale, _, _ = tile_grid(image.width, image.height, tile_size, stride, max_tiles)
+    size = (round(image.width * scale), round(image.height * scale))
+    image.draft('RGB', size)
+    if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # EXIF orientation swaps width and height
+        size = size[::-1]
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR, reducing_gap=3.0)
+    pixels = np.asarray(image)
+
+    ys = _tile_offsets(size[1], tile_size, stride)
+    xs = _tile_offsets(size[0], tile_size, stride)
+    if len(ys) * len(xs) > max_tiles:
+        # Extreme aspect ratios: spread max_tiles evenly along the long side instead
+        count = max(1, max_tiles // min(len(ys), len(xs)))
+        if len(xs) > len(ys):
+            xs = [round(x) for x in np.linspace(0, size[0] - tile_size, count)]
+        else:
+            ys = [round(y) for y in np.linspace(0, size[1] - tile_size, count)]
+
+    batch = np.empty((len(ys) * len(xs), height, width, 3), dtype=np.float32)
+    for i, (y, x) in enumerate((y, x) for y in ys for x in xs):
+        tile = pixels[y:y + tile_size, x:x + tile_size]
+        if tile_size != width:
+            tile = np.asarray(Image.fromarray(tile).resize((width, height), Image.BILINEAR))
+        np.multiply(tile, 1.0 / 255.0, out=batch[i], casting='unsafe')
+    return batch, len(ys), len(xs), scale
+
+def aggregate_tile_scores(tile_scores):
+    """Image-level scores from per-tile scores: a defect seen on any tile counts, Normal must hold on all"""
+    tile_scores = np.asarray(tile_scores, dtype=np.float32)
+    normal = CLASS_NAMES.index('Normal')
+    combined = tile_scores.max(axis=0)
+    combined[normal] = tile_scores[:, normal].min()
+    return combined / combined.sum()
+
+# ===== CALIBRATION =====
+
+def load_temperature(path):
+    """Softmax temperature fitted by calibrate_temperature.py; 1.0 (no scaling) if the file is missing"""
+    if not path or not os.path.exists(path):
+        return 1.0
+    with open(path) as f:
+        return float(json.load(f)['temperature'])
+
+def calibrate_scores(scores, temperature=1.0):
+    """Temperature-scale softmax outputs (one row or a batch) and renormalise them"""
+    scores = np.asarray(scores, dtype=np.float32)
+    if temperature == 1.0:
+        return scores
+    logits = np.log(np.clip(scores, 1e-7, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+def top_k_predictions(probabilities, k):
+    """The `k` most likely classes, best first, as the inspection page displays them"""
+    ranked = np.argsort(-np.asarray(probabilities), kind='stable')[:k]
+    return [{'class_name': CLASS_NAMES[i],
+             'probability': round(float(probabilities[i]), 4),
+             'percentage': round(float(probabilities[i]) * 100.0, 1)}
+            for i in ranked]
+
+# ===== COMPILED INFERENCE =====
+
+def embedding_model(model, layer_name=None):
+    """Keras model returning (class scores, embedding) for the same input in one pass.
+
+    The embedding is the input of the final layer (the backbone's pooled features for
+    a Dense head), or the output of `layer_name`; spatial feature maps are averaged.
+    """
+    import tensorflow as tf
+
+    features = model.get_layer(layer_name).output if layer_name else model.layers[-1].input
+    if len(features.shape) == 4:
+        features = tf.keras.layers.GlobalAveragePooling2D()(features)
+    elif len(features.shape) > 2:
+        features = tf.keras.layers.Flatten()(features)
+    return tf.keras.Model(model.inputs, [model.outputs[0], features])
+
+def split_embedding(rows):
+    """Split infer_fn output rows into (class scores, embedding); the embedding is empty if the model has none"""
+    return rows[..., :len(CLASS_NAMES)], rows[..., len(CLASS_NAMES):]
+
+def make_inference_fn(model, input_shape=MODEL_INPUT_SHAPE, with_embedding=False, embedding_layer=None):
+    """Wrap a Keras model in a traced tf.function with a fixed input signature.
+
+    Unlike `model.predict`, calling the returned function does not build a tf.data
+    pipeline or progress-bar callback per request. It takes a numpy batch
+    (N x H x W x C) and returns a numpy array of class scores. With `with_embedding`
+    each row is followed by the image's embedding (see split_embedding).
+    """
+    import tensorflow as tf
+
+    if with_embedding:
+        model = embedding_model(model, embedding_layer)
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, *input_shape), dtype=tf.float32)])
+    def serve(batch):
+        if with_embedding:
+            scores, features = model(batch, training=False)
+            return tf.concat([scores, tf.cast(features, scores.dtype)], axis=-1)
+        return model(batch, training=False)
+
+    def infer(batch):
+        return serve(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+    return infer
+
+# ===== TFLITE BACKEND =====
+
+def _tflite_interpreter_class():
+    """Prefer the small tflite-runtime package, fall back to the interpreter bundled with TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+def make_tflite_inference_fn(model_path, num_threads=None):
+    """Serve a converted .tflite model with the same call contract as `make_inference_fn`.
+
+    The default CPU op resolver applies the XNNPACK delegate, which uses `num_threads`.
+    Float16 and dynamic-range models keep float32 inputs and outputs; full-integer models
+    are quantized/dequantized here using the tensor's scale and zero point.
+    """
+    interpreter = _tflite_interpreter_class()(model_path=model_path, num_threads=num_threads)
+    input_detail = interpreter.get_input_details()[0]
+    output_index = interpreter.get_output_details()[0]['index']
+    lock = threading.Lock()
+    state = {'batch_size': None}
+
+    def infer(batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        input_scale, input_zero_point = input_detail['quantization']
+        if input_detail['dtype'] != np.float32:
+            batch = np.round(batch / input_scale + input_zero_point).astype(input_detail['dtype'])
+
+        # The interpreter holds its tensors in place, so one call at a time
+        with lock:
+            if state['batch_size'] != len(batch):
+                interpreter.resize_tensor_input(input_detail['index'], [len(batch), *batch.shape[1:]])
+                interpreter.allocate_tensors()
+                state['batch_size'] = len(batch)
+            interpreter.set_tensor(input_detail['index'], batch)
+            interpreter.invoke()
+            output = interpreter.get_tensor(output_index).copy()
+            output_detail = interpreter.get_output_details()[0]
+
+        if output_detail['dtype'] != np.float32:
+            output_scale, output_zero_point = output_detail['quantization']
+            output = (output.astype(np.float32) - output_zero_point) * output_scale
+        return output
+
+    return infer
+
+def warm_up(infer_fn, batch_sizes=(1,), input_shape=MODEL_INPUT_SHAPE):
+    """Run dummy batches through `infer_fn` so tracing and allocation happen before traffic arrives"""
+    started = time.perf_counter()
+    for batch_size in sorted(set(batch_sizes)):
+        infer_fn(np.zeros((batch_size, *input_shape), dtype=np.float32))
+    return time.perf_counter() - started
+
+_custom_objects_registered = False
+
+def register_custom_objects():
+    """Register the custom objects model.keras was trained with (imports TensorFlow)"""
+    global _custom_objects_registered
+    if _custom_objects_registered:
+        return
+
+    import tensorflow as tf
+    from tensorflow.keras.utils import register_keras_serializable
+
+    # Define your custom focal loss function
+    @register_keras_serializable()
+    def focal_loss_fn(y_true, y_pred, gamma=2.0, alpha=0.25):
+        epsilon = tf.keras.backend.epsilon()
+        y_pred = tf.clip_by_value(y_pred, epsilon, 1.0 - epsilon)
+        cross_entropy = -y_true * tf.math.log(y_pred)
+        weight = alpha * y_true * tf.math.pow(1 - y_pred, gamma)
+        loss = weight * cross_entropy
+        loss = tf.reduce_sum(loss, axis=-1)
+        return tf.reduce_mean(loss)
+
+    _custom_objects_registered = True
+
+def load_inference_fn(backend, model_path, tflite_threads=None, with_embedding=False, embedding_layer=None):
+    """Load the model served by `backend` ('keras' or 'tflite') and return (keras_model, infer_fn).
+
+    `keras_model` is None for the TFLite backend. `with_embedding` only applies to
+    Keras models; TFLite rows never carry an embedding.
+    """
+    if backend == 'tflite':
+        return None, make_tflite_inference_fn(model_path, num_threads=tflite_threads)
+    if backend == 'keras':
+        import tensorflow as tf
+        register_custom_objects()
+        model = tf.keras.models.load_model(model_path, compile=False)
+        return model, make_inference_fn(model, with_embedding=with_embedding, embedding_layer=embedding_layer)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+# ===== BACKGROUND LOADING =====
+
+class ModelLoader:
+    """Loads the model once in a background thread so the web app can start serving immediately.
+
+    `load_fn` returns (model, infer_fn). `ready` turns True once it has returned.
+    """
+
+    def __init__(self, load_fn):
+        self._load_fn = load_fn
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.model = None
+        self.infer = None
+        self.error = None
+        self.load_seconds = None
+
+    def start(self):
+        """Begin loading if it has not started yet"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='homecheck-model-loader', daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self.model, self.infer = self._load_fn()
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            self.load_seconds = time.perf_counter() - started
+            self._loaded.set()
+
+    @property
+    def ready(self):
+        return self._loaded.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """Start loading if needed and wait up to `timeout` seconds; True once the model is usable"""
+        self.start()
+        self._loaded.wait(timeout)
+        return self.ready
+
+    def status(self):
+        if self._thread is None:
+            state = 'not_started'
+        elif not self._loaded.is_set():
+            state = 'loading'
+        else:
+            state = 'failed' if self.error else 'ready'
+        return {
+            'state': state,
+            'error': self.error,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+# ===== MICRO-BATCHING =====
+
+class MicroBatcher:
+    """Queue single images from concurrent requests and run them through the model as one batch.
+
+    A batch is flushed as soon as `max_batch_size` images are waiting or the oldest
+    queued image has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._images = 0
+        self._last_batch_size = 0
+        self._largest_batch_size = 0
+
+    def submit(self, image):
+        """Queue one preprocessed image (H x W x C) and block until its score row is ready"""
+        return self.submit_async(image).result()
+
+    def submit_async(self, image):
+        """Queue one preprocessed image and return a Future for its score row"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='homecheck-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for the first image, then gather more until the batch is full or the deadline passes.
+
+        Returns None once `stop` has been called and everything queued before it has been collected.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # run this batch first, stop on the next collect
+                break
+            pending.append(item)
+        return pending
+
+    def stop(self):
+        """Let the worker thread exit after the images already queued have been run"""
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if pending is None:
+                return
+            # Skip requests whose caller already gave up
+            pending = [(image, future) for image, future in pending if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+
+            try:
+                batch = np.stack([image for image, _ in pending])
+                scores = np.asarray(self.predict_fn(batch))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            for row, (_, future) in zip(scores, pending):
+                future.set_result(row)
+
+            with self._lock:
+                self._batches += 1
+                self._images += len(pending)
+                self._last_batch_size = len(pending)
+                self._largest_batch_size = max(self._largest_batch_size, len(pending))
+
+    def pending(self):
+        """Images waiting for the next batch"""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Current queue depth and achieved batch sizes"""
+        with self._lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'batches_run': self._batches,
+                'images_run': self._images,
+                'last_batch_size': self._last_batch_size,
+                'largest_batch_size': self._largest_batch_size,
+                'average_batch_size': round(self._images / self._batches, 2) if self._batches else 0.0,
+            }
+
+# ===== PREDICTION CACHE =====
+
+def model_fingerprint(path):
+    """Cheap identifier for a model file that changes whenever the file is replaced"""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+class PredictionCache:
+    """LRU cache of model scores (or other arrays and bytes) keyed by a hash of the uploaded image bytes.
+
+    Entries expire after `ttl_seconds`, the cache never holds more than `max_entries`
+    entries or `max_bytes` of values, and everything is dropped when the model changes.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = float(ttl_seconds)
+        self.model_version = None
+        self._entries = OrderedDict()  # key -> (expires_at, nbytes, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(image_bytes):
+        """Content hash of the raw image bytes"""
+        return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+    def set_model_version(self, version):
+        """Record the version of the model being served, clearing the cache if it changed"""
+        with self._lock:
+            if version != self.model_version:
+                self._entries.clear()
+                self._bytes = 0
+                self.model_version = version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        nbytes = (len(value) if isinstance(value, bytes) else getattr(value, 'nbytes', 0)) + len(key)
+        if self.max_entries == 0 or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, nbytes, value)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'model_version': self.model_version,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
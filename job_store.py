@@ -0,0 +1,127 @@
+"""In-memory store for asynchronous prediction jobs (POST /jobs)"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATES = (DONE, FAILED)
+
+
+class JobStoreFull(Exception):
+    """Raised when every slot holds an unfinished job"""
+
+
+class JobStore:
+    """Bounded job table: at most `max_jobs` entries, finished jobs expire after `ttl` seconds.
+
+    When the table is full the oldest finished job is evicted first; if every job
+    is still pending or running, `create` raises JobStoreFull so callers can shed load.
+    """
+
+    def __init__(self, max_jobs=256, ttl=300.0):
+        self.max_jobs = max(1, int(max_jobs))
+        self.ttl = ttl
+        self._jobs = OrderedDict()  # job_id -> dict, oldest first
+        self._changed = threading.Condition()
+        self._created = 0
+        self._expired = 0
+        self._rejected = 0
+
+    def _purge(self, now):
+        """Drop expired finished jobs, then the oldest finished ones while over capacity"""
+        for job_id, job in list(self._jobs.items()):
+            if job['status'] in FINISHED_STATES and now - job['finished_at'] > self.ttl:
+                del self._jobs[job_id]
+                self._expired += 1
+        if len(self._jobs) >= self.max_jobs:
+            for job_id, job in list(self._jobs.items()):
+                if job['status'] in FINISHED_STATES:
+                    del self._jobs[job_id]
+                    self._expired += 1
+                    if len(self._jobs) < self.max_jobs:
+                        break
+
+    def create(self, owner):
+        """Register a new pending job for `owner` and return its id"""
+        now = time.monotonic()
+        with self._changed:
+            self._purge(now)
+            if len(self._jobs) >= self.max_jobs:
+                self._rejected += 1
+                raise JobStoreFull()
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'owner': owner,
+                'status': PENDING,
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'finished_at': None,
+            }
+            self._created += 1
+        return job_id
+
+    def start(self, job_id):
+        self._update(job_id, status=RUNNING)
+
+    def finish(self, job_id, result):
+        self._update(job_id, status=DONE, result=result, finished_at=time.monotonic())
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=FAILED, error=error, finished_at=time.monotonic())
+
+    def _update(self, job_id, **changes):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(changes)
+            self._changed.notify_all()
+
+    def get(self, job_id, owner):
+        """Public view of a job, or None if it does not exist, expired or belongs to someone else"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job['owner'] != owner:
+                return None
+            return self._view(job_id, job)
+
+    def wait(self, job_id, owner, timeout):
+        """Block until the job finishes or `timeout` passes, then return its view (None if gone)"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job['owner'] != owner:
+                    return None
+                remaining = deadline - time.monotonic()
+                if job['status'] in FINISHED_STATES or remaining <= 0:
+                    return self._view(job_id, job)
+                self._changed.wait(remaining)
+
+    @staticmethod
+    def _view(job_id, job):
+        view = {'job_id': job_id, 'status': job['status']}
+        if job['status'] == DONE:
+            view['result'] = job['result']
+        elif job['status'] == FAILED:
+            view['error'] = job['error']
+        return view
+
+    def stats(self):
+        with self._changed:
+            states = [job['status'] for job in self._jobs.values()]
+            return {
+                'max_jobs': self.max_jobs,
+                'ttl_seconds': self.ttl,
+                'jobs': len(states),
+                'pending': states.count(PENDING),
+                'running': states.count(RUNNING),
+                'finished': sum(state in FINISHED_STATES for state in states),
+                'created': self._created,
+                'expired': self._expired,
+                'rejected': self._rejected,
+            }
@@ -0,0 +1,149 @@
+"""Per-stream state for live video scanning (POST /live/<stream_id>/frame)"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from inference import CLASS_NAMES
+
+
+class LiveScanStore:
+    """Frame sampling, backpressure and temporal smoothing for live camera streams.
+
+    A frame is kept only if the stream's previous frame has finished and at least
+    1 / `sample_fps` seconds have passed since the last kept frame; everything else
+    is dropped straight away rather than queued. Kept scores are folded into an
+    exponential moving average (`smoothing` is the weight of the history), whose
+    argmax is the live label. The last kept frame and the model version that scored
+    it are remembered, so the saved inspection can be explained like any other.
+    """
+
+    def __init__(self, sample_fps=4.0, smoothing=0.6, max_streams=64, idle_timeout=60.0):
+        self.sample_interval = 1.0 / max(0.1, float(sample_fps))
+        self.smoothing = min(max(float(smoothing), 0.0), 0.99)
+        self.max_streams = max(1, int(max_streams))
+        self.idle_timeout = idle_timeout
+        self._streams = OrderedDict()  # stream_id -> dict, least recently used first
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        """Forget idle streams, then the least recently used ones while over capacity"""
+        for stream_id, stream in list(self._streams.items()):
+            if now - stream['last_seen'] > self.idle_timeout:
+                del self._streams[stream_id]
+        while len(self._streams) >= self.max_streams:
+            self._streams.popitem(last=False)
+
+    def open(self, owner):
+        """Start a new stream for `owner` and return its id"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            stream_id = uuid.uuid4().hex
+            self._streams[stream_id] = {
+                'owner': owner,
+                'last_seen': now,
+                'last_kept': None,
+                'in_flight': False,
+                'smoothed': None,
+                'label': None,
+                'stable_frames': 0,
+                'frames_kept': 0,
+                'frames_sampled_out': 0,
+                'frames_dropped_busy': 0,
+                'model_version': None,
+                'last_frame': None,
+            }
+        return stream_id
+
+    def _stream(self, stream_id, owner):
+        stream = self._streams.get(stream_id)
+        if stream is None or stream['owner'] != owner:
+            return None
+        stream['last_seen'] = time.monotonic()
+        self._streams.move_to_end(stream_id)
+        return stream
+
+    def admit(self, stream_id, owner, busy=False):
+        """Decide what to do with an incoming frame: 'keep', 'sampled' or 'busy' (None if no such stream).
+
+        `busy` lets the caller drop frames when the shared model queue is already backed up.
+        A 'keep' answer must be followed by `update` (or `update` with None on failure).
+        """
+        now = time.monotonic()
+        with self._lock:
+            stream = self._stream(stream_id, owner)
+            if stream is None:
+                return None
+            if stream['in_flight'] or busy:
+                stream['frames_dropped_busy'] += 1
+                return 'busy'
+            if stream['last_kept'] is not None and now - stream['last_kept'] < self.sample_interval:
+                stream['frames_sampled_out'] += 1
+                return 'sampled'
+            stream['in_flight'] = True
+            stream['last_kept'] = now
+            return 'keep'
+
+    def update(self, stream_id, scores, model_version=None, frame=None):
+        """Fold one score row into the stream's moving average and release its in-flight slot.
+
+        `frame` is whatever the caller wants back from `close` for the last kept frame.
+        """
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return
+            stream['in_flight'] = False
+            if scores is None:
+                return
+            scores = np.asarray(scores, dtype=np.float32)
+            if stream['smoothed'] is None:
+                stream['smoothed'] = scores
+            else:
+                stream['smoothed'] = self.smoothing * stream['smoothed'] + (1.0 - self.smoothing) * scores
+            label = CLASS_NAMES[int(np.argmax(stream['smoothed']))]
+            stream['stable_frames'] = stream['stable_frames'] + 1 if label == stream['label'] else 1
+            stream['label'] = label
+            stream['frames_kept'] += 1
+            stream['model_version'] = model_version
+            stream['last_frame'] = frame
+
+    def view(self, stream_id, owner):
+        """Current live label and counters for one stream (None if it does not exist)"""
+        with self._lock:
+            stream = self._stream(stream_id, owner)
+            if stream is None:
+                return None
+            smoothed = stream['smoothed']
+            return {
+                'stream_id': stream_id,
+                'label': stream['label'],
+                'stable_frames': stream['stable_frames'],
+                'scores': ({name: round(float(score), 4) for name, score in zip(CLASS_NAMES, smoothed)}
+                           if smoothed is not None else None),
+                'frames_kept': stream['frames_kept'],
+                'frames_sampled_out': stream['frames_sampled_out'],
+                'frames_dropped_busy': stream['frames_dropped_busy'],
+                'model_version': stream['model_version'],
+            }
+
+    def close(self, stream_id, owner):
+        """End a stream and return (final view, last kept frame); (None, None) if it does not exist"""
+        view = self.view(stream_id, owner)
+        if view is None:
+            return None, None
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        return view, stream['last_frame'] if stream is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'max_streams': self.max_streams,
+                'sample_interval_ms': round(self.sample_interval * 1000.0, 1),
+                'smoothing': self.smoothing,
+            }
@@ -0,0 +1,199 @@
+"""Registry of model versions for the HomeCheck Flask app: hot-swap and A/B or shadow serving"""
+import hashlib
+import json
+import random
+import threading
+import time
+
+from inference import MicroBatcher, ModelLoader, load_inference_fn, model_fingerprint, warm_up
+
+ROUTING_MODES = ('ab', 'shadow')
+
+
+class ModelVersion:
+    """One loaded model: its background loader and its own micro-batcher"""
+
+    def __init__(self, name, load_fn, path=None, backend=None, max_batch_size=8, max_wait_ms=5.0, on_batch=None):
+        self.name = name
+        self.path = path
+        self.backend = backend
+        self.loader = ModelLoader(load_fn)
+        self.batcher = MicroBatcher(self._infer, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.registered_at = time.time()
+        self._on_batch = on_batch
+
+    def _infer(self, batch):
+        started = time.perf_counter()
+        scores = self.loader.infer(batch)
+        if self._on_batch is not None:
+            self._on_batch(self.name, len(batch), time.perf_counter() - started)
+        return scores
+
+    def run(self, batch):
+        """Run a preprocessed batch straight through this model (no micro-batching); rows as from infer_fn"""
+        return self._infer(batch)
+
+    def fingerprint(self):
+        """Changes whenever the model file behind this version is replaced"""
+        try:
+            return f"{self.name}:{model_fingerprint(self.path)}" if self.path else self.name
+        except OSError:
+            return self.name
+
+    def status(self):
+        return dict(self.loader.status(), name=self.name, backend=self.backend, path=self.path,
+                    batcher=self.batcher.stats())
+
+
+class ModelRegistry:
+    """Holds several model versions, the active one and an optional candidate.
+
+    Swapping the active version only replaces a reference under a lock: requests that
+    already picked a version finish on it, and a removed version's batcher drains its
+    queue before its worker exits. The candidate receives `percent` of the traffic,
+    either serving it ('ab') or scoring it in the background next to the active
+    version without affecting the response ('shadow').
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=5.0, on_batch=None, on_remove=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._on_batch = on_batch
+        self._on_remove = on_remove  # called with each removed ModelVersion
+        self._versions = {}
+        self._active = None
+        self._candidate = None  # (name, percent, mode)
+        self._lock = threading.Lock()
+
+    def register(self, name, load_fn, path=None, backend=None, start=True):
+        """Add a version and (by default) start loading it in the background"""
+        version = ModelVersion(name, load_fn, path=path, backend=backend, max_batch_size=self.max_batch_size,
+                               max_wait_ms=self.max_wait_ms, on_batch=self._on_batch)
+        with self._lock:
+            if name in self._versions:
+                raise ValueError(f"Model version '{name}' is already registered")
+            self._versions[name] = version
+            if self._active is None:
+                self._active = version
+        if start:
+            version.loader.start()
+        return version
+
+    def get(self, name):
+        with self._lock:
+            version = self._versions.get(name)
+        if version is None:
+            raise KeyError(f"Unknown model version: {name}")
+        return version
+
+    def active(self):
+        with self._lock:
+            return self._active
+
+    def activate(self, name, timeout=None):
+        """Make `name` the active version once it has loaded; returns the version it replaced"""
+        version = self.get(name)
+        if not version.loader.wait(timeout):
+            raise RuntimeError(f"Model version '{name}' is not ready: {version.loader.status()['state']}")
+        with self._lock:
+            previous, self._active = self._active, version
+            if self._candidate is not None and self._candidate[0] == name:
+                self._candidate = None
+        return previous
+
+    def set_candidate(self, name, percent, mode='ab'):
+        """Route `percent` (0-100) of traffic to `name`; `name=None` or `percent=0` stops routing"""
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode '{mode}', use one of: {', '.join(ROUTING_MODES)}")
+        percent = min(max(float(percent), 0.0), 100.0)
+        if name is None or percent == 0:
+            with self._lock:
+                self._candidate = None
+            return
+        version = self.get(name)
+        version.loader.start()
+        with self._lock:
+            if version is self._active:
+                raise ValueError(f"Model version '{name}' is already active")
+            self._candidate = (name, percent, mode)
+
+    def remove(self, name):
+        """Forget a version that is neither active nor the candidate; queued images still run"""
+        with self._lock:
+            version = self._versions.get(name)
+            if version is None:
+                raise KeyError(f"Unknown model version: {name}")
+            if version is self._active or (self._candidate and self._candidate[0] == name):
+                raise ValueError(f"Model version '{name}' is in use")
+            del self._versions[name]
+        version.batcher.stop()
+        if self._on_remove is not None:
+            self._on_remove(version)
+
+    def route(self, key=None):
+        """(serving version, shadow version or None) for one request.
+
+        With a `key` (e.g. the browser's history id) the same caller always lands in the
+        same bucket, so an A/B user does not flip between models. A candidate that has not
+        finished loading gets no traffic.
+        """
+        with self._lock:
+            active, candidate = self._active, self._candidate
+            candidate_version = self._versions.get(candidate[0]) if candidate else None
+        if candidate_version is None or not candidate_version.loader.ready:
+            return active, None
+
+        _, percent, mode = candidate
+        if key is None:
+            bucket = random.random() * 100.0
+        else:
+            bucket = int.from_bytes(hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest(), 'big') % 10000 / 100.0
+        if bucket >= percent:
+            return active, None
+        if mode == 'shadow':
+            return active, candidate_version
+        return candidate_version, None
+
+    def wait(self, timeout=None):
+        """Wait for the active version to load; True once it is usable"""
+        return self.active().loader.wait(timeout)
+
+    def fingerprint(self):
+        """Identifies the active model and the candidate; changes on a swap or a replaced model file"""
+        with self._lock:
+            versions = [self._active] + ([self._versions[self._candidate[0]]] if self._candidate else [])
+        return '|'.join(version.fingerprint() for version in versions)
+
+    def status(self):
+        with self._lock:
+            versions = list(self._versions.values())
+            active, candidate = self._active, self._candidate
+        return {
+            'active': active.name if active else None,
+            'candidate': dict(zip(('name', 'percent', 'mode'), candidate)) if candidate else None,
+            'versions': [version.status() for version in versions],
+        }
+
+
+def make_load_fn(backend, path, tflite_threads=None, warm_up_sizes=(1,), with_embedding=False, embedding_layer=None):
+    """`load_fn` for ModelRegistry.register that loads and warms up one model file"""
+    def load():
+        model, infer = load_inference_fn(backend, path, tflite_threads=tflite_threads,
+                                         with_embedding=with_embedding, embedding_layer=embedding_layer)
+        warm_up(infer, batch_sizes=warm_up_sizes)
+        return model, infer
+    return load
+
+
+def load_registry_file(path):
+    """Versions and routing from a JSON file:
+
+        {"versions": {"mobilenet-v2": {"backend": "keras", "path": "model.keras"}, ...},
+         "active": "mobilenet-v2",
+         "candidate": {"name": "efficientnet", "percent": 10, "mode": "shadow"}}
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    if not config.get('versions'):
+        raise ValueError(f"{path} does not define any model versions")
+    return config
@@ -0,0 +1,219 @@
+"""Standalone model server: a pool of inference worker processes shared by all web workers.
+
+Usage:
+    python model_server.py --workers 2 --intra-op-threads 2 --inter-op-threads 1
+
+Then start the web tier with HOMECHECK_MODEL_SERVER=127.0.0.1:6001 so Flask workers
+send their batches here instead of loading their own copy of the model.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.managers import BaseManager
+
+from inference import load_inference_fn, warm_up
+
+DEFAULT_ADDRESS = '127.0.0.1:6001'
+DEFAULT_AUTHKEY = 'homecheck'
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+# ===== WORKER PROCESSES =====
+
+def _worker_main(worker_id, backend, model_path, tflite_threads, intra_op_threads, inter_op_threads,
+                 warm_up_sizes, requests, responses):
+    """Load one copy of the model and answer (job_id, batch) requests until told to stop"""
+    if backend == 'keras':
+        import tensorflow as tf
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    try:
+        _, infer = load_inference_fn(backend, model_path, tflite_threads=tflite_threads)
+        warm_up(infer, batch_sizes=warm_up_sizes)
+    except Exception as e:
+        responses.put(('failed', worker_id, repr(e)))
+        return
+    responses.put(('ready', worker_id, None))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        job_id, batch = item
+        try:
+            responses.put((job_id, infer(batch), None))
+        except Exception as e:
+            responses.put((job_id, None, repr(e)))
+
+
+class InferencePool:
+    """Fixed pool of processes, each holding one model copy, fed from a shared request queue"""
+
+    def __init__(self, num_workers=1, backend='keras', model_path='model.keras', tflite_threads=None,
+                 intra_op_threads=0, inter_op_threads=0, warm_up_sizes=(1,), timeout=30.0):
+        self.num_workers = max(1, int(num_workers))
+        self.backend = backend
+        self.model_path = model_path
+        self.timeout = timeout
+        # Spawn so workers never inherit a half-initialised TensorFlow runtime
+        context = multiprocessing.get_context('spawn')
+        self._requests = context.Queue()
+        self._responses = context.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready = 0
+        self._failed = []
+        self._jobs = 0
+        self._started_at = time.monotonic()
+        self._processes = [
+            context.Process(target=_worker_main, name=f'homecheck-model-{i}', daemon=True,
+                            args=(i, backend, model_path, tflite_threads, intra_op_threads,
+                                  inter_op_threads, tuple(warm_up_sizes), self._requests, self._responses))
+            for i in range(self.num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._dispatcher = threading.Thread(target=self._dispatch, name='homecheck-model-dispatch', daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        """Hand each worker response to the caller waiting for it"""
+        while True:
+            job_id, scores, error = self._responses.get()
+            if job_id in ('ready', 'failed'):
+                with self._lock:
+                    if job_id == 'ready':
+                        self._ready += 1
+                    else:
+                        self._failed.append(error)
+                continue
+            with self._lock:
+                future = self._pending.pop(job_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(scores)
+
+    def infer(self, batch):
+        """Run a batch on whichever worker is free; same contract as `make_inference_fn`"""
+        future = Future()
+        with self._lock:
+            job_id = next(self._ids)
+            self._pending[job_id] = future
+            self._jobs += 1
+        self._requests.put((job_id, batch))
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def wait_until_ready(self, timeout=300.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._failed:
+                    raise RuntimeError(f"Model worker failed to start: {self._failed[0]}")
+                if self._ready == self.num_workers:
+                    return
+            time.sleep(0.1)
+        raise TimeoutError('Model workers did not become ready in time')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'model_path': self.model_path,
+                'workers': self.num_workers,
+                'workers_ready': self._ready,
+                'workers_alive': sum(p.is_alive() for p in self._processes),
+                'jobs_in_flight': len(self._pending),
+                'jobs_run': self._jobs,
+                'uptime_seconds': round(time.monotonic() - self._started_at, 1),
+            }
+
+    def close(self):
+        for _ in self._processes:
+            self._requests.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+
+
+# ===== IPC BETWEEN WEB AND MODEL TIER =====
+
+class ModelServerManager(BaseManager):
+    pass
+
+
+def serve(pool, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+    """Expose `pool` to web workers on a local socket (blocks forever)"""
+    ModelServerManager.register('get_pool', callable=lambda: pool)
+    manager = ModelServerManager(address=parse_address(address), authkey=authkey.encode())
+    server = manager.get_server()
+    print(f"Model server listening on {address} with {pool.num_workers} worker(s)")
+    server.serve_forever()
+
+
+class ModelServerClient:
+    """Web-tier handle on a running model server; thread-safe (one connection per thread)"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+        ModelServerManager.register('get_pool')
+        self._manager = ModelServerManager(address=parse_address(address), authkey=authkey.encode())
+        self._manager.connect()
+        self._pool = self._manager.get_pool()
+
+    def infer(self, batch):
+        return self._pool.infer(batch)
+
+    def stats(self):
+        return self._pool.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HomeCheck model server')
+    parser.add_argument('--address', default=os.environ.get('HOMECHECK_MODEL_SERVER', DEFAULT_ADDRESS))
+    parser.add_argument('--authkey', default=os.environ.get('HOMECHECK_MODEL_SERVER_AUTHKEY', DEFAULT_AUTHKEY))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HOMECHECK_MODEL_WORKERS', 1)))
+    parser.add_argument('--backend', default=os.environ.get('HOMECHECK_BACKEND', 'keras').lower())
+    parser.add_argument('--model', help='Model file (default: HOMECHECK_MODEL or HOMECHECK_TFLITE_MODEL)')
+    parser.add_argument('--tflite-threads', type=int, default=int(os.environ.get('HOMECHECK_TFLITE_THREADS', 1)))
+    parser.add_argument('--intra-op-threads', type=int, default=int(os.environ.get('HOMECHECK_INTRA_OP_THREADS', 0)))
+    parser.add_argument('--inter-op-threads', type=int, default=int(os.environ.get('HOMECHECK_INTER_OP_THREADS', 0)))
+    parser.add_argument('--max-batch-size', type=int, default=int(os.environ.get('HOMECHECK_BATCH_MAX_SIZE', 8)))
+    args = parser.parse_args()
+
+    model_path = args.model
+    if model_path is None:
+        if args.backend == 'tflite':
+            model_path = os.environ.get('HOMECHECK_TFLITE_MODEL', 'model_fp16.tflite')
+        else:
+            model_path = os.environ.get('HOMECHECK_MODEL', 'model.keras')
+
+    pool = InferencePool(num_workers=args.workers, backend=args.backend, model_path=model_path,
+                         tflite_threads=args.tflite_threads, intra_op_threads=args.intra_op_threads,
+                         inter_op_threads=args.inter_op_threads, warm_up_sizes=(1, args.max_batch_size))
+    pool.wait_until_ready()
+    try:
+        serve(pool, args.address, args.authkey)
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,12 @@
 
 // ===== GLOBAL VARIABLES =====
 let currentImage = null;
+let currentCapture = null;  // Promise of the downscaled JPEG Blob sent for camera captures
 let currentMethod = 'upload';
 let stream = null;
 let analysisInProgress = false;
+const TOP_K = 7;  // classes shown in the prediction breakdown
+let liveScan = null;  // { stream_id, frame_url, stop_url, sample_interval_ms } while live scanning
 
 // ===== INITIALIZATION =====
 document.addEventListener('DOMContentLoaded', function() {
@@ -23,6 +26,7 @@ function initializeAIInspection() {
     initializeDragAndDrop();
     setupFormHandling();
     setupMethodSwitching();
+    setupLiveScanControls();
     setupKeyboardNavigation();
     
     // Reset interface
@@ -128,6 +132,12 @@ function handleFileSelect(input) {
         return;
     }
     
+    // Several photos at once go to the batch endpoint in a single request
+    if (input.files.length > 1) {
+        analyzeBatch(Array.from(input.files));
+        return;
+    }
+    
     // Validate file
     if (!file.type.startsWith('image/')) {
         showError('❌ Please select a valid image file (JPG, PNG, GIF)');
@@ -153,6 +163,17 @@ function handleFileSelect(input) {
 }
 
 // ===== CAMERA FUNCTIONS =====
+const MODEL_INPUT_SIZE = 224;
+
+function captureModelInput(source) {
+    // The model only sees 224x224 pixels, so shrink the frame before it leaves the browser
+    const small = document.createElement('canvas');
+    small.width = MODEL_INPUT_SIZE;
+    small.height = MODEL_INPUT_SIZE;
+    small.getContext('2d').drawImage(source, 0, 0, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE);
+    return new Promise(resolve => small.toBlob(resolve, 'image/jpeg', 0.9));
+}
+
 async function startCamera() {
     try {
         showSuccess('📹 Starting camera...');
@@ -190,8 +211,12 @@ function captureImage() {
     // Draw video frame to canvas
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
     
-    // Convert to data URL
+    // Convert to data URL (preview) and a downscaled binary JPEG (upload)
     currentImage = canvas.toDataURL('image/jpeg', 0.8);
+    currentCapture = captureModelInput(canvas);
+    currentCapture.then(blob => {
+        console.log(`📦 Capture upload: ${blob.size} bytes (data URL would be ${currentImage.length} bytes)`);
+    });
     
     // Show canvas, hide video
     canvas.style.display = 'block';
@@ -221,11 +246,14 @@ function retakeImage() {
     // Hide preview
     document.getElementById('previewContainer').style.display = 'none';
     currentImage = null;
+    currentCapture = null;
     
     console.log('🔄 Retaking image');
 }
 
 function stopCamera() {
+    if (liveScan) stopLiveScan();
+    
     if (stream) {
         stream.getTracks().forEach(track => track.stop());
         stream = null;
@@ -241,6 +269,105 @@ function stopCamera() {
     console.log('📹 Camera stopped');
 }
 
+// ===== LIVE SCANNING =====
+function setupLiveScanControls() {
+    // Adds a live-scan toggle and label next to the camera buttons
+    const retakeBtn = document.getElementById('retakeBtn');
+    if (!retakeBtn || document.getElementById('liveBtn')) return;
+    
+    const liveBtn = document.createElement('button');
+    liveBtn.id = 'liveBtn';
+    liveBtn.className = 'cta-button secondary';
+    liveBtn.textContent = '🎥 Live Scan';
+    liveBtn.addEventListener('click', () => liveScan ? stopLiveScan() : startLiveScan());
+    retakeBtn.insertAdjacentElement('afterend', liveBtn);
+    
+    const liveLabel = document.createElement('div');
+    liveLabel.id = 'liveLabel';
+    liveLabel.className = 'live-label';
+    liveLabel.setAttribute('aria-live', 'polite');
+    liveLabel.style.display = 'none';
+    liveBtn.parentElement.insertAdjacentElement('afterend', liveLabel);
+}
+
+async function startLiveScan() {
+    if (!stream) {
+        await startCamera();
+        if (!stream) return;
+    }
+    
+    try {
+        const response = await fetch('/live/start', { method: 'POST' });
+        const started = await response.json();
+        if (!response.ok) {
+            throw new Error(started.error || `HTTP error! status: ${response.status}`);
+        }
+        
+        liveScan = started;
+        document.getElementById('liveBtn').textContent = '⏹️ Stop Live Scan';
+        document.getElementById('captureBtn').style.display = 'none';
+        const liveLabel = document.getElementById('liveLabel');
+        liveLabel.textContent = '🔍 Scanning...';
+        liveLabel.style.display = 'block';
+        
+        console.log(`🎥 Live scan started (one frame every ${started.sample_interval_ms} ms)`);
+        liveScanLoop(started);
+    } catch (error) {
+        console.error('🚨 Live scan failed to start:', error);
+        showError(`❌ Live scan unavailable: ${error.message}`);
+    }
+}
+
+async function liveScanLoop(scan) {
+    const video = document.getElementById('video');
+    
+    // One frame in flight at a time, sent no faster than the server samples
+    while (liveScan === scan) {
+        const started = performance.now();
+        try {
+            const frame = await captureModelInput(video);
+            const response = await fetch(scan.frame_url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'image/jpeg' },
+                body: frame
+            });
+            const update = await response.json();
+            
+            if (response.status === 404) {
+                liveScan = null;
+                break;
+            }
+            if (update.label && liveScan === scan) {
+                document.getElementById('liveLabel').textContent =
+                    `${getIssueEmoji(update.label)} ${update.label}` + (update.stable_frames >= 3 ? ' ✓' : '');
+            }
+        } catch (error) {
+            console.warn('⚠️ Live frame failed:', error);
+        }
+        
+        const elapsed = performance.now() - started;
+        await new Promise(resolve => setTimeout(resolve, Math.max(0, scan.sample_interval_ms - elapsed)));
+    }
+}
+
+async function stopLiveScan() {
+    const scan = liveScan;
+    liveScan = null;
+    
+    document.getElementById('liveBtn').textContent = '🎥 Live Scan';
+    document.getElementById('liveLabel').style.display = 'none';
+    if (stream) document.getElementById('captureBtn').style.display = 'block';
+    if (!scan) return;
+    
+    // The final smoothed label is saved like a normal inspection
+    const response = await fetch(`${scan.stop_url}?top_k=${TOP_K}`, { method: 'POST' });
+    const summary = await response.json();
+    console.log(`🎥 Live scan stopped after ${summary.frames_kept} frames`);
+    if (summary.result) {
+        showPredictionResults(summary.result);
+    }
+}
+
 // ===== PREVIEW FUNCTIONS =====
 function showPreview(imageSrc) {
     const previewContainer = document.getElementById('previewContainer');
@@ -282,35 +409,38 @@ async function analyzeImage() {
     try {
         console.log('🤖 Starting AI analysis...');
         
-        // Prepare form data
-        const formData = new FormData();
+        // Prepare the request body
+        let body;
+        const headers = {};
         
         if (currentMethod === 'upload') {
             const fileInput = document.getElementById('fileInput');
             if (fileInput.files[0]) {
-                formData.append('file', fileInput.files[0]);
+                body = new FormData();
+                body.append('file', fileInput.files[0]);
             } else {
                 throw new Error('No file selected');
             }
         } else {
-            formData.append('image_data', currentImage);
+            // Camera captures go up as raw JPEG bytes, not a base64 form field
+            body = await currentCapture;
+            headers['Content-Type'] = 'image/jpeg';
         }
         
-        // Send to backend
-        const response = await fetch('/predict', {
+        // Queue the photo; the server answers with a job id straight away
+        const response = await fetch(`/jobs?top_k=${TOP_K}`, {
             method: 'POST',
-            body: formData
+            headers: headers,
+            body: body
         });
         
+        const job = await response.json();
+        
         if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+            throw new Error(job.error || `HTTP error! status: ${response.status}`);
         }
         
-        const result = await response.json();
-        
-        if (result.error) {
-            throw new Error(result.error);
-        }
+        const result = await waitForJob(job);
         
         console.log('✅ AI analysis complete:', result);
         
@@ -331,6 +461,110 @@ async function analyzeImage() {
     }
 }
 
+// ===== ASYNC JOBS =====
+function waitForJobEvents(job) {
+    // Resolves once the server pushes the job's final 'done' or 'failed' event
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        source.addEventListener('done', () => { source.close(); resolve(); });
+        source.addEventListener('failed', (event) => {
+            source.close();
+            reject(new Error(JSON.parse(event.data).error || 'Analysis failed'));
+        });
+        source.onerror = () => { source.close(); resolve(); };  // fall back to polling
+    });
+}
+
+async function waitForJob(job) {
+    if (window.EventSource) {
+        await waitForJobEvents(job);
+    }
+    
+    // Long-poll the status URL; this also makes the result the current inspection
+    while (true) {
+        const response = await fetch(`${job.status_url}?wait=10`);
+        const status = await response.json();
+        
+        if (!response.ok || status.status === 'failed') {
+            throw new Error(status.error || `HTTP error! status: ${response.status}`);
+        }
+        if (status.status === 'done') {
+            return status.result;
+        }
+    }
+}
+
+// ===== BATCH ANALYSIS =====
+async function analyzeBatch(files) {
+    const images = files.filter(file => file.type.startsWith('image/'));
+    if (images.length === 0) {
+        showError('❌ Please select valid image files (JPG, PNG, GIF)');
+        return;
+    }
+    
+    if (analysisInProgress) {
+        showError('⏳ Analysis already in progress');
+        return;
+    }
+    
+    analysisInProgress = true;
+    showSuccess(`📤 Uploading ${images.length} photos for analysis...`);
+    
+    try {
+        const formData = new FormData();
+        images.forEach(file => formData.append('files', file));
+        
+        const response = await fetch('/predict/batch', {
+            method: 'POST',
+            body: formData
+        });
+        
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        if (!response.headers.get('Content-Type')?.includes('application/x-ndjson')) {
+            const result = await response.json();
+            throw new Error(result.error || 'Unexpected response');
+        }
+        
+        // Results arrive one JSON line per photo as soon as each batch is done
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        let completed = 0;
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            
+            lines.filter(line => line.trim()).forEach(line => {
+                const result = JSON.parse(line);
+                if (result.done) {
+                    showSuccess(`✅ ${result.succeeded} of ${result.total} photos analyzed. See the Report page for details.`);
+                } else if (result.error) {
+                    console.warn(`⚠️ ${result.filename}: ${result.error}`);
+                } else {
+                    completed++;
+                    showSuccess(`🔍 ${completed}/${images.length}: ${result.filename} - ${result.predicted_class}`);
+                }
+            });
+        }
+        
+        console.log(`✅ Batch analysis complete: ${completed} photos`);
+        
+    } catch (error) {
+        console.error('🚨 Batch analysis failed:', error);
+        showError(`❌ Batch analysis failed: ${error.message}`);
+    } finally {
+        analysisInProgress = false;
+    }
+}
+
 // ===== LOADING ANIMATION =====
 function animateLoadingSteps() {
     const steps = ['step1', 'step2', 'step3', 'step4', 'step5'];
@@ -364,6 +598,7 @@ function showPredictionResults(result) {
             🎯 AI Prediction: ${result.predicted_class}
         </h2>
         <div class="confidence-score">${result.max_confidence_percentage.toFixed(1)}%</div>
+        ${result.uncertain ? '<p class="uncertain-note">🤔 The top two matches are close - consider retaking the photo in better light.</p>' : ''}
         <div class="ai-status-indicator">
             <div class="status-dot"></div>
             AI Analysis Complete
@@ -513,6 +748,7 @@ function resetInspection() {
     
     // Clear state
     currentImage = null;
+    currentCapture = null;
     analysisInProgress = false;
     
     // Reset file input
@@ -831,4 +1067,5 @@ window.startCamera = startCamera;
 window.captureImage = captureImage;
 window.retakeImage = retakeImage;
 window.analyzeImage = analyzeImage;
+window.analyzeBatch = analyzeBatch;
 window.resetInspection = resetInspection;
\ No newline at end of file
@@ -0,0 +1,59 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeModel:
+    """Stands in for the Keras model: class scores from the image brightness, then a 3-value embedding"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_calls = set()
+
+    def __call__(self, batch):
+        self.calls.append(len(batch))
+        if len(self.calls) in self.fail_calls:
+            raise RuntimeError('model failed')
+        brightness = batch.mean(axis=(1, 2, 3))
+        scores = np.full((len(batch), 7), 0.01, dtype=np.float32)
+        scores[np.arange(len(batch)), np.minimum((brightness * 7).astype(int), 6)] = 10.0
+        return np.concatenate([scores, batch.mean(axis=(1, 2)) + 0.1], axis=1)
+
+
+def jpeg_bytes(value, size=(40, 40)):
+    """A plain grey JPEG; different values land in different classes of FakeModel"""
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((*size[::-1], 3), value, dtype=np.uint8)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module, imported once with a temporary history and a fake model"""
+    root = tmp_path_factory.mktemp('homecheck')
+    os.environ.update({
+        'HOMECHECK_MODEL_LOADING': 'lazy',
+        'HOMECHECK_HISTORY_DB': str(root / 'history.db'),
+        'HOMECHECK_EMBEDDINGS_DIR': str(root / 'embeddings'),
+        'HOMECHECK_BATCH_MAX_SIZE': '2',
+    })
+    import app
+    model = FakeModel()
+    app.model_registry.active().loader._load_fn = lambda: (None, model)
+    app.fake_model = model
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    """Test client of a fresh browser (new history id) with an empty prediction cache"""
+    app_module.fake_model.calls.clear()
+    app_module.fake_model.fail_calls.clear()
+    app_module.prediction_cache.set_model_version(None)
+    return app_module.app.test_client()
@@ -0,0 +1,148 @@
+import io
+import threading
+import zipfile
+
+import pytest
+
+from admission import QUEUE_FULL, TIMEOUT, AdmissionGate, ImageTooLarge, Overloaded, check_upload_size, open_image
+from conftest import jpeg_bytes
+
+
+def test_gate_turns_callers_away_when_the_queue_is_full():
+    gate = AdmissionGate(max_concurrent=1, max_waiting=0, max_wait=1.0)
+    gate.acquire()
+    with pytest.raises(Overloaded) as error:
+        gate.acquire()
+    assert error.value.reason == QUEUE_FULL
+    assert gate.stats()['rejected'] == 1
+
+
+def test_gate_sheds_callers_that_wait_too_long():
+    gate = AdmissionGate(max_concurrent=1, max_waiting=1, max_wait=0.01)
+    gate.acquire()
+    with pytest.raises(Overloaded) as error:
+        gate.acquire()
+    assert error.value.reason == TIMEOUT
+    assert gate.stats()['shed'] == 1 and gate.stats()['waiting'] == 0
+
+
+def test_waiting_caller_gets_the_released_slot():
+    gate = AdmissionGate(max_concurrent=1, max_waiting=1, max_wait=5.0)
+    gate.acquire()
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        gate.acquire()
+        admitted.set()
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    gate.release()
+    waiter.join(5)
+    assert admitted.is_set()
+    assert gate.stats()['active'] == 1 and gate.stats()['admitted'] == 2
+
+
+def test_check_upload_size():
+    check_upload_size(100, 100)
+    check_upload_size(None, 100)
+    check_upload_size(10 ** 9, 0)
+    with pytest.raises(ImageTooLarge) as error:
+        check_upload_size(101, 100)
+    assert error.value.reason == 'bytes'
+
+
+def test_open_image_checks_pixels_before_decoding():
+    assert open_image(jpeg_bytes(50, size=(40, 30)), max_pixels=1200).size == (40, 30)
+    with pytest.raises(ImageTooLarge) as error:
+        open_image(jpeg_bytes(50, size=(40, 30)), max_pixels=1199)
+    assert error.value.reason == 'pixels'
+
+
+@pytest.fixture
+def small_gate(app_module, monkeypatch):
+    gate = AdmissionGate(max_concurrent=1, max_waiting=0, max_wait=0.01)
+    monkeypatch.setattr(app_module, 'admission_gate', gate)
+    return gate
+
+
+def test_predict_answers_429_when_overloaded(client, small_gate):
+    small_gate.acquire()
+    response = client.post('/predict', data=jpeg_bytes(50), content_type='image/jpeg')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_predict_answers_503_when_no_slot_frees_up(client, small_gate):
+    small_gate.max_waiting = 1
+    small_gate.acquire()
+    response = client.post('/predict', data=jpeg_bytes(50), content_type='image/jpeg')
+    assert response.status_code == 503
+    assert small_gate.stats()['shed'] == 1
+
+
+def test_predict_releases_its_slot(client, small_gate):
+    for _ in range(2):
+        assert 'predicted_class' in client.post('/predict', data=jpeg_bytes(50), content_type='image/jpeg').get_json()
+    assert small_gate.stats()['active'] == 0
+
+
+def test_live_frames_are_gated_like_predict(client, app_module, small_gate, monkeypatch):
+    stream = client.post('/live/start').get_json()
+    small_gate.acquire()
+    response = client.post(stream['frame_url'], data=jpeg_bytes(50), content_type='image/jpeg')
+    assert response.status_code == 429
+    assert app_module.fake_model.calls == []
+
+    # The refused frame does not leave the stream busy, and a kept frame gives its slot back
+    small_gate.release()
+    monkeypatch.setattr(app_module.live_scans, 'sample_interval', 0)
+    assert client.post(stream['frame_url'], data=jpeg_bytes(50), content_type='image/jpeg').get_json()['frame'] == 'keep'
+    assert small_gate.stats()['active'] == 0
+
+
+def test_predict_refuses_oversized_uploads(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_UPLOAD_BYTES', 100)
+    response = client.post('/predict', data=jpeg_bytes(50), content_type='image/jpeg')
+    assert response.status_code == 413
+    monkeypatch.setitem(app_module.app.config, 'MAX_UPLOAD_BYTES', 10 ** 6)
+    monkeypatch.setitem(app_module.app.config, 'MAX_IMAGE_PIXELS', 100)
+    response = client.post('/predict', data=jpeg_bytes(50), content_type='image/jpeg')
+    assert response.status_code == 413
+    assert 'pixels' in response.get_json()['error']
+    assert app_module.fake_model.calls == []
+
+
+def zip_of(sizes):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i, size in enumerate(sizes):
+            zf.writestr(f'{i}.jpg', b'\0' * size)
+    return buffer.getvalue()
+
+
+def post_archive(client, archive):
+    return client.post('/predict/batch', data={'archive': (io.BytesIO(archive), 'photos.zip')},
+                       content_type='multipart/form-data')
+
+
+def test_batch_refuses_a_zip_member_over_the_photo_limit(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_UPLOAD_BYTES', 1024 * 1024)
+    archive = zip_of([100, 2 * 1024 * 1024])
+    assert len(archive) < 10 * 1024
+    response = post_archive(client, archive)
+    assert response.status_code == 413
+    assert app_module.fake_model.calls == []
+
+
+def test_batch_refuses_zips_that_expand_past_the_batch_limit(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BATCH_UPLOAD_MAX_BYTES', 1024 * 1024)
+    response = post_archive(client, zip_of([600 * 1024, 600 * 1024]))
+    assert response.status_code == 413
+    assert 'Batch expands to' in response.get_json()['error']
+
+
+def test_batch_refuses_a_file_over_the_photo_limit(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_UPLOAD_BYTES', 100)
+    response = client.post('/predict/batch', data={'files': [(io.BytesIO(jpeg_bytes(50)), 'a.jpg')]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
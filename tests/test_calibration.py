@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import jpeg_bytes
+from inference import CLASS_NAMES, calibrate_scores, load_temperature, top_k_predictions
+
+
+def test_temperature_one_leaves_scores_alone():
+    scores = np.array([0.7, 0.2, 0.1, 0, 0, 0, 0], dtype=np.float32)
+    np.testing.assert_array_equal(calibrate_scores(scores), scores)
+
+
+def test_higher_temperature_flattens_but_keeps_ranking():
+    scores = np.array([[0.7, 0.2, 0.1, 0, 0, 0, 0], [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.4]], dtype=np.float32)
+    calibrated = calibrate_scores(scores, temperature=2.0)
+    np.testing.assert_allclose(calibrated.sum(axis=-1), 1.0, rtol=1e-6)
+    np.testing.assert_array_equal(calibrated.argmax(axis=-1), scores.argmax(axis=-1))
+    assert calibrated[0, 0] < scores[0, 0]
+
+
+def test_load_temperature(tmp_path):
+    assert load_temperature(str(tmp_path / 'missing.json')) == 1.0
+    path = tmp_path / 'temperature.json'
+    path.write_text(json.dumps({'temperature': 1.7}))
+    assert load_temperature(str(path)) == pytest.approx(1.7)
+
+
+def test_top_k_is_ranked_best_first():
+    probabilities = np.array([0.05, 0.5, 0.05, 0.3, 0.05, 0.05, 0.0])
+    top = top_k_predictions(probabilities, 3)
+    assert [entry['class_name'] for entry in top] == [CLASS_NAMES[1], CLASS_NAMES[3], CLASS_NAMES[0]]
+    assert top[0] == {'class_name': CLASS_NAMES[1], 'probability': 0.5, 'percentage': 50.0}
+
+
+def test_predict_returns_top_k_and_stores_probabilities(client, app_module):
+    result = client.post('/predict?top_k=3', data=jpeg_bytes(10), content_type='image/jpeg').get_json()
+    assert len(result['all_predictions']) == 3
+    assert result['all_predictions'][0]['class_name'] == result['predicted_class']
+    assert result['uncertain'] is False
+    with client.session_transaction() as session:
+        stored = app_module.history_store.get(session['history_id'], result['id'])
+    assert len(stored['scores']) == len(CLASS_NAMES)
+    assert stored['scores'][CLASS_NAMES.index(result['predicted_class'])] == max(stored['scores'])
+
+
+def test_predict_without_top_k_returns_class_only(client):
+    result = client.post('/predict', data=jpeg_bytes(10), content_type='image/jpeg').get_json()
+    assert 'all_predictions' not in result and 'max_confidence_percentage' not in result
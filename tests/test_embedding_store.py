@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from conftest import jpeg_bytes
+from embedding_store import EmbeddingStore
+
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / 'v1'))
+
+
+def test_exact_search_ranks_by_cosine_similarity(store):
+    store.append([1, 2, 3], 'alice', [[1, 0, 0], [0.9, 0.1, 0], [0, 1, 0]])
+    results = store.search([1, 0, 0], 'alice', k=2)
+    assert [inspection_id for inspection_id, _ in results] == [1, 2]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_search_only_sees_the_owner_and_honours_exclude(store):
+    store.append([1, 2], 'alice', [[1, 0, 0], [0.8, 0.2, 0]])
+    store.append([3], 'bob', [[1, 0, 0]])
+    assert [i for i, _ in store.search([1, 0, 0], 'alice', k=5, exclude=1)] == [2]
+    assert [i for i, _ in store.search([1, 0, 0], 'bob', k=5)] == [3]
+    assert store.search([1, 0, 0], 'carol') == []
+
+
+def test_append_does_not_modify_the_callers_array(store):
+    embeddings = np.array([[3.0, 4.0, 0.0]], dtype=np.float32)
+    store.append([1], 'alice', embeddings)
+    np.testing.assert_array_equal(embeddings, [[3.0, 4.0, 0.0]])
+    np.testing.assert_allclose(store.get(1), [0.6, 0.8, 0.0], atol=1e-3)
+    assert store.get(2) is None
+
+
+def test_dimension_mismatch_is_rejected(store):
+    store.append([1], 'alice', [[1, 0, 0]])
+    with pytest.raises(ValueError):
+        store.append([2], 'alice', [[1, 0, 0, 0]])
+
+
+def test_reopen_drops_a_partly_written_row(tmp_path):
+    path = str(tmp_path / 'v1')
+    EmbeddingStore(path).append([1, 2], 'alice', [[1, 0, 0], [0, 1, 0]])
+    with open(path + '.f16', 'ab') as f:
+        f.write(np.ones(3, dtype=np.float16).tobytes())  # embedding written, ids and owners not
+    store = EmbeddingStore(path)
+    assert len(store) == 2
+    store.append([3], 'alice', [[0, 0, 1]])
+    assert store.search([0, 0, 1], 'alice', k=1)[0][0] == 3
+
+
+def test_large_collections_use_the_ivf_index(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = unit(rng.normal(size=(20, 16)))
+    embeddings = unit(np.repeat(centers, 100, axis=0) + 0.05 * rng.normal(size=(2000, 16)))
+    store = EmbeddingStore(str(tmp_path / 'v1'), exact_max=500, nprobe=4)
+    store.append(list(range(2000)), 'alice', embeddings)
+
+    for query_row in (0, 750, 1999):
+        results = store.search(embeddings[query_row], 'alice', k=5)
+        exact = np.argsort(-(embeddings @ embeddings[query_row]))[:5]
+        assert results[0][0] == query_row
+        assert len({i for i, _ in results} & set(exact.tolist())) >= 4
+    assert store.stats()['approximate_index']
+
+    # Rows appended after the index was built are searchable too
+    store.append([5000], 'alice', [centers[3]])
+    assert 5000 in [i for i, _ in store.search(centers[3], 'alice', k=3)]
+
+
+def test_small_collections_stay_exact(store):
+    store.append([1, 2], 'alice', [[1, 0], [0, 1]])
+    store.search([1, 0], 'alice')
+    assert not store.stats()['approximate_index']
+
+
+def test_similar_endpoint_finds_earlier_inspections(client):
+    ids = [client.post('/predict', data=jpeg_bytes(value), content_type='image/jpeg').get_json()['id']
+           for value in ((200, 40, 40), (190, 60, 40), (40, 40, 200))]
+    response = client.get(f'/api/similar?id={ids[0]}&k=2').get_json()
+    assert [inspection['id'] for inspection in response['similar']] == [ids[1], ids[2]]
+    assert client.get('/api/similar?id=999999').status_code == 404
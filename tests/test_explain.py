@@ -0,0 +1,98 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import explain
+from conftest import FakeModel, jpeg_bytes
+from explain import GradCamExplainer, render_overlay
+
+
+def test_render_overlay_is_a_png_of_the_requested_size():
+    image = np.full((224, 224, 3), 128, dtype=np.uint8)
+    cam = np.zeros((7, 7), dtype=np.float32)
+    cam[3, 3] = 1.0
+    overlay = Image.open(io.BytesIO(render_overlay(image, cam, size=112)))
+    assert overlay.format == 'PNG' and overlay.size == (112, 112)
+    pixels = np.asarray(overlay.convert('RGB'), dtype=np.int16)
+    # Hot centre takes the heat colour, cold corners stay close to the photo
+    assert pixels[56, 56, 0] > 160 and pixels[56, 56, 2] < 100
+    assert np.abs(pixels[0, 0] - 128).max() < 40
+
+
+def test_explainer_batches_per_model(monkeypatch):
+    traced = []
+
+    def fake_gradcam_fn(model, layer_name=None):
+        traced.append(model)
+        return lambda batch: np.tile(np.linspace(0.0, 1.0, 49, dtype=np.float32), (len(batch), 1))
+    monkeypatch.setattr(explain, 'make_gradcam_fn', fake_gradcam_fn)
+
+    explainer = GradCamExplainer(max_batch_size=2)
+    model = object()
+    image = np.zeros((224, 224, 3), dtype=np.uint8)
+    cam = explainer.explain(model, image)
+    explainer.explain(model, image)
+    explainer.explain(object(), image)
+    assert cam.shape == (7, 7) and cam.max() == 1.0
+    assert len(traced) == 2 and traced[0] is model
+    assert len(explainer.stats()) == 2
+
+
+def test_forgotten_model_loses_its_batcher(monkeypatch):
+    monkeypatch.setattr(explain, 'make_gradcam_fn',
+                        lambda model, layer_name=None: lambda batch: np.ones((len(batch), 49), dtype=np.float32))
+    explainer = GradCamExplainer()
+    model = object()
+    explainer.explain(model, np.zeros((224, 224, 3), dtype=np.uint8))
+    assert explainer.forget(model) is True
+    assert explainer.stats() == [] and explainer.forget(model) is False
+
+
+def test_removing_a_model_version_drops_its_explainer(app_module, monkeypatch):
+    monkeypatch.setattr(explain, 'make_gradcam_fn',
+                        lambda model, layer_name=None: lambda batch: np.ones((len(batch), 49), dtype=np.float32))
+    registry = app_module.model_registry
+    keras_model = object()
+    version = registry.register('explained', lambda: (keras_model, FakeModel()))
+    version.loader.wait(5)
+    app_module.explainer.explain(version.loader.model, np.zeros((224, 224, 3), dtype=np.uint8))
+    before = len(app_module.explainer.stats())
+    registry.remove('explained')
+    assert len(app_module.explainer.stats()) == before - 1
+    assert app_module.explainer.forget(keras_model) is False
+
+
+def test_explain_unknown_inspection(client):
+    assert client.get('/api/explain/999999').status_code == 404
+
+
+def test_explain_tiled_inspection_has_no_photo(client):
+    result = client.post('/predict?tiles=1', data=jpeg_bytes(50), content_type='image/jpeg').get_json()
+    response = client.get(f"/api/explain/{result['id']}")
+    assert response.status_code == 404
+
+
+def test_explain_needs_a_keras_model(client):
+    result = client.post('/predict', data=jpeg_bytes(60), content_type='image/jpeg').get_json()
+    assert client.get(f"/api/explain/{result['id']}").status_code == 501
+
+
+def test_explanation_is_computed_once_then_cached(client, app_module, monkeypatch):
+    version = app_module.model_registry.active()
+    computed = []
+
+    def fake_explain(model, image):
+        computed.append(image.shape)
+        return np.linspace(0.0, 1.0, 49, dtype=np.float32).reshape(7, 7)
+    monkeypatch.setattr(version.loader, 'model', object())
+    monkeypatch.setattr(app_module.explainer, 'explain', fake_explain)
+
+    result = client.post('/predict', data=jpeg_bytes(70), content_type='image/jpeg').get_json()
+    first = client.get(f"/api/explain/{result['id']}")
+    assert first.status_code == 200 and first.mimetype == 'image/png'
+    again = client.get(f"/api/explain/{result['id']}")
+    assert again.get_data() == first.get_data()
+    conditional = client.get(f"/api/explain/{result['id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert conditional.status_code == 304
+    assert computed == [(224, 224, 3)]
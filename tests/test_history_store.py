@@ -0,0 +1,73 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from history_store import HistoryStore, dequantize_scores, quantize_scores
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.db'))
+
+
+def result(predicted_class, timestamp='2026-10-01 09:00:00', **extra):
+    return dict({'predicted_class': predicted_class, 'timestamp': timestamp}, **extra)
+
+
+def test_append_many_returns_ids_in_order(store):
+    ids = store.append_many('alice', [result('Algae'), result('Stain'), result('Algae')])
+    assert ids == sorted(ids) and len(set(ids)) == 3
+    assert [row['id'] for row in store.iter_all('alice')] == ids
+    assert store.append('alice', result('Normal')) > ids[-1]
+
+
+def test_append_many_updates_aggregates(store):
+    store.append_many('alice', [result('Algae'), result('Stain'), result('Algae', '2026-10-02 09:00:00')])
+    store.append('bob', result('Peeling'))
+    assert store.class_counts('alice') == {'Algae': 2, 'Stain': 1}
+    assert store.count('bob') == 1
+    assert store.time_range('alice') == ('2026-10-01 09:00:00', '2026-10-02 09:00:00')
+
+
+def test_scores_are_quantized(store):
+    scores = np.array([0.5, 0.25, 0.25, 0, 0, 0, 0], dtype=np.float32)
+    inspection_id = store.append('alice', result('Algae', scores=scores))
+    assert store.get('alice', inspection_id)['scores'] == dequantize_scores(quantize_scores(scores))
+    assert store.get('alice', inspection_id)['scores'][0] == pytest.approx(0.5, abs=1 / 255)
+
+
+def test_explain_source(store):
+    inspection_id = store.append('alice', result('Algae', image_hash='abc', model_version='v2'))
+    legacy_id = store.append('alice', result('Algae'))
+    assert store.explain_source('alice', inspection_id) == ('abc', 'v2')
+    assert store.explain_source('alice', legacy_id) == (None, None)
+    assert store.explain_source('bob', inspection_id) is None
+
+
+def test_users_only_see_their_own_history(store):
+    inspection_id = store.append('alice', result('Algae'))
+    assert store.get('bob', inspection_id) is None
+    assert store.delete('bob', inspection_id) is False
+    assert store.delete('alice', inspection_id) is True
+    assert store.class_counts('alice') == {}
+
+
+def test_migrates_a_database_from_before_scores_and_aggregates(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE inspections (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL,
+                                  predicted_class TEXT NOT NULL, timestamp TEXT NOT NULL);
+        INSERT INTO inspections (user_id, predicted_class, timestamp) VALUES
+            ('alice', 'Algae', '2026-09-01 10:00:00'), ('alice', 'Stain', '2026-09-02 10:00:00');
+    """)
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    assert store.class_counts('alice') == {'Algae': 1, 'Stain': 1}
+    assert [row['scores'] for row in store.iter_all('alice')] == [None, None]
+    new_id = store.append('alice', result('Algae', scores=np.full(7, 1 / 7), image_hash='h', model_version='v1'))
+    assert store.explain_source('alice', new_id) == ('h', 'v1')
+    assert store.class_counts('alice') == {'Algae': 2, 'Stain': 1}
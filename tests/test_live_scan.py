@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+import live_scan
+from conftest import FakeModel, jpeg_bytes
+from inference import CLASS_NAMES
+from live_scan import LiveScanStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(live_scan.time, 'monotonic', clock)
+    return clock
+
+
+def one_hot(class_name):
+    scores = np.zeros(len(CLASS_NAMES), dtype=np.float32)
+    scores[CLASS_NAMES.index(class_name)] = 1.0
+    return scores
+
+
+def test_sampling_and_backpressure(clock):
+    store = LiveScanStore(sample_fps=4.0)
+    stream_id = store.open('alice')
+    assert store.admit(stream_id, 'alice') == 'keep'
+    assert store.admit(stream_id, 'alice') == 'busy'  # previous frame still in flight
+    store.update(stream_id, one_hot('Algae'))
+    clock.now += 0.1
+    assert store.admit(stream_id, 'alice') == 'sampled'
+    clock.now += 0.2
+    assert store.admit(stream_id, 'alice', busy=True) == 'busy'
+    assert store.admit(stream_id, 'alice') == 'keep'
+    view = store.view(stream_id, 'alice')
+    assert (view['frames_kept'], view['frames_sampled_out'], view['frames_dropped_busy']) == (1, 1, 2)
+
+
+def test_other_owners_cannot_use_a_stream(clock):
+    store = LiveScanStore()
+    stream_id = store.open('alice')
+    assert store.admit(stream_id, 'bob') is None
+    assert store.view(stream_id, 'bob') is None
+    assert store.close(stream_id, 'bob') == (None, None)
+
+
+def test_smoothing_needs_several_frames_to_change_label(clock):
+    store = LiveScanStore(sample_fps=4.0, smoothing=0.6)
+    stream_id = store.open('alice')
+    labels = []
+    for class_name in ['Algae', 'Stain', 'Stain']:
+        store.admit(stream_id, 'alice')
+        store.update(stream_id, one_hot(class_name))
+        labels.append(store.view(stream_id, 'alice')['label'])
+        clock.now += 1.0
+    assert labels == ['Algae', 'Algae', 'Stain']
+
+
+def test_close_returns_version_and_last_kept_frame(clock):
+    store = LiveScanStore()
+    stream_id = store.open('alice')
+    store.admit(stream_id, 'alice')
+    store.update(stream_id, one_hot('Algae'), 'v1', 'first')
+    clock.now += 1.0
+    store.admit(stream_id, 'alice')
+    store.update(stream_id, None, 'v2', 'failed frame')
+    view, frame = store.close(stream_id, 'alice')
+    assert view['model_version'] == 'v1' and frame == 'first'
+    assert store.view(stream_id, 'alice') is None
+
+
+def test_idle_streams_expire(clock):
+    store = LiveScanStore(idle_timeout=60.0)
+    stream_id = store.open('alice')
+    clock.now += 61.0
+    store.open('bob')
+    assert store.view(stream_id, 'alice') is None
+    assert store.stats()['streams'] == 1
+
+
+def history_id(client):
+    with client.session_transaction() as session:
+        return session['history_id']
+
+
+def test_live_inspection_keeps_version_and_photo_for_explanations(client, app_module):
+    stream = client.post('/live/start').get_json()
+    frame = client.post(stream['frame_url'], data=jpeg_bytes(200), content_type='image/jpeg').get_json()
+    assert frame['frame'] == 'keep' and frame['model_version'] == 'default'
+
+    result = client.post(stream['stop_url']).get_json()['result']
+    assert result['model_version'] == 'default'
+    image_hash, model_version = app_module.history_store.explain_source(history_id(client), result['id'])
+    assert model_version == 'default'
+    assert app_module.explain_inputs.get(image_hash).shape == (224, 224, 3)
+
+
+def test_live_frames_follow_ab_routing(client, app_module):
+    registry = app_module.model_registry
+    candidate_model = FakeModel()
+    registry.register('candidate', lambda: (None, candidate_model)).loader.wait(5)
+    registry.set_candidate('candidate', 100, 'ab')
+    try:
+        stream = client.post('/live/start').get_json()
+        frame = client.post(stream['frame_url'], data=jpeg_bytes(90), content_type='image/jpeg').get_json()
+        assert frame['model_version'] == 'candidate'
+        assert candidate_model.calls == [1]
+        assert client.post(stream['stop_url']).get_json()['result']['model_version'] == 'candidate'
+    finally:
+        registry.set_candidate(None, 0)
+        registry.remove('candidate')
@@ -0,0 +1,98 @@
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import FakeModel
+from model_registry import ModelRegistry
+
+
+def loaded(model=None):
+    return lambda: (None, model or FakeModel())
+
+
+@pytest.fixture
+def registry():
+    registry = ModelRegistry(max_batch_size=4, max_wait_ms=1.0)
+    registry.register('v1', loaded())
+    registry.register('v2', loaded())
+    registry.get('v2').loader.wait(5)
+    return registry
+
+
+def test_first_version_is_active(registry):
+    assert registry.active().name == 'v1'
+    with pytest.raises(ValueError):
+        registry.register('v1', loaded())
+    with pytest.raises(KeyError):
+        registry.get('v3')
+
+
+def test_activate_swaps_and_returns_previous(registry):
+    assert registry.activate('v2', timeout=5).name == 'v1'
+    assert registry.active().name == 'v2'
+
+
+def test_activate_refuses_a_version_that_failed_to_load(registry):
+    def broken():
+        raise OSError('no such model file')
+    registry.register('broken', broken)
+    with pytest.raises(RuntimeError):
+        registry.activate('broken', timeout=5)
+    assert registry.active().name == 'v1'
+
+
+def test_ab_routing_is_sticky_per_key(registry):
+    registry.set_candidate('v2', 50, 'ab')
+    served = {key: registry.route(key)[0].name for key in map(str, range(200))}
+    assert set(served.values()) == {'v1', 'v2'}
+    assert all(registry.route(key)[0].name == name for key, name in served.items())
+    assert all(registry.route(key)[1] is None for key in served)
+
+
+def test_shadow_routing_serves_active(registry):
+    registry.set_candidate('v2', 100, 'shadow')
+    serving, shadow = registry.route('alice')
+    assert (serving.name, shadow.name) == ('v1', 'v2')
+
+
+def test_candidate_gets_no_traffic_until_loaded(registry):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return None, FakeModel()
+    registry.register('slow', slow)
+    registry.set_candidate('slow', 100, 'ab')
+    assert registry.route('alice')[0].name == 'v1'
+    release.set()
+    registry.get('slow').loader.wait(5)
+    assert registry.route('alice')[0].name == 'slow'
+
+
+def test_versions_in_use_cannot_be_removed(registry):
+    registry.set_candidate('v2', 10)
+    with pytest.raises(ValueError):
+        registry.remove('v1')
+    with pytest.raises(ValueError):
+        registry.remove('v2')
+    registry.set_candidate(None, 0)
+    registry.remove('v2')
+    with pytest.raises(KeyError):
+        registry.get('v2')
+
+
+def test_fingerprint_changes_with_candidate(registry):
+    before = registry.fingerprint()
+    registry.set_candidate('v2', 10)
+    assert registry.fingerprint() != before
+
+
+def test_each_version_runs_its_own_model(registry):
+    models = {'a': FakeModel(), 'b': FakeModel()}
+    for name, model in models.items():
+        registry.register(name, loaded(model)).loader.wait(5)
+    batch = np.zeros((3, 224, 224, 3), dtype=np.float32)
+    registry.get('a').run(batch)
+    registry.get('b').batcher.submit(batch[0])
+    assert models['a'].calls == [3] and models['b'].calls == [1]
@@ -0,0 +1,62 @@
+import base64
+import time
+
+import pytest
+
+from conftest import FakeModel, jpeg_bytes
+
+
+def data_url(image_bytes):
+    return 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode('ascii')
+
+
+def test_camera_data_url_is_accepted(client):
+    result = client.post('/predict', data={'image_data': data_url(jpeg_bytes(80))}).get_json()
+    assert 'predicted_class' in result
+
+
+@pytest.mark.parametrize('image_data', ['', 'no comma here', 'data:text/plain;base64,aGk=',
+                                        'data:image/jpeg;base64,***not base64***'])
+def test_malformed_data_url_is_a_400(client, image_data):
+    response = client.post('/predict', data={'image_data': image_data})
+    assert response.status_code == 400
+    assert 'image_data' in response.get_json()['error']
+
+
+def test_malformed_data_url_is_refused_by_jobs_and_live_frames(client):
+    assert client.post('/jobs', data={'image_data': 'garbage'}).status_code == 400
+    stream = client.post('/live/start').get_json()
+    assert client.post(stream['frame_url'], data={'image_data': 'garbage'}).status_code == 400
+
+
+def test_cache_hit_skips_the_model_but_keeps_the_explanation_input(client, app_module):
+    photo = jpeg_bytes(33)
+    first = client.post('/predict', data=photo, content_type='image/jpeg').get_json()
+    image_hash = app_module.prediction_cache.key_for(photo)
+    app_module.explain_inputs._remove(image_hash)
+
+    second = client.post('/predict', data=photo, content_type='image/jpeg').get_json()
+    assert second['predicted_class'] == first['predicted_class']
+    assert app_module.fake_model.calls == [1]
+    assert app_module.explain_inputs.get(image_hash) is not None
+
+
+def test_cache_hit_is_still_scored_by_the_shadow_version(client, app_module):
+    registry = app_module.model_registry
+    shadow_model = FakeModel()
+    registry.register('shadow', lambda: (None, shadow_model)).loader.wait(5)
+    registry.set_candidate('shadow', 100, 'shadow')
+    try:
+        photo = jpeg_bytes(44)
+        for _ in range(2):
+            client.post('/predict', data=photo, content_type='image/jpeg')
+        assert app_module.fake_model.calls == [1]
+
+        # Shadow scoring is queued without waiting: give its batcher time to run both photos
+        deadline = time.monotonic() + 5
+        while sum(shadow_model.calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sum(shadow_model.calls) == 2
+    finally:
+        registry.set_candidate(None, 0)
+        registry.remove('shadow')
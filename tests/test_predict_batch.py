@@ -0,0 +1,98 @@
+import io
+import json
+import zipfile
+
+from conftest import jpeg_bytes
+
+
+def post_batch(client, files=(), archive=None):
+    data = {'files': [(io.BytesIO(content), name) for name, content in files]}
+    if archive is not None:
+        data['archive'] = (io.BytesIO(archive), 'photos.zip')
+    response = client.post('/predict/batch', data=data, content_type='multipart/form-data')
+    try:
+        return response.status_code, response.get_data(as_text=True)
+    finally:
+        response.close()
+
+
+def ndjson(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_streams_one_line_per_photo_then_summary(client):
+    archive = zip_bytes({'roof/one.jpg': jpeg_bytes(20), 'notes.txt': 'skipped', 'two.png': jpeg_bytes(240)})
+    status, body = post_batch(client, files=[('front.jpg', jpeg_bytes(130))], archive=archive)
+    lines = ndjson(body)
+    assert status == 200
+    assert [line.get('filename') for line in lines[:-1]] == ['front.jpg', 'one.jpg', 'two.png']
+    assert [line['index'] for line in lines[:-1]] == [0, 1, 2]
+    assert all('predicted_class' in line and 'id' in line for line in lines[:-1])
+    assert lines[-1] == {'done': True, 'total': 3, 'succeeded': 3}
+
+
+def test_unreadable_photo_gets_an_error_line(client):
+    status, body = post_batch(client, files=[('good.jpg', jpeg_bytes(60)), ('broken.jpg', b'not an image')])
+    lines = ndjson(body)
+    assert status == 200
+    assert 'predicted_class' in lines[0]
+    assert lines[1]['filename'] == 'broken.jpg' and 'error' in lines[1]
+    assert lines[-1]['succeeded'] == 1
+
+
+def test_too_many_photos_is_refused_before_the_model_runs(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BATCH_UPLOAD_MAX_IMAGES', 2)
+    archive = zip_bytes({f'{i}.jpg': jpeg_bytes(i * 30) for i in range(3)})
+    status, body = post_batch(client, archive=archive)
+    assert 'At most 2 images' in json.loads(body)['error']
+    assert app_module.fake_model.calls == []
+
+
+def test_invalid_archive(client):
+    status, body = post_batch(client, archive=b'PK not really a zip')
+    assert json.loads(body) == {'error': 'Archive is not a valid zip file'}
+
+
+def test_no_photos(client):
+    status, body = post_batch(client, archive=zip_bytes({'readme.txt': 'no photos here'}))
+    assert json.loads(body) == {'error': 'No images provided'}
+
+
+def test_admission_slot_is_released(client, app_module):
+    post_batch(client, files=[('a.jpg', jpeg_bytes(90))])
+    assert app_module.admission_gate.stats()['active'] == 0
+
+
+def history_id(client):
+    with client.session_transaction() as session:
+        return session['history_id']
+
+
+def test_model_failure_only_costs_its_chunk(client, app_module):
+    app_module.fake_model.fail_calls.add(2)  # BATCH_MAX_SIZE is 2: photos 2 and 3
+    status, body = post_batch(client, files=[(f'{i}.jpg', jpeg_bytes(i * 50)) for i in range(5)])
+    lines = ndjson(body)
+    assert [('error' in line) for line in lines[:-1]] == [False, False, True, True, False]
+    assert lines[2]['error'] == 'model failed'
+    assert lines[-1] == {'done': True, 'total': 5, 'succeeded': 3}
+    saved = [row['id'] for row in app_module.history_store.iter_all(history_id(client))]
+    assert saved == [lines[0]['id'], lines[1]['id'], lines[4]['id']]
+
+
+def test_disconnect_keeps_the_chunks_already_streamed(client, app_module):
+    response = client.post('/predict/batch', data={'files': [(io.BytesIO(jpeg_bytes(i * 50)), f'{i}.jpg')
+                                                             for i in range(5)]},
+                           content_type='multipart/form-data', buffered=False)
+    first = json.loads(next(iter(response.response)))
+    response.close()
+    saved = [row['id'] for row in app_module.history_store.iter_all(history_id(client))]
+    assert saved[0] == first['id'] and len(saved) == 2
+    assert app_module.admission_gate.stats()['active'] == 0
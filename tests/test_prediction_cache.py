@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import inference
+from inference import PredictionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(inference.time, 'monotonic', clock)
+    return clock
+
+
+def test_key_is_content_hash():
+    assert PredictionCache.key_for(b'photo') == PredictionCache.key_for(b'photo')
+    assert PredictionCache.key_for(b'photo') != PredictionCache.key_for(b'other photo')
+
+
+def test_get_counts_hits_and_misses():
+    cache = PredictionCache()
+    scores = np.arange(7, dtype=np.float32)
+    assert cache.get('a') is None
+    cache.put('a', scores)
+    assert cache.get('a') is scores
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(ttl_seconds=60)
+    cache.put('a', np.zeros(7, dtype=np.float32))
+    clock.now += 59
+    assert cache.get('a') is not None
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['bytes'] == 0
+
+
+def test_byte_cap_evicts_least_recently_used():
+    row = np.zeros(100, dtype=np.float32)  # 400 bytes
+    cache = PredictionCache(max_bytes=1000)
+    cache.put('a', row)
+    cache.put('b', row.copy())
+    cache.get('a')
+    cache.put('c', row.copy())
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['bytes'] <= 1000
+    assert cache.stats()['evictions'] == 1
+
+
+def test_bytes_values_count_towards_the_cap():
+    cache = PredictionCache(max_bytes=1000)
+    cache.put('png', b'x' * 2000)
+    assert cache.get('png') is None
+    cache.put('png', b'x' * 500)
+    assert cache.stats()['bytes'] == 500 + len('png')
+
+
+def test_entry_cap():
+    cache = PredictionCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, np.zeros(1, dtype=np.float32))
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_zero_entries_disables_cache():
+    cache = PredictionCache(max_entries=0)
+    cache.put('a', np.zeros(1, dtype=np.float32))
+    assert cache.get('a') is None
+
+
+def test_model_change_invalidates():
+    cache = PredictionCache()
+    cache.set_model_version('v1')
+    cache.put('a', np.zeros(7, dtype=np.float32))
+    cache.set_model_version('v1')
+    assert cache.get('a') is not None
+    cache.set_model_version('v2')
+    assert cache.get('a') is None
+    assert cache.stats()['model_version'] == 'v2'
+    assert cache.stats()['bytes'] == 0